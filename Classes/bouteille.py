@@ -1,7 +1,33 @@
+import logging
 from pydantic import BaseModel, Field
 from Classes.connexiondb import Connexdb
-from route.dependencies import effectuer_operation_db
+from route.dependencies import effectuer_operation_db, lectures_concurrentes
+import changements
+from cache import cle_etagere
+from timing import chronometrer
 
+logger = logging.getLogger(__name__)
+
+def calculer_moyenne(notes: list):
+    """
+    Calculates the average of rating documents.
+
+    Parameters
+    ----------
+    notes : list
+        Documents of the "note" collection.
+
+    Returns
+    -------
+    float
+        The average rating, or None if no document has a rating.
+    """
+    valeurs = [note['note'] for note in notes if 'note' in note]  # Ensure 'note' exists
+    if not valeurs:
+        return None
+    return sum(valeurs) / len(valeurs)
+
+@chronometrer
 class Bouteille(BaseModel):
     """
     A class to represent a bottle of wine.
@@ -54,13 +80,13 @@ class Bouteille(BaseModel):
     type: str = Field(default="inconnue")
     annee: int = Field(default=-1)
     region: str = Field(default="Russie")
-    commentaires: list[str] = Field(default=[])
+    commentaires: list[str] = Field(default_factory=list)
     notes: float = Field(default=-1.0)
     moyen: float = Field(default=-1.0)
     photo: bytes = Field(default=b"")
     prix: float = Field(default=-1.0)
     num_etagere: int = Field(default=-1)
-    config_db: dict = Field(default={})
+    config_db: dict = Field(default_factory=dict)
     collections: str = Field(default="bouteille")
     numbers: int = Field(default=1)
 
@@ -86,6 +112,10 @@ class Bouteille(BaseModel):
             "num_etagere": self.num_etagere
         }
 
+    def _journaliser(self, operation: str, details: dict = None) -> None:
+        """Enregistre une modification de la bouteille dans le journal des modifications."""
+        changements.enregistrer_changement(self.config_db, "bouteille", self.nom, operation, details=details)
+
     def archiver(self) -> dict:
         """
         Archives the bottle in the database.
@@ -139,14 +169,15 @@ class Bouteille(BaseModel):
     def get_all_information(self) -> dict:
         """
         Retrieves all information about the bottle, including its details, comments, and ratings.
-        """
-        print(f"Fetching information for bottle: {self.nom}")  # Debug print
-
-        # Fetch the bottle information from the database
-        bottle_query: dict = {"nom": self.nom}
-        bottle_info_result: dict = effectuer_operation_db(self.config_db, "bouteille", "get", query=bottle_query)
 
-        print(f"Bottle info result: {bottle_info_result}")  # Debug print
+        The bottle, its comments and its ratings are read concurrently; the
+        average is computed from the ratings already fetched.
+        """
+        bottle_info_result, comments_result, ratings_result = lectures_concurrentes(
+            lambda: effectuer_operation_db(self.config_db, "bouteille", "get", query={"nom": self.nom}),
+            lambda: effectuer_operation_db(self.config_db, "commentaire", "get", query={"nom_bouteille": self.nom}),
+            lambda: effectuer_operation_db(self.config_db, "note", "get", query={"nom_bouteille": self.nom})
+        )
 
         if bottle_info_result.get("status") != 200 or not bottle_info_result.get("data"):
             return {
@@ -157,37 +188,16 @@ class Bouteille(BaseModel):
 
         # Get the bottle information
         bottle_info = bottle_info_result["data"][0]
-
-        # Fetch all comments associated with the bottle
-        comments_result = effectuer_operation_db(self.config_db, "commentaire", "get", {})
-        tmp_commentaires = []
-
-        # Filter comments based on the bottle name
-        for comment in comments_result.get("data", []):
-            if comment.get("nom_bouteille") == self.nom:
-                tmp_commentaires.append(comment)
+        tmp_commentaires = comments_result.get("data", [])
+        tmp_notes = ratings_result.get("data", [])
 
         bottle_info["commentaires"] = tmp_commentaires
-
-        # Fetch all ratings associated with the bottle
-        ratings_result = effectuer_operation_db(self.config_db, "note", "get", {})
-        tmp_notes = []
-
-        # Filter ratings based on the bottle name
-        for note in ratings_result.get("data", []):
-            if note.get("nom_bouteille") == self.nom:
-                tmp_notes.append(note)
-
         bottle_info["notes"] = tmp_notes
 
-        # Calculate the average rating
-        average_result = self.moyenne()
-        if average_result.get("status") == 200:
-            bottle_info["moyen"] = average_result["average"]
-        else:
-            bottle_info["moyen"] = None  # Handle case where no average could be calculated
+        # Calculate the average rating (None when the bottle has no rating)
+        bottle_info["moyen"] = calculer_moyenne(tmp_notes)
 
-        print(f"Final bottle information: {bottle_info}")  # Debug print
+        logger.debug("Bottle %s: %d comment(s), %d rating(s)", self.nom, len(tmp_commentaires), len(tmp_notes))
 
         return {
             "message": "Bouteille récupérée avec succès !",
@@ -222,18 +232,14 @@ class Bouteille(BaseModel):
                 "status": notes_result.get("status"),
             }
 
-        # Extract the values from the retrieved ratings
-        notes = [note['note'] for note in notes_result['data'] if 'note' in note]  # Ensure 'note' exists
+        average_value = calculer_moyenne(notes_result['data'])
 
-        if not notes:
+        if average_value is None:
             return {
                 "message": "Aucune note trouvée pour cette bouteille.",
                 "status": 404,
             }
 
-        # Calculate the average
-        average_value = sum(notes) / len(notes)
-
         return {
             "message": "Moyenne calculée avec succès.",
             "average": average_value,
@@ -306,6 +312,8 @@ class Bouteille(BaseModel):
                 "status": create_result.get("status"),
             }
 
+        self._journaliser(changements.CREATION)
+
         return {
             "message": "Bouteille créée avec succès.",
             "status": 200,
@@ -366,6 +374,8 @@ class Bouteille(BaseModel):
                 "status": update_result.get("status"),
             }
 
+        self._journaliser(changements.MODIFICATION)
+
         return {
             "message": "Bouteille existante mise à jour avec succès.",
             "status": 200,
@@ -398,6 +408,8 @@ class Bouteille(BaseModel):
                 "status": delete_result.get("status"),
             }
 
+        self._journaliser(changements.SUPPRESSION)
+
         return {
             "message": "Bouteille supprimée avec succès.",
             "status": 200,
@@ -414,7 +426,7 @@ class Bouteille(BaseModel):
         update_query = {"nom": self.nom}
         update_result = connex.update_data_from_collection(self.collections, update_query, data)
 
-        print(update_result)
+        logger.debug("Update of bottle %s: %s", self.nom, update_result.get("status"))
 
         if update_result.get("status") != 200:
             return {
@@ -422,6 +434,10 @@ class Bouteille(BaseModel):
                 "status": update_result.get("status"),
             }
 
+        # The placement of the bottle is published to the live occupancy streams
+        self._journaliser(changements.MODIFICATION,
+                          {champ: data[champ] for champ in ("cave", "num_etagere") if champ in data})
+
         return {
             "message": "Bouteille existante mise à jour avec succès.",
             "status": 200,
@@ -486,7 +502,7 @@ class Bouteille(BaseModel):
         self.num_etagere = num_etagere
 
         # Update the bottle in the database
-        update_result = self.update({"nom": self.nom}, {"cave": self.cave, "num_etagere": self.num_etagere})
+        update_result = self.update({"cave": self.cave, "num_etagere": self.num_etagere})
         if update_result.get("status") != 200:
             return {
                 "message": "Échec de la mise à jour de la bouteille.",
@@ -500,6 +516,12 @@ class Bouteille(BaseModel):
         # Update the cave and etagere in the database
         connex.update_data_from_collection("caves", {"nom": nom_cave}, {"nb_emplacement": cave['nb_emplacement']})
         connex.update_data_from_collection("etagere", {"num": num_etagere}, {"nb_place": etagere['nb_place']})
+        changements.enregistrer_changement(self.config_db, "cave", nom_cave, changements.MODIFICATION,
+                                           details={"nb_emplacement": cave['nb_emplacement']})
+        changements.enregistrer_changement(self.config_db, "etagere", cle_etagere(num_etagere, etagere.get("login")),
+                                           changements.MODIFICATION,
+                                           [etagere["login"]] if etagere.get("login") else None,
+                                           {"cave": nom_cave, "nb_place": etagere['nb_place']})
 
         return {
             "message": "Bouteille déplacée avec succès.",
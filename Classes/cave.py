@@ -1,9 +1,15 @@
 from .etageres import Etagere
+from .vues import EtagereVue, hydrater
 from Classes.bouteille import Bouteille
 from pydantic import BaseModel, Field
 from Classes.connexiondb import Connexdb
+from route.dependencies import lectures_concurrentes
+import changements
+from cache import cle_etagere
+from timing import chronometrer
 
 
+@chronometrer
 class Cave(BaseModel):
     """
     Représente une cave à vin avec des étagères.
@@ -35,7 +41,7 @@ class Cave(BaseModel):
         Crée une nouvelle cave et associe l'utilisateur.
     delete_cave(login_user: str) -> dict
         Supprime la cave de la base de données.
-    get_etageres() -> dict
+    get_etageres(vues: bool = False) -> dict
         Récupère les étagères associées à la cave depuis la base de données.
     update_user_caves(login_user: str, cave_name: str, connex: Connexdb, add: bool) -> dict
         Met à jour l'utilisateur pour l'association de la cave.
@@ -47,8 +53,13 @@ class Cave(BaseModel):
     config_db: dict = Field(default_factory=dict)
     collections: str = Field(default="caves")
 
-    def get_etageres(self) -> dict:
-        """Récupère les étagères associées à la cave depuis la base de données."""
+    def get_etageres(self, vues: bool = False) -> dict:
+        """
+        Récupère les étagères associées à la cave depuis la base de données.
+
+        Avec ``vues``, chaque étagère est une EtagereVue (lecture seule, pour
+        l'affichage) plutôt que le document MongoDB.
+        """
         if not self.config_db:
             return {"message": "Configuration de la base de données requise.", "status": 500}
 
@@ -57,8 +68,6 @@ class Cave(BaseModel):
         # Query to get all etageres related to this cave
         etageres_result = connex.get_data_from_collection("etagere", {"caves": self.nom})
 
-        print("Etageres Result:", etageres_result)  # Debug print
-
         if etageres_result.get("status") != 200:
             return {"message": "Étagères non trouvées.", "status": 404}
 
@@ -67,7 +76,8 @@ class Cave(BaseModel):
         for etagere in etageres_result['data']:
             etageres_data.append({
                 "num_etagere": etagere.get("num"),
-                "data": etagere  # Use the etagere data directly
+                "cle": cle_etagere(etagere.get("num"), etagere.get("login")),  # Clé dans le journal (événements)
+                "data": hydrater(EtagereVue, etagere) if vues else etagere
             })
 
         return {
@@ -142,6 +152,10 @@ class Cave(BaseModel):
                 "status": rstatus.get("status"),
             }
 
+        changements.enregistrer_changement(self.config_db, "cave", self.nom, changements.MODIFICATION,
+                                           details={"nb_emplacement": self.nb_emplacement,
+                                                    "etageres": cave_data["etageres"]})
+
         return {
             "message": "Cave mise à jour avec succès.",
             "status": 200
@@ -153,16 +167,18 @@ class Cave(BaseModel):
             return {"message": "Configuration de la base de données requise.", "status": 500}
 
         connex = Connexdb(**self.config_db)
-        cave_result = connex.get_data_from_collection(self.collections, {"nom": self.nom})
+
+        # The cave and its etageres are read concurrently
+        cave_result, etageres_response = lectures_concurrentes(
+            lambda: connex.get_data_from_collection(self.collections, {"nom": self.nom}),
+            lambda: self.get_etageres(vues=True)
+        )
 
         if cave_result.get("status") != 200 or not cave_result['data']:
             return {"message": "Cave non trouvée.", "status": 404}
 
         # Extract the cave data
         cave_data = cave_result['data'][0]
-        
-        # Get the etageres data
-        etageres_response = self.get_etageres()
 
         # Return the cave data in the desired format
         return {
@@ -194,6 +210,9 @@ class Cave(BaseModel):
         if insert_status.get("status") != 200:
             return {"message": "Échec de la création de la cave.", "status": insert_status.get("status")}
 
+        changements.enregistrer_changement(self.config_db, "cave", self.nom, changements.CREATION, [login_user],
+                                           {"nb_emplacement": self.nb_emplacement, "etageres": []})
+
         # Mise à jour de l'utilisateur
         user_update_status = self.update_user_caves(login_user, self.nom, connex, add=True)
         return {
@@ -215,6 +234,8 @@ class Cave(BaseModel):
         if delete_status.get("status") != 200:
             return {"message": "Échec de la suppression de la cave.", "status": delete_status.get("status")}
 
+        changements.enregistrer_changement(self.config_db, "cave", self.nom, changements.SUPPRESSION, [login_user])
+
         # Update the user's caves list
         user_update_status = self.update_user_caves(login_user, self.nom, connex, add=False)
         
@@ -246,6 +267,8 @@ class Cave(BaseModel):
             caves.remove(cave_name)
 
         update_status = connex.update_data_from_collection("user", {"login": login_user}, {"caves": caves})
+        if update_status.get("status") == 200:
+            changements.enregistrer_changement(self.config_db, "user", login_user, changements.MODIFICATION, [login_user])
 
         return {
             "message": "Mise à jour réussie." if update_status.get("status") == 200
@@ -1,5 +1,97 @@
-from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import pymongo
+from pymongo import MongoClient, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, PyMongoError
+
+# Callbacks notified after every database operation, with the signature
+# listener(collection, operation, query, duration, error, details)
+operation_listeners: list = []
+
+# Absolute deadline (time.monotonic()) of the current request, None if unbounded
+request_deadline: ContextVar = ContextVar("request_deadline", default=None)
+
+# Client session of the transaction in progress, None outside a transaction
+request_session: ContextVar = ContextVar("request_session", default=None)
+
+# Callbacks waiting for the transaction in progress to commit, None outside a transaction
+_after_commit: ContextVar = ContextVar("after_commit", default=None)
+
+def after_commit(callback) -> None:
+    """
+    Runs a side effect of a write once the write is durable.
+
+    Outside a transaction the callback runs immediately. Inside one, it runs
+    after the commit and is dropped if the transaction aborts, so that caches
+    are not purged and listeners not notified for writes that never happened.
+
+    Parameters
+    ----------
+    callback : Callable[[], None]
+        The side effect (cache purge, notification...).
+    """
+    callbacks = _after_commit.get()
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a database operation cannot complete before the request deadline.
+
+    Unlike PyMongoError, it is not turned into a status dictionary by Connexdb:
+    it propagates up to the application, which answers 503.
+    """
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool events of the shared MongoDB clients.
+
+    Attributes
+    ----------
+    counters : dict
+        Event counters (connections created, closed, checked out, checked in...).
+    """
+
+    def __init__(self):
+        self.counters: dict = {
+            "created": 0,
+            "closed": 0,
+            "checked_out": 0,
+            "checked_in": 0,
+            "checkout_failed": 0,
+        }
+
+    def stats(self) -> dict:
+        """Returns the counters, plus the number of connections currently in use."""
+        return {**self.counters, "in_use": self.counters["checked_out"] - self.counters["checked_in"]}
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+    def connection_created(self, event):
+        self.counters["created"] += 1
+
+    def connection_closed(self, event):
+        self.counters["closed"] += 1
+
+    def connection_check_out_failed(self, event):
+        self.counters["checkout_failed"] += 1
+
+    def connection_checked_out(self, event):
+        self.counters["checked_out"] += 1
+
+    def connection_checked_in(self, event):
+        self.counters["checked_in"] += 1
+
+pool_stats: PoolStats = PoolStats()
 
 class Connexdb:
     """
@@ -16,28 +108,53 @@ class Connexdb:
     password : str
         The password to connect to MongoDB.
     client : MongoClient
-        The MongoDB client instance.
+        The MongoDB client instance, shared by every Connexdb using the same server.
     db : Database
         The MongoDB database instance.
+    session : ClientSession
+        The session of the transaction in progress in this context, or None.
 
     Methods
     -------
     get_all_collection_name() -> dict
         Fetches all collection names from the database.
-    get_all_data_from_collection(collection: str) -> dict
+    get_all_data_from_collection(collection: str, projection: dict) -> dict
         Fetches all data from a specified collection.
+    get_data_from_collection(collection: str, query: dict, projection: dict) -> dict
+        Fetches data from a specified collection based on a query.
     delete_data_from_collection(collection: str, query: dict) -> dict
         Deletes data from a specified collection based on a query.
     update_data_from_collection(collection: str, query: dict, new_data: dict) -> dict
         Updates data in a specified collection based on a query.
     insert_data_into_collection(collection: str, data: dict) -> dict
         Inserts data into a specified collection.
+    insert_many_into_collection(collection: str, data: list, ordered: bool, ignore_duplicates: bool) -> dict
+        Inserts several documents into a specified collection with a single bulk write.
+    bulk_update_in_collection(collection: str, updates: list) -> dict
+        Applies several single-document updates with one bulk write.
+    delete_many_from_collection(collection: str, query: dict) -> dict
+        Deletes every document of a collection matching a query.
+    update_many_in_collection(collection: str, query: dict, update) -> dict
+        Applies an update document or pipeline to every matching document.
+    find_one_and_update_in_collection(collection: str, query: dict, update: dict) -> dict
+        Atomically updates one document and returns it.
+    aggregate_collection(collection: str, pipeline: list) -> dict
+        Runs an aggregation pipeline on a collection.
+    get_versions_from_collection(collection: str, query: dict, fields: tuple) -> dict
+        Fetches only the version fields (_rev, maj_le) of the matching documents.
+    transaction() -> ClientSession
+        Context manager running the operations of its block in one transaction.
     exist(collection: str, query: dict) -> dict
         Checks if a document exists in a specified collection based on a query.
     close() -> dict
-        Closes the MongoDB connection.
+        Releases the MongoDB connection.
+    close_all() -> dict
+        Closes every shared MongoDB client.
     """
 
+    _clients: dict = {}
+    _clients_lock = threading.Lock()
+
     def __init__(self, host='localhost', port=27018, username=None, password=None):
         """
         Initializes the Connexdb class with the provided MongoDB server details.
@@ -53,13 +170,71 @@ class Connexdb:
         password : str, optional
             The password to connect to MongoDB (default is None).
         """
-        if username and password:
-            self.client = MongoClient(f"mongodb://{username}:{password}@{host}:{port}/")
-        else:
-            self.client = MongoClient(host=host, port=port)
-
+        # One MongoClient (and therefore one connection pool) per server
+        key = (host, port, username, password)
+        with Connexdb._clients_lock:
+            client = Connexdb._clients.get(key)
+            if client is None:
+                if username and password:
+                    client = MongoClient(f"mongodb://{username}:{password}@{host}:{port}/", event_listeners=[pool_stats])
+                else:
+                    client = MongoClient(host=host, port=port, event_listeners=[pool_stats])
+                Connexdb._clients[key] = client
+
+        self.client = client
         self.db = self.client.caveavin
 
+    @contextmanager
+    def _measure(self, collection: str, operation: str, query: dict = None, details: dict = None):
+        """
+        Times a database operation and notifies the operation listeners.
+
+        When the current request has a deadline, the operation runs under
+        pymongo.timeout() with the remaining time, and a timeout raises
+        DeadlineExceeded.
+
+        Parameters
+        ----------
+        collection : str
+            The name of the collection the operation targets.
+        operation : str
+            The name of the operation ("find", "insert_one"...).
+        query : dict, optional
+            The filter of the operation.
+        details : dict, optional
+            The other parts of the query shape ("sort", "projection", "pipeline"),
+            passed to the listeners.
+        """
+        error = None
+        deadline = request_deadline.get()
+        start = time.perf_counter()
+        try:
+            if deadline is None:
+                yield
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"No time left for {operation} on '{collection}'")
+                # Sets maxTimeMS and the socket timeout of every command from the remaining time
+                with pymongo.timeout(remaining):
+                    yield
+        except PyMongoError as e:
+            error = e
+            if deadline is not None and e.timeout:
+                error = DeadlineExceeded(f"{operation} on '{collection}' exceeded the request deadline")
+                raise error from e
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            for listener in operation_listeners:
+                try:
+                    listener(collection, operation, query, duration, error, details)
+                except Exception:
+                    pass
+
     def get_all_collection_name(self) -> dict:
         """
         Fetches all collection names from the database.
@@ -70,12 +245,13 @@ class Connexdb:
             A dictionary with status, message, and data (collection names).
         """
         try:
-            collections = self.db.list_collection_names()
+            with self._measure("*", "list_collections"):
+                collections = self.db.list_collection_names(session=self.session)
             return {"status": 200, "message": "Successfully fetched collections", "data": collections}
         except PyMongoError as e:
             return {"status": 500, "message": f"Error fetching collection names: {e}"}
 
-    def get_all_data_from_collection(self, collection: str) -> dict:
+    def get_all_data_from_collection(self, collection: str, projection: dict = None) -> dict:
         """
         Fetches all data from a specified collection.
 
@@ -83,6 +259,8 @@ class Connexdb:
         ----------
         collection : str
             The name of the collection to fetch data from.
+        projection : dict, optional
+            The fields to return (default is None, the whole documents).
 
         Returns
         -------
@@ -90,12 +268,13 @@ class Connexdb:
             A dictionary with status, message, and data (documents from the collection).
         """
         try:
-            data = list(self.db[collection].find())
+            with self._measure(collection, "find", {}, {"projection": projection}):
+                data = list(self.db[collection].find({}, projection, session=self.session))
             return {"status": 200, "message": "Successfully fetched data", "data": data}
         except PyMongoError as e:
             return {"status": 500, "message": f"Error fetching data from collection '{collection}': {e}", "data": []}
 
-    def get_data_from_collection(self, collection: str, query: dict) -> dict:
+    def get_data_from_collection(self, collection: str, query: dict, projection: dict = None) -> dict:
         """
         Fetches data from a specified collection based on a query.
 
@@ -105,6 +284,9 @@ class Connexdb:
             The name of the collection to fetch data from.
         query : dict
             The query to filter the documents.
+        projection : dict, optional
+            The fields to return (default is None, the whole documents). Large
+            fields left out (bottle photos...) are never sent by the server.
 
         Returns
         -------
@@ -112,7 +294,8 @@ class Connexdb:
             A dictionary with status, message, and data (matching documents from the collection).
         """
         try:
-            data = list(self.db[collection].find(query))
+            with self._measure(collection, "find", query, {"projection": projection}):
+                data = list(self.db[collection].find(query, projection, session=self.session))
             return {"status": 200, "message": "Successfully fetched data", "data": data}
         except PyMongoError as e:
             return {"status": 500, "message": f"Error fetching data from collection '{collection}': {e}", "data": []}
@@ -134,7 +317,8 @@ class Connexdb:
             A dictionary with status and message.
         """
         try:
-            self.db[collection].delete_one(query)
+            with self._measure(collection, "delete_one", query):
+                self.db[collection].delete_one(query, session=self.session)
             return {"status": 200, "message": "Successfully deleted data"}
         except PyMongoError as e:
             return {"status": 500, "message": f"Error deleting data from collection '{collection}': {e}"}
@@ -144,12 +328,15 @@ class Connexdb:
     def update_data_from_collection(self, collection_name: str, query: dict, data: dict) -> dict:
         try:
             collection = self.db[collection_name]
-            result = collection.update_one(query, {"$set": data})
+            with self._measure(collection_name, "update_one", query):
+                result = collection.update_one(query, {"$set": data}, session=self.session)
             
             if result.modified_count == 0:
                 return {"status": 404, "message": "No document found to update"}
             
             return {"status": 200, "message": "Document updated successfully"}
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             return {"status": 500, "message": f"Error updating document: {str(e)}"}
 
@@ -170,13 +357,230 @@ class Connexdb:
             A dictionary with status and message.
         """
         try:
-            self.db[collection].insert_one(data)
+            with self._measure(collection, "insert_one"):
+                self.db[collection].insert_one(data, session=self.session)
             return {"status": 200, "message": "Successfully inserted data"}
         except PyMongoError as e:
             return {"status": 500, "message": f"Error inserting data into collection '{collection}': {e}"}
         except TypeError as e:
             return {"status": 501, "message": f"Type Error: {e}"}
 
+    def insert_many_into_collection(self, collection: str, data: list, ordered: bool = False,
+                                    ignore_duplicates: bool = False) -> dict:
+        """
+        Inserts several documents into a specified collection with a single bulk write.
+
+        Parameters
+        ----------
+        collection : str
+            The name of the collection to insert data into.
+        data : list
+            The documents to insert.
+        ordered : bool, optional
+            Whether to stop at the first failed insert (default is False).
+        ignore_duplicates : bool, optional
+            Whether documents whose _id already exists count as a success
+            (default is False), to replay inserts idempotently.
+
+        Returns
+        -------
+        dict
+            A dictionary with status, message, the number of inserted documents
+            and the indexes of the documents skipped as duplicates.
+        """
+        if not data:
+            return {"status": 200, "message": "Nothing to insert", "inserted": 0, "duplicates": []}
+        try:
+            with self._measure(collection, "insert_many"):
+                result = self.db[collection].insert_many(data, ordered=ordered, session=self.session)
+            return {"status": 200, "message": "Successfully inserted data", "inserted": len(result.inserted_ids),
+                    "duplicates": []}
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if ignore_duplicates and not ordered and all(error.get("code") == 11000 for error in errors):
+                return {"status": 200, "message": "Successfully inserted data, duplicates skipped",
+                        "inserted": e.details.get("nInserted", 0), "duplicates": [error["index"] for error in errors]}
+            return {"status": 500, "message": f"Error inserting data into collection '{collection}': {e}",
+                    "inserted": e.details.get("nInserted", 0), "duplicates": []}
+        except PyMongoError as e:
+            return {"status": 500, "message": f"Error inserting data into collection '{collection}': {e}",
+                    "inserted": 0, "duplicates": []}
+        except TypeError as e:
+            return {"status": 501, "message": f"Type Error: {e}", "inserted": 0, "duplicates": []}
+
+    def bulk_update_in_collection(self, collection: str, updates: list) -> dict:
+        """
+        Applies several single-document updates with one bulk write.
+
+        Parameters
+        ----------
+        collection : str
+            The name of the collection to update.
+        updates : list
+            The (query, update) pairs; each update is an update document with
+            operators or an aggregation pipeline.
+
+        Returns
+        -------
+        dict
+            A dictionary with status, message and the number of modified documents.
+        """
+        if not updates:
+            return {"status": 200, "message": "Nothing to update", "modified": 0}
+        try:
+            with self._measure(collection, "bulk_write"):
+                result = self.db[collection].bulk_write([UpdateOne(query, update) for query, update in updates],
+                                                        ordered=False, session=self.session)
+            return {"status": 200, "message": "Documents updated successfully", "modified": result.modified_count}
+        except PyMongoError as e:
+            return {"status": 500, "message": f"Error updating documents of collection '{collection}': {e}", "modified": 0}
+        except TypeError as e:
+            return {"status": 501, "message": f"Type Error: {e}", "modified": 0}
+
+    def delete_many_from_collection(self, collection: str, query: dict) -> dict:
+        """
+        Deletes every document of a collection matching a query.
+
+        Parameters
+        ----------
+        collection : str
+            The name of the collection to delete data from.
+        query : dict
+            The query to match the documents to delete.
+
+        Returns
+        -------
+        dict
+            A dictionary with status, message and the number of deleted documents.
+        """
+        try:
+            with self._measure(collection, "delete_many", query):
+                result = self.db[collection].delete_many(query, session=self.session)
+            return {"status": 200, "message": "Successfully deleted data", "deleted": result.deleted_count}
+        except PyMongoError as e:
+            return {"status": 500, "message": f"Error deleting data from collection '{collection}': {e}", "deleted": 0}
+        except TypeError as e:
+            return {"status": 501, "message": f"Type Error: {e}", "deleted": 0}
+
+    def update_many_in_collection(self, collection: str, query: dict, update) -> dict:
+        """
+        Applies an update to every document of a collection matching a query.
+
+        Unlike update_data_from_collection, the update is passed as is: it is
+        an update document with operators ($set, $inc, $pull...) or an
+        aggregation pipeline.
+
+        Parameters
+        ----------
+        collection : str
+            The name of the collection to update.
+        query : dict
+            The query to match the documents to update.
+        update : dict or list
+            The update document or pipeline.
+
+        Returns
+        -------
+        dict
+            A dictionary with status, message and the number of modified documents.
+        """
+        try:
+            with self._measure(collection, "update_many", query):
+                result = self.db[collection].update_many(query, update, session=self.session)
+            return {"status": 200, "message": "Documents updated successfully", "modified": result.modified_count}
+        except PyMongoError as e:
+            return {"status": 500, "message": f"Error updating documents of collection '{collection}': {e}", "modified": 0}
+        except TypeError as e:
+            return {"status": 501, "message": f"Type Error: {e}", "modified": 0}
+
+    def find_one_and_update_in_collection(self, collection: str, query: dict, update: dict,
+                                          sort: list = None, upsert: bool = False) -> dict:
+        """
+        Atomically updates one document and returns it as it is after the update.
+
+        Parameters
+        ----------
+        collection : str
+            The name of the collection.
+        query : dict
+            The query to match the document.
+        update : dict
+            The update document, with operators.
+        sort : list, optional
+            The (field, direction) pairs deciding which document is updated when several match.
+        upsert : bool, optional
+            Whether to insert the document if none matches (default is False).
+
+        Returns
+        -------
+        dict
+            A dictionary with status, message and data (the updated document, or None).
+        """
+        try:
+            with self._measure(collection, "find_one_and_update", query, {"sort": sort}):
+                document = self.db[collection].find_one_and_update(
+                    query, update, sort=sort, upsert=upsert, return_document=ReturnDocument.AFTER, session=self.session
+                )
+            return {"status": 200, "message": "Document updated successfully", "data": document}
+        except PyMongoError as e:
+            return {"status": 500, "message": f"Error updating document of collection '{collection}': {e}", "data": None}
+        except TypeError as e:
+            return {"status": 501, "message": f"Type Error: {e}", "data": None}
+
+    def aggregate_collection(self, collection: str, pipeline: list) -> dict:
+        """
+        Runs an aggregation pipeline on a collection.
+
+        Parameters
+        ----------
+        collection : str
+            The name of the collection.
+        pipeline : list
+            The aggregation stages.
+
+        Returns
+        -------
+        dict
+            A dictionary with status, message, and data (the resulting documents).
+        """
+        try:
+            with self._measure(collection, "aggregate", pipeline[0] if pipeline else {}, {"pipeline": pipeline}):
+                data = list(self.db[collection].aggregate(pipeline, session=self.session))
+            return {"status": 200, "message": "Successfully aggregated data", "data": data}
+        except PyMongoError as e:
+            return {"status": 500, "message": f"Error aggregating collection '{collection}': {e}", "data": []}
+
+    def get_versions_from_collection(self, collection: str, query: dict, fields: tuple = ()) -> dict:
+        """
+        Fetches only the version fields of the documents matching a query.
+
+        The documents carry a revision counter (_rev) and the date of their
+        last change (maj_le), updated by every model mutation. Reading them
+        alone is much cheaper than reading the documents (bottle photos...),
+        and enough to tell whether a page built from them has changed.
+
+        Parameters
+        ----------
+        collection : str
+            The name of the collection.
+        query : dict
+            The query to filter the documents.
+        fields : tuple, optional
+            Other small fields to fetch with the versions (default is none).
+
+        Returns
+        -------
+        dict
+            A dictionary with status, message and data (documents with _id, _rev, maj_le and fields only).
+        """
+        projection: dict = {"_rev": 1, "maj_le": 1, **{field: 1 for field in fields}}
+        try:
+            with self._measure(collection, "find", query, {"projection": projection}):
+                data = list(self.db[collection].find(query, projection, session=self.session))
+            return {"status": 200, "message": "Successfully fetched versions", "data": data}
+        except PyMongoError as e:
+            return {"status": 500, "message": f"Error fetching versions from collection '{collection}': {e}", "data": []}
+
     def exist(self, collection: str, query: dict) -> dict:
         """
         Checks if a document exists in a specified collection based on a query.
@@ -194,26 +598,96 @@ class Connexdb:
             A dictionary with status and message.
         """
         try:
-            exists = self.db[collection].find_one(query) is not None
+            with self._measure(collection, "find_one", query):
+                exists = self.db[collection].find_one(query, session=self.session) is not None
             return {"status": 200, "message": "Data exists" if exists else "User does not exist"}
         except PyMongoError as e:
             return {"status": 500, "message": f"Error checking existence in collection '{collection}': {e}"}
         except TypeError as e:
             return {"status": 501, "message": f"Type Error: {e}"}
 
+    @property
+    def session(self):
+        return request_session.get()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs every operation of the block, in this context, in one transaction.
+
+        Every Connexdb of the context (models included) uses the session
+        through request_session. The transaction commits when the block ends
+        normally and aborts when it raises; the after_commit callbacks run
+        only after the commit. Transactions need a replica set or a mongos.
+
+        Yields
+        ------
+        ClientSession
+            The session of the transaction.
+        """
+        if request_session.get() is not None:
+            # Nested block: part of the transaction already in progress
+            yield request_session.get()
+            return
+
+        callbacks: list = []
+        with self.client.start_session() as session:
+            session_token = request_session.set(session)
+            callbacks_token = _after_commit.set(callbacks)
+            try:
+                with session.start_transaction():
+                    yield session
+            finally:
+                _after_commit.reset(callbacks_token)
+                request_session.reset(session_token)
+        for callback in callbacks:
+            callback()
+
     def close(self) -> dict:
         """
-        Closes the MongoDB connection.
+        Releases the MongoDB connection.
+
+        The underlying client is shared with the other Connexdb instances and
+        stays open; use close_all() to shut the pools down.
 
         Returns
         -------
         dict
             A dictionary with status and message.
         """
-        if self.client:
-            self.client.close()
+        if self.client is not None:
+            self.client = None
+            self.db = None
             return {"status": 200, "message": "Connection closed successfully"}
 
+    @classmethod
+    def close_all(cls) -> dict:
+        """
+        Closes every shared MongoDB client.
+
+        Returns
+        -------
+        dict
+            A dictionary with status and message.
+        """
+        with cls._clients_lock:
+            for client in cls._clients.values():
+                client.close()
+            cls._clients.clear()
+        return {"status": 200, "message": "All connections closed successfully"}
+
+    @classmethod
+    def pool_statistics(cls) -> dict:
+        """
+        Returns the connection pool statistics of the shared clients.
+
+        Returns
+        -------
+        dict
+            The number of shared clients and the connection pool counters.
+        """
+        return {"clients": len(cls._clients), **pool_stats.stats()}
+
 if __name__ == '__main__':
     db_connection = Connexdb(
         host='localhost',
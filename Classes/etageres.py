@@ -1,7 +1,11 @@
 from pydantic import BaseModel, Field
 from .connexiondb import Connexdb
+import changements
+from cache import cle_etagere
+from timing import chronometrer
 
 
+@chronometrer
 class Etagere(BaseModel):
     """
     Classe représentant une étagère pour stocker des bouteilles.
@@ -29,8 +33,8 @@ class Etagere(BaseModel):
     num: int = Field(default=-1)
     nb_place: int = Field(default=0)
     nb_bouteille: int = Field(default=0)
-    bouteilles: list[str] = Field(default=[])  # List of bottle names
-    config_db: dict = Field(default={})
+    bouteilles: list[str] = Field(default_factory=list)  # List of bottle names
+    config_db: dict = Field(default_factory=dict)
     collections: str = Field(default="etagere")
     cave: str = Field(default="")
     login: str = Field(default="")  # New attribute for user login
@@ -191,6 +195,8 @@ class Etagere(BaseModel):
                 "status": rstatus.get("status"),
             }
 
+        self._journaliser(changements.SUPPRESSION)
+
         return {
             "message": "L'étagère a été supprimée avec succès.",
             "status": 200
@@ -229,6 +235,8 @@ class Etagere(BaseModel):
                 "status": rstatus.get("status"),
             }
 
+        self._journaliser(changements.CREATION)
+
         return rstatus
 
     def update_etageres(self) -> dict:
@@ -269,8 +277,17 @@ class Etagere(BaseModel):
                 "status": rstatus.get("status"),
             }
 
+        self._journaliser(changements.MODIFICATION)
+
         return rstatus
 
+    def _journaliser(self, operation: str) -> None:
+        """Enregistre une modification de l'étagère dans le journal des modifications."""
+        changements.enregistrer_changement(
+            self.config_db, "etagere", cle_etagere(self.num, self.login), operation, [self.login] if self.login else None,
+            {"cave": self.cave, "nb_place": self.nb_place, "nb_bouteille": self.nb_bouteille}
+        )
+
     def get_etageres(self) -> dict:
         """
         Récupère les étagères de la base de données.
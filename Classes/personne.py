@@ -1,10 +1,20 @@
+import logging
 from pydantic import BaseModel, EmailStr, Field
 from Classes.connexiondb import Connexdb
+from Classes.vues import BouteilleVue, CaveVue, hydrater
+import identifiants
+from route.dependencies import lectures_concurrentes
+import changements
+from cache import cle_etagere
+from timing import chronometrer
 from typing import Optional, List, Dict, Any
 from bson import ObjectId
 
+logger = logging.getLogger(__name__)
 
 
+
+@chronometrer
 class Personne(BaseModel):
     """
     A class to represent a person with authentication functionality.
@@ -18,7 +28,7 @@ class Personne(BaseModel):
     login : Optional[str]
         The login username of the person.
     password : Optional[str]
-        The password of the person.
+        The password of the person (in clear when provided, stored as a scrypt hash).
     nom : Optional[str]
         The last name of the person.
     prenom : Optional[str]
@@ -78,7 +88,7 @@ class Personne(BaseModel):
             "id": self.id,
             "perm": self.perm,
             "login": self.login,
-            "password": self.password,
+            "password": self.password if identifiants.est_empreinte(self.password) else identifiants.hacher(self.password),
             "nom": self.nom,
             "prenom": self.prenom,
             "email": self.email,
@@ -102,6 +112,8 @@ class Personne(BaseModel):
                 "status": rstatus.get("status")
             }
 
+        self._journaliser(changements.CREATION)
+
         return rstatus
 
     def update(self, data: dict) -> dict:
@@ -114,7 +126,11 @@ class Personne(BaseModel):
 
         query: dict = {"login": self.login}
         connex: Connexdb = Connexdb(**self.config_db)
-        
+
+        # Never store a password in clear
+        if data.get("password") and not identifiants.est_empreinte(data["password"]):
+            data = {**data, "password": identifiants.hacher(data["password"])}
+
         # Check if we're updating the caves field
         if "caves" in data:
             # Use $addToSet to add the cave if it doesn't exist
@@ -129,6 +145,8 @@ class Personne(BaseModel):
                 "status": rstatus.get("status")
             }
 
+        self._journaliser(changements.MODIFICATION)
+
         return rstatus
 
     def update_user_info(self) -> dict:
@@ -147,10 +165,23 @@ class Personne(BaseModel):
         if rstatus.get("status") != 200:
             return rstatus
 
+        self._journaliser(changements.MODIFICATION)
+
         return rstatus
 
+    def _journaliser(self, operation: str) -> None:
+        """Records a change of the user in the change log (see changements.py)."""
+        changements.enregistrer_changement(self.config_db, "user", self.login, operation, [self.login])
+
     def delete(self) -> dict:
-        """Deletes the user from the database."""
+        """
+        Deletes the user and everything that belongs to them.
+
+        The caves and shelves of the user, their ratings and comments, and the
+        reserved bottles no other user reserves are deleted first; the user
+        document is deleted last, so that a failed deletion can be retried.
+        This touches many documents: routes run it as a background job (see taches.py).
+        """
         if not self.config_db:
             return {
                 "message": "Please provide the MongoDB database configuration.",
@@ -159,6 +190,67 @@ class Personne(BaseModel):
 
         connex: Connexdb = Connexdb(**self.config_db)
         query: dict = {"login": self.login}
+        user_result: dict = connex.get_data_from_collection(self.collections, query)
+        if user_result.get("status") != 200:
+            return {
+                "message": "Failed to delete the user!",
+                "status": user_result.get("status")
+            }
+        if not user_result.get("data"):
+            return {
+                "message": "User not found",
+                "status": 404
+            }
+
+        user_data: dict = user_result.get("data")[0]
+        user_caves: list = user_data.get("caves", [])
+        reserved_bottles: list = list(dict.fromkeys(user_data.get("bouteille_reserver", [])))
+
+        # Bottles also reserved by another user are kept
+        orphan_bottles: list = []
+        if reserved_bottles:
+            others = connex.get_data_from_collection(
+                self.collections, {"bouteille_reserver": {"$in": reserved_bottles}, "login": {"$ne": self.login}}
+            )
+            if others.get("status") != 200:
+                return {
+                    "message": "Failed to delete the bottles of the user!",
+                    "status": others.get("status")
+                }
+            shared = {nom for other in others.get("data", []) for nom in other.get("bouteille_reserver", [])}
+            orphan_bottles = [nom for nom in reserved_bottles if nom not in shared]
+
+        # The shelf keys are needed to record their deletion in the change log
+        shelves = connex.get_data_from_collection("etagere", {"login": self.login})
+        if shelves.get("status") != 200:
+            return {
+                "message": "Failed to delete the shelves of the user!",
+                "status": shelves.get("status")
+            }
+        shelf_keys: list = [cle_etagere(shelf.get("num"), self.login) for shelf in shelves.get("data", [])]
+
+        cascade: list = [
+            ("etagere", {"login": self.login}),
+            ("caves", {"nom": {"$in": user_caves}} if user_caves else None),
+            ("note", {"auteur": self.login}),
+            ("commentaire", {"auteur": self.login}),
+            ("bouteille", {"nom": {"$in": orphan_bottles}} if orphan_bottles else None),
+        ]
+        deleted: dict = {}
+        for collection, cascade_query in cascade:
+            if cascade_query is None:
+                continue
+            rstatus: dict = connex.delete_many_from_collection(collection, cascade_query)
+            if rstatus.get("status") != 200:
+                return {
+                    "message": f"Failed to delete the documents of the user in '{collection}'!",
+                    "status": rstatus.get("status")
+                }
+            deleted[collection] = rstatus.get("deleted", 0)
+
+        for entite, cles in (("etagere", shelf_keys), ("cave", user_caves), ("bouteille", orphan_bottles)):
+            changements.enregistrer_changements(self.config_db, entite, cles, changements.SUPPRESSION, [self.login])
+
         rstatus: dict = connex.delete_data_from_collection(self.collections, query)
         if rstatus.get("status") != 200:
             return {
@@ -166,10 +258,13 @@ class Personne(BaseModel):
                 "status": rstatus.get("status")
             }
 
-        # supprimer les bouteilles qu'utilisateur à aussi A FAIRE
+        self._journaliser(changements.SUPPRESSION)
 
-        rstatus: dict = connex.delete_data_from_collection(self.collections, query)
-        return rstatus
+        return {
+            "message": "User deleted",
+            "status": 200,
+            "deleted": deleted
+        }
 
     def get(self) -> dict:
         """Retrieves the user from the database."""
@@ -197,7 +292,15 @@ class Personne(BaseModel):
         }
 
     def auth(self) -> Dict[str, Any]:
-        """Authenticates the person with the provided login and password."""
+        """
+        Authenticates the person with the provided login and password.
+
+        The user is fetched by login and the password is verified against the
+        stored hash. A password stored in clear (legacy accounts) or hashed with
+        older cost parameters is rehashed transparently on a successful login.
+        Hashing is CPU-bound: async callers should go through
+        ``identifiants.executer``.
+        """
         # Check if the database configuration is provided
         if not self.config_db:
             return {
@@ -208,14 +311,8 @@ class Personne(BaseModel):
         # Create a database connection
         connex = Connexdb(**self.config_db)
 
-        # Prepare the query to search for the user
-        query_search: dict = {
-            "login": self.login,
-            "password": self.password
-        }
-
         # Execute the query to fetch user data
-        rstatus: dict = connex.get_data_from_collection(self.collections, query_search)
+        rstatus: dict = connex.get_data_from_collection(self.collections, {"login": self.login})
 
         # Check if any user was found
         if not rstatus.get("data"):
@@ -224,11 +321,28 @@ class Personne(BaseModel):
                 "status": 404
             }
 
+        user_data: dict = rstatus.get("data")[0]
+        valide, a_recalculer = identifiants.verifier(self.password, user_data.get("password"))
+        if not valide:
+            return {
+                "message": "Identifiant ou mot de passe invalide",
+                "status": 401
+            }
+
+        if a_recalculer:
+            empreinte: str = identifiants.hacher(self.password)
+            rehash: dict = connex.update_data_from_collection(self.collections, {"login": self.login},
+                                                              {"password": empreinte})
+            if rehash.get("status") == 200:
+                user_data["password"] = empreinte
+            else:
+                logger.warning("Rehash of the password of %s failed: %s", self.login, rehash.get("message"))
+
         # Return success message and user data if found
         return {
             "message": "L'utilisateur a été authentifié avec succès !",
             "status": 200,
-            "user_data": rstatus.get("data")[0]
+            "user_data": user_data
         }
 
     def get_bottles(self) -> dict:
@@ -245,8 +359,6 @@ class Personne(BaseModel):
         # Fetch user data by login
         user_data_result = connex.get_data_from_collection(self.collections, {"login": self.login})
 
-        print(user_data_result)
-
         if user_data_result.get("status") != 200 or not user_data_result.get("data"):
             return {
                 "status": 401,
@@ -265,23 +377,10 @@ class Personne(BaseModel):
                 "data": [] # arret de cette fonction avec un tableau vide
             }
 
-        # Consolidate bottle information
-        bottles = {}
-        for bottle_name in reserved_bottles:
-            bottle_info = connex.get_data_from_collection("bouteille", {"nom": bottle_name})
-
-            if bottle_info.get("status") == 200 and bottle_info.get("data"):
-                bottle_data = bottle_info["data"][0]
-                if bottle_name in bottles:
-                    bottles[bottle_name]["number"] += 1
-                else:
-                    bottle_data["number"] = 1
-                    bottles[bottle_name] = bottle_data
-
         return {
             "status": 200,
             "message": "Toutes les bouteilles ont été récupérées",
-            "data": bottles
+            "data": self._bouteilles_reservees(connex, reserved_bottles)
         }
 
     def get_caves(self) -> dict:
@@ -311,19 +410,83 @@ class Personne(BaseModel):
                 "data": {}
             }
 
-        # Fetch cave information for each cave associated with the user
-        caves = {}
-        for cave_name in user_caves:
-            cave_info = connex.get_data_from_collection("caves", {"nom": cave_name})
-            if cave_info.get("status") == 200 and cave_info.get("data"):
-                caves[cave_name] = cave_info["data"][0]
-
         return {
             "status": 200,
             "message": "Toutes les caves ont été récupérées",
-            "data": caves
+            "data": self._caves(connex, user_caves)
+        }
+
+    def get_collection(self) -> dict:
+        """
+        Retrieves the reserved bottles and the caves of the user.
+
+        The user document is read once, then the bottles and the caves are
+        fetched concurrently, each with a single query.
+
+        Returns
+        -------
+        dict
+            A dictionary containing the status, the bottles (same format as
+            get_bottles) and the caves (same format as get_caves).
+        """
+        connex: Connexdb = Connexdb(**self.config_db)
+
+        user_data_result = connex.get_data_from_collection(self.collections, {"login": self.login})
+
+        if user_data_result.get("status") != 200 or not user_data_result.get("data"):
+            return {
+                "status": 401,
+                "message": "Identifiant ou mot de passe invalide",
+                "bouteilles": [],
+                "caves": {}
+            }
+
+        user_data = user_data_result.get("data")[0]
+        reserved_bottles = user_data.get("bouteille_reserver", [])
+        user_caves = user_data.get("caves", [])
+
+        bouteilles, caves = lectures_concurrentes(
+            lambda: self._bouteilles_reservees(connex, reserved_bottles) if reserved_bottles else [],
+            lambda: self._caves(connex, user_caves) if user_caves else {}
+        )
+
+        return {
+            "status": 200,
+            "message": "La collection a été récupérée",
+            "bouteilles": bouteilles,
+            "caves": caves
         }
 
+    @staticmethod
+    def _bouteilles_reservees(connex: Connexdb, reserved_bottles: list) -> dict:
+        """
+        Fetches the reserved bottles with one query, keyed by name, with their number of reservations.
+
+        The bottles are returned as read-only views (BouteilleVue), built without validation.
+        """
+        bottle_info = connex.get_data_from_collection("bouteille", {"nom": {"$in": list(set(reserved_bottles))}})
+        par_nom: dict = {}
+        for bottle_data in bottle_info.get("data", []):
+            par_nom.setdefault(bottle_data["nom"], bottle_data)
+
+        # Consolidate bottle information, in reservation order
+        bottles = {}
+        for bottle_name in reserved_bottles:
+            if bottle_name in bottles:
+                bottles[bottle_name].number += 1
+            elif bottle_name in par_nom:
+                bottles[bottle_name] = hydrater(BouteilleVue, par_nom[bottle_name])
+        return bottles
+
+    @staticmethod
+    def _caves(connex: Connexdb, user_caves: list) -> dict:
+        """Fetches the user's caves with one query, keyed by name, in the user's order, as read-only views."""
+        cave_info = connex.get_data_from_collection("caves", {"nom": {"$in": list(user_caves)}})
+        par_nom: dict = {}
+        for cave_data in cave_info.get("data", []):
+            par_nom.setdefault(cave_data["nom"], cave_data)
+        return {cave_name: hydrater(CaveVue, par_nom[cave_name]) for cave_name in user_caves if cave_name in par_nom}
+
     def add_bottle(self, bottle_name: str) -> dict:
         """
         Adds a bottle to the user's bouteille_reserver list.
@@ -370,7 +533,7 @@ class Personne(BaseModel):
             {"bouteille_reserver": current_bottles}
         )
 
-        print(update_result)
+        logger.debug("Bottle %s added for %s: %s", bottle_name, self.login, update_result.get("status"))
 
         if update_result.get("status") != 200:
             return {
@@ -378,6 +541,8 @@ class Personne(BaseModel):
                 "message": update_result.get("message")
             }
 
+        self._journaliser(changements.MODIFICATION)
+
         return {
             "status": 200,
             "message": "Bottle added successfully to user's collection"
@@ -0,0 +1,84 @@
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from functools import cache
+from typing import Any, Optional
+
+# Les modèles Pydantic (Bouteille, Cave, Etagere, Personne) valident les
+# données saisies ; les vues ci-dessous servent aux pages de liste et de
+# détail. Elles sont construites depuis les documents MongoDB sans validation
+# ni copie : les valeurs du document sont reprises telles quelles, et seuls
+# les champs affichés sont gardés. Les templates y accèdent comme à un
+# dictionnaire (``bouteille.nom``) et orjson les encode directement.
+
+# Attributs des vues lus dans un autre champ du document (orjson n'encode pas
+# les attributs préfixés par « _ », ce qui convient à ``_rev``) ; la cave d'une
+# étagère est enregistrée dans le champ ``caves``
+ALIAS: dict = {"id": "_id", "cave": "caves"}
+
+@dataclass(slots=True)
+class BouteilleVue:
+    """Bouteille affichée dans la collection de l'utilisateur."""
+    id: Any = None
+    nom: str = "bouteille"
+    type: str = "inconnue"
+    annee: int = -1
+    region: str = "Russie"
+    prix: float = -1.0
+    moyen: Optional[float] = -1.0
+    notes_nombre: int = 0
+    num_etagere: int = -1
+    cave: Optional[str] = None
+    photo: bytes = b""
+    numbers: int = 1
+    number: int = 1  # Nombre de réservations de la bouteille par l'utilisateur
+    _rev: Optional[int] = None
+    maj_le: Optional[datetime] = None
+
+@dataclass(slots=True)
+class CaveVue:
+    """Cave affichée dans la collection de l'utilisateur."""
+    id: Any = None
+    nom: str = "caveX"
+    nb_emplacement: int = 0
+    etageres: list = field(default_factory=list)  # Numéros des étagères
+    _rev: Optional[int] = None
+    maj_le: Optional[datetime] = None
+
+@dataclass(slots=True)
+class EtagereVue:
+    """Étagère affichée dans la liste des étagères et sur la page d'une cave."""
+    id: Any = None
+    num: int = -1
+    nb_place: int = 0
+    nb_bouteille: int = 0
+    cave: Optional[str] = None  # Nom de la cave de l'étagère
+    login: str = ""
+    _rev: Optional[int] = None
+    maj_le: Optional[datetime] = None
+
+@cache
+def _sources(vue: type) -> tuple:
+    """Retourne, pour une classe de vue, les couples (attribut, champ du document)."""
+    return tuple((champ.name, ALIAS.get(champ.name, champ.name)) for champ in fields(vue))
+
+def hydrater(vue: type, document: dict):
+    """
+    Construit une vue depuis un document MongoDB, sans validation.
+
+    Parameters
+    ----------
+    vue : type
+        La classe de vue (BouteilleVue, CaveVue ou EtagereVue).
+    document : dict
+        Le document lu dans MongoDB ; il n'est ni copié ni modifié.
+
+    Returns
+    -------
+    Any
+        La vue ; les champs absents du document gardent leur valeur par défaut.
+    """
+    return vue(**{attribut: document[source] for attribut, source in _sources(vue) if source in document})
+
+def hydrater_tous(vue: type, documents: list) -> list:
+    """Construit une vue pour chaque document, dans l'ordre."""
+    return [hydrater(vue, document) for document in documents]
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from Classes.connexiondb import request_deadline
+from metrics import registre
+
+#########################
+##### Configuration #####
+#########################
+
+config_admission: dict = {
+    "actif": True,
+    "classes": {
+        # limite : requêtes traitées simultanément ; file_max : requêtes en attente ;
+        # attente_max : temps d'attente (s) au-delà duquel la requête est rejetée
+        "lourd": {"limite": 8, "file_max": 32, "attente_max": 2.0},
+        "leger": {"limite": 64, "file_max": 256, "attente_max": 1.0},
+    },
+    "routes_lourdes": (  # Préfixes des pages composites ou coûteuses pour MongoDB
+        "/user/collection",
+        "/bottle/search",
+        "/bottle/archive",
+        "/cave/get/",
+        "/etagere/gets/",
+        "/api/batch",
+    ),
+    "exemptees": ("/metrics", "/static", "/cave/live/", "/etagere/live"),  # Préfixes jamais mis en attente (flux SSE compris)
+    "retry_after": 2,  # Valeur de l'en-tête Retry-After des réponses 503, en secondes
+}
+
+logger = logging.getLogger(__name__)
+
+admission_file = registre.jauge(
+    "caveavin_admission_queue_depth",
+    "Nombre de requêtes en attente d'admission, par classe de route.",
+    ("classe",)
+)
+admission_en_cours = registre.jauge(
+    "caveavin_admission_in_flight",
+    "Nombre de requêtes admises en cours de traitement, par classe de route.",
+    ("classe",)
+)
+admission_rejets = registre.compteur(
+    "caveavin_admission_rejected_total",
+    "Nombre de requêtes rejetées (503) par classe de route et raison.",
+    ("classe", "raison")
+)
+admission_attente = registre.histogramme(
+    "caveavin_admission_wait_seconds",
+    "Temps passé en file d'attente par les requêtes admises.",
+    ("classe",)
+)
+
+class Rejet(Exception):
+    """Levée quand une requête n'est pas admise ; ``raison`` vaut "file_pleine" ou "attente"."""
+
+    def __init__(self, raison: str):
+        super().__init__(raison)
+        self.raison = raison
+
+class Limiteur:
+    """
+    Limite de concurrence d'une classe de routes, avec une file d'attente bornée.
+
+    Les requêtes en attente sont servies dans l'ordre d'arrivée ; une requête
+    qui attend plus de ``attente_max`` (ou au-delà de son échéance) est rejetée,
+    plutôt que d'être servie après que le client a abandonné.
+
+    Attributes
+    ----------
+    en_cours : int
+        Le nombre de requêtes admises en cours de traitement.
+    file : deque
+        Les futures des requêtes en attente.
+    """
+
+    def __init__(self, classe: str, limite: int, file_max: int, attente_max: float):
+        self.classe = classe
+        self.limite = limite
+        self.file_max = file_max
+        self.attente_max = attente_max
+        self.en_cours: int = 0
+        self.file: deque = deque()
+
+    async def acquerir(self) -> float:
+        """
+        Attend une place libre et retourne le temps d'attente.
+
+        Raises
+        ------
+        Rejet
+            Si la file est pleine ou si l'attente dépasse le temps autorisé.
+        """
+        if self.en_cours < self.limite and not self.file:
+            self.en_cours += 1
+            return 0.0
+        if len(self.file) >= self.file_max:
+            raise Rejet("file_pleine")
+
+        attente_max = self.attente_max
+        echeance = request_deadline.get()
+        if echeance is not None:
+            attente_max = min(attente_max, echeance - time.monotonic())
+
+        future = asyncio.get_running_loop().create_future()
+        self.file.append(future)
+        start = time.perf_counter()
+        try:
+            # La place est transmise directement par liberer() : en_cours est déjà compté
+            await asyncio.wait_for(asyncio.shield(future), timeout=max(attente_max, 0))
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                self.liberer()  # La place a été transmise au moment de l'expiration
+            else:
+                future.cancel()
+            raise Rejet("attente")
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.liberer()
+            else:
+                future.cancel()
+            raise
+        finally:
+            if future in self.file:
+                self.file.remove(future)
+        return time.perf_counter() - start
+
+    def liberer(self) -> None:
+        """Libère une place, en la transmettant à la première requête encore en attente."""
+        while self.file:
+            future = self.file.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.en_cours -= 1
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI de contrôle d'admission et de délestage.
+
+    Chaque requête est rattachée à une classe de routes (pages lourdes ou
+    légères) dont la concurrence est limitée. Au-delà, elle attend dans une
+    file bornée ; si la file est pleine ou si l'attente est trop longue, elle
+    reçoit immédiatement une réponse 503 avec ``Retry-After``. Quand MongoDB
+    ralentit, la mémoire et la latence restent ainsi bornées au lieu de laisser
+    les requêtes s'accumuler dans uvicorn.
+    """
+
+    def __init__(self, app, **options):
+        self.app = app
+        self.config: dict = {**config_admission, **options}
+        self.limiteurs: dict = {
+            classe: Limiteur(classe, **parametres) for classe, parametres in self.config["classes"].items()
+        }
+
+    def classe(self, path: str) -> str:
+        """Retourne la classe de routes d'un chemin."""
+        return "lourd" if path.startswith(self.config["routes_lourdes"]) else "leger"
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not self.config["actif"]
+                or scope["path"].startswith(self.config["exemptees"])):
+            await self.app(scope, receive, send)
+            return
+
+        classe = self.classe(scope["path"])
+        limiteur: Limiteur = self.limiteurs[classe]
+
+        admission_file.inc(classe)
+        try:
+            attente = await limiteur.acquerir()
+        except Rejet as rejet:
+            admission_rejets.inc(classe, rejet.raison)
+            logger.warning("Requête %s %s rejetée (%s)", scope["method"], scope["path"], rejet.raison)
+            await self.rejeter(send)
+            return
+        finally:
+            admission_file.dec(classe)
+
+        admission_attente.observer(classe, valeur=attente)
+        admission_en_cours.inc(classe)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_en_cours.dec(classe)
+            limiteur.liberer()
+
+    async def rejeter(self, send) -> None:
+        """Envoie une réponse 503 minimale, sans passer par l'application."""
+        corps = "Service surchargé, réessayez dans quelques secondes.".encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(corps)).encode("latin-1")),
+                (b"retry-after", str(self.config["retry_after"]).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": corps})
@@ -0,0 +1,293 @@
+"""
+Benchmark HTTP de bout en bout de tous les routeurs.
+
+L'application de ``main.py`` est démarrée dans le processus (sans serveur,
+via ``httpx.ASGITransport``) contre une base MongoDB locale alimentée avec des
+données préfixées ``bench_``. Des utilisateurs virtuels se connectent puis
+enchaînent des scénarios réalistes ; le débit et les latences p50/p95/p99 par
+scénario sont écrits dans un fichier JSON comparable d'un commit à l'autre.
+
+Exemples ::
+
+    python -m bench.charge_http --concurrence 16 --duree 30 --sortie avant.json
+    python -m bench.charge_http --concurrence 16 --duree 30 --comparer avant.json --seuil 0.1
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+import httpx
+from route.dependencies import config_db
+from Classes.connexiondb import Connexdb
+from identifiants import hacher
+
+PREFIXE: str = "bench_"
+
+#############################
+##### Jeu de données    #####
+#############################
+
+def nettoyer(connex: Connexdb) -> None:
+    """Supprime les documents créés par le benchmark."""
+    motif = {"$regex": f"^{PREFIXE}"}
+    connex.db["user"].delete_many({"login": motif})
+    connex.db["bouteille"].delete_many({"nom": motif})
+    connex.db["caves"].delete_many({"nom": motif})
+    connex.db["etagere"].delete_many({"login": motif})
+    connex.db["note"].delete_many({"nom_bouteille": motif})
+    connex.db["commentaire"].delete_many({"nom_bouteille": motif})
+    connex.db["archive"].delete_many({"nom": motif})
+
+def alimenter(connex: Connexdb, utilisateurs: int, bouteilles: int, graine: int) -> dict:
+    """
+    Alimente la base avec un jeu de données de benchmark reproductible.
+
+    Parameters
+    ----------
+    connex : Connexdb
+        La connexion à la base de données.
+    utilisateurs : int
+        Le nombre d'utilisateurs à créer.
+    bouteilles : int
+        Le nombre de bouteilles à créer.
+    graine : int
+        La graine du générateur aléatoire.
+
+    Returns
+    -------
+    dict
+        Les identifiants créés (logins, noms de bouteilles et de caves).
+    """
+    rng = random.Random(graine)
+    nettoyer(connex)
+
+    noms_bouteilles = [f"{PREFIXE}bouteille_{i}" for i in range(bouteilles)]
+    connex.db["bouteille"].insert_many([{
+        "nom": nom,
+        "type": rng.choice(["Rouge", "Blanc", "Rosé", "Champagne"]),
+        "annee": rng.randint(1990, 2023),
+        "region": rng.choice(["Bordeaux", "Bourgogne", "Alsace", "Loire", "Rhône"]),
+        "commentaires": [],
+        "notes": -1.0,
+        "moyen": -1.0,
+        "photo": b"",
+        "prix": round(rng.uniform(5, 300), 2),
+        "num_etagere": -1,
+        "numbers": 1,
+    } for nom in noms_bouteilles])
+
+    logins, caves, etageres, notes, commentaires = [], [], [], [], []
+    # Une seule empreinte pour tous les utilisateurs : la connexion mesure la vérification, pas un rehash
+    empreinte = hacher("bench")
+    for u in range(utilisateurs):
+        login = f"{PREFIXE}user_{u}"
+        nom_cave = f"{PREFIXE}cave_{u}"
+        nums = [900000 + u * 10 + e for e in range(3)]
+        logins.append(login)
+        caves.append({"nom": nom_cave, "nb_emplacement": 60, "etageres": nums})
+        etageres.extend({
+            "num": num, "nb_place": 20, "nb_bouteille": 0, "bouteilles": [],
+            "caves": nom_cave, "login": login
+        } for num in nums)
+        reservees = rng.sample(noms_bouteilles, min(len(noms_bouteilles), 20))
+        connex.db["user"].insert_one({
+            "id": u, "perm": "user", "login": login, "password": empreinte,
+            "nom": "Bench", "prenom": f"Utilisateur{u}", "email": f"{login}@bench.local",
+            "bouteille_reserver": reservees, "caves": [nom_cave],
+        })
+        for nom in rng.sample(reservees, min(len(reservees), 5)):
+            notes.append({"auteur": login, "note": rng.randint(1, 5), "nom_bouteille": nom})
+            commentaires.append({"auteur": login, "comment": "Très bon.", "nom_bouteille": nom, "date": "2024-01-01"})
+
+    connex.db["caves"].insert_many(caves)
+    connex.db["etagere"].insert_many(etageres)
+    if notes:
+        connex.db["note"].insert_many(notes)
+        connex.db["commentaire"].insert_many(commentaires)
+
+    return {"logins": logins, "bouteilles": noms_bouteilles, "caves": [cave["nom"] for cave in caves]}
+
+#####################
+##### Scénarios #####
+#####################
+
+async def connexion(client, login, donnees, rng):
+    return await client.post("/user/auth", data={"login": login, "password": "bench"})
+
+async def collection(client, login, donnees, rng):
+    return await client.get("/user/collection")
+
+async def detail_bouteille(client, login, donnees, rng):
+    return await client.get(f"/bottle/{rng.choice(donnees['bouteilles'])}")
+
+async def recherche(client, login, donnees, rng):
+    return await client.post("/bottle/search", data={"filtre": f"bouteille_{rng.randint(0, 99)}"})
+
+async def detail_cave(client, login, donnees, rng):
+    return await client.get(f"/cave/get/{PREFIXE}cave_{login.rsplit('_', 1)[1]}")
+
+async def etageres(client, login, donnees, rng):
+    return await client.get("/etagere/gets/")
+
+async def ajout_etagere(client, login, donnees, rng):
+    return await client.post("/cave/add-etagere", json={
+        "nom_cave": f"{PREFIXE}cave_{login.rsplit('_', 1)[1]}",
+        "num_etagere": rng.randint(950000, 999999),
+        "nb_place": 10,
+    })
+
+async def commentaire_et_note(client, login, donnees, rng):
+    return await client.post("/bottle/commentandpair", data={
+        "comment": "Bench", "rating": rng.randint(1, 5), "nom_bouteille": rng.choice(donnees["bouteilles"])
+    })
+
+async def archivage(client, login, donnees, rng):
+    nom = f"{PREFIXE}archive_{rng.getrandbits(48)}"
+    await client.post("/bottle/add", data={"nom": nom, "type": "Rouge", "annee": 2020, "region": "Loire", "prix": 10})
+    return await client.get(f"/bottle/archive/{nom}")
+
+# Scénarios et poids relatifs dans le mélange de trafic
+SCENARIOS: dict = {
+    collection: 25,
+    detail_bouteille: 30,
+    recherche: 15,
+    detail_cave: 10,
+    etageres: 10,
+    ajout_etagere: 3,
+    commentaire_et_note: 5,
+    archivage: 2,
+}
+
+####################
+##### Exécution ####
+####################
+
+async def utilisateur_virtuel(app, login: str, donnees: dict, fin: float, graine: int, mesures: dict) -> None:
+    """Se connecte puis exécute des scénarios tirés au hasard jusqu'à l'instant ``fin``."""
+    rng = random.Random(graine)
+    scenarios, poids = list(SCENARIOS), list(SCENARIOS.values())
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", follow_redirects=False) as client:
+        scenario = connexion
+        while time.perf_counter() < fin:
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, login, donnees, rng)
+                erreur = response.status_code >= 500
+            except Exception:
+                erreur = True
+            mesures[scenario.__name__].append((time.perf_counter() - start, erreur))
+            scenario = rng.choices(scenarios, poids)[0]
+
+def resumer(mesures: dict, duree: float) -> dict:
+    """Calcule le débit et les percentiles de latence (en millisecondes) par scénario."""
+    resultats = {}
+    toutes = [(d, e) for echantillons in mesures.values() for d, e in echantillons]
+    for nom, echantillons in sorted({**mesures, "total": toutes}.items()):
+        durees = sorted(d * 1000 for d, _ in echantillons)
+        if not durees:
+            continue
+        centiles = statistics.quantiles(durees, n=100, method="inclusive") if len(durees) > 1 else durees * 99
+        resultats[nom] = {
+            "requetes": len(durees),
+            "erreurs": sum(1 for _, e in echantillons if e),
+            "debit": round(len(durees) / duree, 2),
+            "moyenne_ms": round(statistics.fmean(durees), 2),
+            "p50_ms": round(centiles[49], 2),
+            "p95_ms": round(centiles[94], 2),
+            "p99_ms": round(centiles[98], 2),
+        }
+    return resultats
+
+async def executer(concurrence: int, duree: float, donnees: dict, graine: int) -> dict:
+    """Démarre l'application dans le processus et lance ``concurrence`` utilisateurs virtuels."""
+    from main import app
+
+    mesures: dict = defaultdict(list)
+    async with app.router.lifespan_context(app):
+        debut = time.perf_counter()
+        fin = debut + duree
+        await asyncio.gather(*(
+            utilisateur_virtuel(app, donnees["logins"][i % len(donnees["logins"])], donnees, fin, graine + i, mesures)
+            for i in range(concurrence)
+        ))
+        ecoule = time.perf_counter() - debut
+    return resumer(mesures, ecoule)
+
+def comparer(actuel: dict, reference: dict, seuil: float) -> list:
+    """
+    Compare deux résultats et retourne les régressions au-delà du seuil relatif.
+
+    Une régression est une hausse du p95 ou du p99, ou une baisse du débit,
+    supérieure à ``seuil`` (0.1 = 10 %).
+    """
+    regressions = []
+    for nom, res in actuel["resultats"].items():
+        ref = reference["resultats"].get(nom)
+        if ref is None:
+            continue
+        for cle in ("p95_ms", "p99_ms"):
+            if ref[cle] > 0 and res[cle] > ref[cle] * (1 + seuil):
+                regressions.append(f"{nom} {cle} : {ref[cle]} -> {res[cle]}")
+        if ref["debit"] > 0 and res["debit"] < ref["debit"] * (1 - seuil):
+            regressions.append(f"{nom} débit : {ref['debit']} -> {res['debit']}")
+    return regressions
+
+def commit_courant() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+def main(argv: list = None) -> int:
+    """Point d'entrée en ligne de commande du benchmark."""
+    parser = argparse.ArgumentParser(description="Benchmark HTTP de bout en bout de caveavin.")
+    parser.add_argument("--concurrence", type=int, default=8, help="Nombre d'utilisateurs virtuels simultanés")
+    parser.add_argument("--duree", type=float, default=20.0, help="Durée de la mesure, en secondes")
+    parser.add_argument("--utilisateurs", type=int, default=50)
+    parser.add_argument("--bouteilles", type=int, default=500)
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--sortie", default="bench_resultats.json")
+    parser.add_argument("--comparer", help="Résultats de référence à comparer")
+    parser.add_argument("--seuil", type=float, default=0.10, help="Régression relative tolérée")
+    parser.add_argument("--garder-donnees", action="store_true", help="Ne pas supprimer les données à la fin")
+    args = parser.parse_args(argv)
+
+    connex = Connexdb(**config_db)
+    donnees = alimenter(connex, args.utilisateurs, args.bouteilles, args.graine)
+    try:
+        resultats = asyncio.run(executer(args.concurrence, args.duree, donnees, args.graine))
+    finally:
+        if not args.garder_donnees:
+            nettoyer(connex)
+
+    sortie = {
+        "commit": commit_courant(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "parametres": vars(args),
+        "resultats": resultats,
+    }
+    with open(args.sortie, "w", encoding="utf-8") as fichier:
+        json.dump(sortie, fichier, indent=2, ensure_ascii=False)
+
+    for nom, res in resultats.items():
+        print(f"{nom:<22} {res['requetes']:>7} req {res['debit']:>8.1f} req/s "
+              f"p50={res['p50_ms']:>8.2f} p95={res['p95_ms']:>8.2f} p99={res['p99_ms']:>8.2f} ms "
+              f"erreurs={res['erreurs']}")
+
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as fichier:
+            regressions = comparer(sortie, json.load(fichier), args.seuil)
+        for regression in regressions:
+            print(f"RÉGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
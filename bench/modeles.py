@@ -0,0 +1,418 @@
+"""
+Micro-benchmarks des méthodes de la couche modèle, sans MongoDB.
+
+Les modèles (``Bouteille``, ``Cave``, ``Etagere``, ``Personne``) et
+``route.dependencies`` sont branchés sur ``ConnexdbMemoire`` : le vrai code de
+``Connexdb`` s'exécute, mais sur une base en mémoire déterministe. Chaque
+méthode est mesurée en temps par appel, en opérations MongoDB par appel (via
+``operation_listeners``) et en allocations (``tracemalloc``). Les résultats
+sont comparables d'un commit à l'autre, comme ceux de ``bench.charge_http``.
+
+Exemples ::
+
+    python -m bench.modeles --sortie modeles_avant.json
+    python -m bench.modeles --comparer modeles_avant.json --seuil 0.15
+"""
+import argparse
+import copy
+import importlib
+import json
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from bson import ObjectId
+from route.dependencies import config_db
+from Classes.connexiondb import Connexdb, operation_listeners
+from Classes import Bouteille, Cave, Etagere, Personne
+from outils.generer_donnees import Generateur
+from bench.charge_http import commit_courant
+
+# Modules qui importent le nom ``Connexdb`` et sont redirigés vers la base en mémoire
+MODULES_CONNEXDB: list = [
+    "route.dependencies",
+    "Classes.bouteille",
+    "Classes.cave",
+    "Classes.etageres",
+    "Classes.personne",
+    "changements",
+]
+
+##############################
+##### Base en mémoire    #####
+##############################
+
+class ResultatEcriture:
+    """Résultat d'une écriture, avec les attributs lus par ``Connexdb``."""
+
+    def __init__(self, matched_count: int = 0, modified_count: int = 0, inserted_ids: list = None,
+                 deleted_count: int = 0):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.inserted_ids = inserted_ids or []
+        self.deleted_count = deleted_count
+
+def correspond(document: dict, query: dict) -> bool:
+    """
+    Indique si un document correspond à un filtre MongoDB.
+
+    Seuls l'égalité (y compris l'appartenance à un tableau), ``$eq``, ``$ne``,
+    ``$in`` et ``$regex`` sont pris en charge : ce sont les seuls utilisés par
+    l'application.
+    """
+    for champ, attendu in query.items():
+        valeur = document.get(champ)
+        if isinstance(attendu, dict) and attendu and all(str(cle).startswith("$") for cle in attendu):
+            for operateur, operande in attendu.items():
+                if operateur == "$eq" and not _egal(valeur, operande):
+                    return False
+                elif operateur == "$ne" and _egal(valeur, operande):
+                    return False
+                elif operateur == "$in" and not any(_egal(valeur, v) for v in operande):
+                    return False
+                elif operateur == "$regex" and not (isinstance(valeur, str) and re.search(operande, valeur)):
+                    return False
+                elif operateur not in ("$eq", "$ne", "$in", "$regex"):
+                    raise NotImplementedError(f"Opérateur de requête non pris en charge : {operateur}")
+        elif not _egal(valeur, attendu):
+            return False
+    return True
+
+def _egal(valeur, attendu) -> bool:
+    if isinstance(valeur, list) and not isinstance(attendu, list):
+        return attendu in valeur
+    return valeur == attendu
+
+def _modifier(doc: dict, update: dict) -> bool:
+    """Applique une mise à jour (``$set``, ``$inc``, ``$push``, ``$addToSet``) et indique si le document a changé."""
+    avant = copy.deepcopy(doc)
+    for operateur, champs in update.items():
+        for champ, valeur in champs.items():
+            if operateur == "$set":
+                doc[champ] = copy.deepcopy(valeur)
+            elif operateur == "$inc":
+                doc[champ] = doc.get(champ, 0) + valeur
+            elif operateur in ("$push", "$addToSet"):
+                liste = doc.setdefault(champ, [])
+                if operateur == "$push" or valeur not in liste:
+                    liste.append(copy.deepcopy(valeur))
+            else:
+                raise NotImplementedError(f"Opérateur de mise à jour non pris en charge : {operateur}")
+    return doc != avant
+
+class CollectionMemoire:
+    """Collection en mémoire exposant le sous-ensemble de l'API pymongo utilisé par ``Connexdb``."""
+
+    def __init__(self, base: "BaseMemoire"):
+        self.base = base
+        self.documents: list = []
+
+    def _insertion(self, document: dict):
+        # Comme pymongo, l'_id est ajouté au document passé en argument
+        if "_id" not in document:
+            document["_id"] = self.base.nouvel_id()
+        self.documents.append(copy.deepcopy(document))
+        return document["_id"]
+
+    def find_one(self, query: dict = None, session=None):
+        for doc in self.documents:
+            if correspond(doc, query or {}):
+                return copy.deepcopy(doc)
+        return None
+
+    def insert_one(self, document: dict, session=None) -> ResultatEcriture:
+        return ResultatEcriture(inserted_ids=[self._insertion(document)])
+
+    def insert_many(self, documents: list, ordered: bool = True, session=None) -> ResultatEcriture:
+        return ResultatEcriture(inserted_ids=[self._insertion(document) for document in documents])
+
+    def find(self, query: dict = None, projection: dict = None, session=None):
+        documents = [copy.deepcopy(doc) for doc in self.documents if correspond(doc, query or {})]
+        if projection:
+            documents = [{champ: doc[champ] for champ in ("_id", *projection) if champ in doc} for doc in documents]
+        return documents
+
+    def update_one(self, query: dict, update: dict, session=None) -> ResultatEcriture:
+        for doc in self.documents:
+            if correspond(doc, query):
+                return ResultatEcriture(matched_count=1, modified_count=int(_modifier(doc, update)))
+        return ResultatEcriture()
+
+    def update_many(self, query: dict, update: dict, session=None) -> ResultatEcriture:
+        modifies = [_modifier(doc, update) for doc in self.documents if correspond(doc, query)]
+        return ResultatEcriture(matched_count=len(modifies), modified_count=sum(modifies))
+
+    def find_one_and_update(self, query: dict, update: dict, sort: list = None, upsert: bool = False,
+                            return_document=None, session=None):
+        # Seul le document mis à jour est retourné (ReturnDocument.AFTER), comme l'utilise Connexdb
+        if not self.update_one(query, update).matched_count:
+            if not upsert:
+                return None
+            self._insertion({champ: valeur for champ, valeur in query.items() if not str(champ).startswith("$")})
+            self.update_one(query, update)
+        return self.find_one(query)
+
+    def delete_one(self, query: dict, session=None) -> ResultatEcriture:
+        for index, doc in enumerate(self.documents):
+            if correspond(doc, query):
+                del self.documents[index]
+                return ResultatEcriture(matched_count=1, deleted_count=1)
+        return ResultatEcriture()
+
+    def delete_many(self, query: dict, session=None) -> ResultatEcriture:
+        avant = len(self.documents)
+        self.documents = [doc for doc in self.documents if not correspond(doc, query)]
+        return ResultatEcriture(matched_count=avant - len(self.documents), deleted_count=avant - len(self.documents))
+
+class BaseMemoire:
+    """
+    Base de données en mémoire, déterministe.
+
+    Les ``_id`` sont des ObjectId tirés d'un compteur : deux exécutions
+    produisent exactement les mêmes documents.
+    """
+
+    def __init__(self):
+        self.collections: dict = {}
+        self._compteur_id: int = 0
+
+    def nouvel_id(self) -> ObjectId:
+        self._compteur_id += 1
+        return ObjectId(f"{self._compteur_id:024x}")
+
+    def __getitem__(self, nom: str) -> CollectionMemoire:
+        if nom not in self.collections:
+            self.collections[nom] = CollectionMemoire(self)
+        return self.collections[nom]
+
+    def list_collection_names(self, session=None) -> list:
+        return list(self.collections)
+
+base_courante: BaseMemoire = BaseMemoire()
+
+class ConnexdbMemoire(Connexdb):
+    """``Connexdb`` branché sur la base en mémoire courante au lieu d'un serveur MongoDB."""
+
+    def __init__(self, host='localhost', port=27018, username=None, password=None):
+        self.client = base_courante
+        self.db = base_courante
+
+@contextmanager
+def base_memoire(base: BaseMemoire):
+    """Redirige les modèles vers une base en mémoire le temps du bloc."""
+    global base_courante
+    precedente, base_courante = base_courante, base
+    modules = [importlib.import_module(nom) for nom in MODULES_CONNEXDB]
+    originaux = [module.Connexdb for module in modules]
+    for module in modules:
+        module.Connexdb = ConnexdbMemoire
+    try:
+        yield base
+    finally:
+        for module, original in zip(modules, originaux):
+            module.Connexdb = original
+        base_courante = precedente
+
+def jeu_de_donnees(graine: int) -> BaseMemoire:
+    """Construit la base de référence des benchmarks avec le générateur de données."""
+    base = BaseMemoire()
+    generateur = Generateur(graine, "gen_", bouteilles=200, exposant_zipf=1.1)
+    base["bouteille"].insert_many(list(generateur.bouteilles(taille_photo=0)))
+    for collection, document in generateur.utilisateurs_caves_etageres(20, 2, 5, 24, reservations=50):
+        base[collection].insert_one(document)
+    base["note"].insert_many(list(generateur.notes(2000, 20)))
+    base["commentaire"].insert_many(list(generateur.commentaires(2000, 20)))
+    # Un utilisateur de référence avec des bouteilles réservées connues
+    base["user"].update_one({"login": "gen_user_0"}, {"$set": {"bouteille_reserver": generateur.noms_bouteilles[:20]}})
+    return base
+
+##########################
+##### Benchmarks     #####
+##########################
+
+# Chaque benchmark est une fonction ``preparer(i) -> appel`` : la préparation
+# (hors mesure) retourne la fonction sans argument dont on mesure l'appel.
+
+def bouteille_create(i):
+    bouteille = Bouteille(nom=f"bench_bouteille_{i}", type="Rouge", annee=2020, region="Loire", prix=12.0, config_db=config_db)
+    return bouteille.create
+
+def bouteille_get_all_information(i):
+    return Bouteille(nom="gen_bouteille_0", config_db=config_db).get_all_information
+
+def bouteille_moyenne(i):
+    return Bouteille(nom="gen_bouteille_0", config_db=config_db).moyenne
+
+def bouteille_archiver(i):
+    bouteille = Bouteille(nom=f"bench_archive_{i}", type="Blanc", annee=2018, region="Alsace", prix=9.0, config_db=config_db)
+    bouteille.create_bouteille()
+    return bouteille.archiver
+
+def cave_get_cave(i):
+    return Cave(nom="gen_cave_0_0", config_db=config_db).get_cave
+
+def cave_add_etagere(i):
+    cave = Cave(nom="gen_cave_0_0", config_db=config_db)
+    etagere = Etagere(num=500000 + i, nb_place=10, cave=cave.nom, login="gen_user_0", config_db=config_db)
+    return lambda: cave.add_etagere(etagere)
+
+def etagere_ajouter(i):
+    etagere = Etagere(num=0, nb_place=10 ** 6, cave="gen_cave_0_0", login="gen_user_0", config_db=config_db, bouteilles=[])
+    return lambda: etagere.ajouter("gen_bouteille_1")
+
+def etagere_sortir(i):
+    etagere = Etagere(num=0, nb_place=10, cave="gen_cave_0_0", login="gen_user_0", config_db=config_db,
+                      bouteilles=["gen_bouteille_1"], nb_bouteille=1)
+    return lambda: etagere.sortir("gen_bouteille_1")
+
+def personne_get_bottles(i):
+    return Personne(login="gen_user_0", config_db=config_db).get_bottles
+
+def personne_auth(i):
+    return Personne(login="gen_user_0", password="caveavin", config_db=config_db).auth
+
+BENCHMARKS: dict = {
+    "Bouteille.create": bouteille_create,
+    "Bouteille.get_all_information": bouteille_get_all_information,
+    "Bouteille.moyenne": bouteille_moyenne,
+    "Bouteille.archiver": bouteille_archiver,
+    "Cave.get_cave": cave_get_cave,
+    "Cave.add_etagere": cave_add_etagere,
+    "Etagere.ajouter": etagere_ajouter,
+    "Etagere.sortir": etagere_sortir,
+    "Personne.get_bottles": personne_get_bottles,
+    "Personne.auth": personne_auth,
+}
+
+####################
+##### Exécution ####
+####################
+
+class CompteurOperations:
+    """Compte les opérations Connexdb (listener de ``operation_listeners``) pendant les appels mesurés."""
+
+    def __init__(self):
+        self.total: int = 0
+        self.actif: bool = False
+
+    def __call__(self, collection: str, operation: str, query, duree: float, erreur, details: dict = None) -> None:
+        if self.actif:
+            self.total += 1
+
+def mesurer_benchmark(preparer, reference: BaseMemoire, iterations: int, echauffement: int) -> dict:
+    """
+    Mesure une méthode sur une copie de la base de référence.
+
+    Les temps sont pris sans ``tracemalloc`` ; les allocations sont relevées
+    dans une seconde passe, sur une nouvelle copie de la base. Les opérations
+    des préparations (création préalable d'une bouteille...) ne sont pas comptées.
+
+    Returns
+    -------
+    dict
+        Temps médian et moyen par appel (µs), opérations MongoDB par appel,
+        octets alloués au pic et conservés par appel.
+    """
+    compteur = CompteurOperations()
+    durees = []
+    with base_memoire(copy.deepcopy(reference)):
+        for i in range(echauffement):
+            preparer(-1 - i)()
+        operation_listeners.append(compteur)
+        try:
+            for i in range(iterations):
+                appel = preparer(i)
+                compteur.actif = True
+                start = time.perf_counter_ns()
+                appel()
+                durees.append(time.perf_counter_ns() - start)
+                compteur.actif = False
+        finally:
+            operation_listeners.remove(compteur)
+
+    pics, nets = [], []
+    with base_memoire(copy.deepcopy(reference)):
+        tracemalloc.start()
+        try:
+            for i in range(min(iterations, 50)):
+                appel = preparer(i)
+                tracemalloc.reset_peak()
+                avant, _ = tracemalloc.get_traced_memory()
+                appel()
+                apres, pic = tracemalloc.get_traced_memory()
+                pics.append(pic - avant)
+                nets.append(apres - avant)
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "median_us": round(statistics.median(durees) / 1000, 2),
+        "moyenne_us": round(statistics.fmean(durees) / 1000, 2),
+        "operations_par_appel": round(compteur.total / iterations, 2),
+        "alloc_pic_octets": int(statistics.median(pics)),
+        "alloc_net_octets": int(statistics.median(nets)),
+    }
+
+def comparer(actuel: dict, reference: dict, seuil: float) -> list:
+    """
+    Compare deux résultats et retourne les régressions.
+
+    Le nombre d'opérations MongoDB étant déterministe, toute hausse est une
+    régression ; le temps médian et les allocations au pic tolèrent ``seuil``.
+    """
+    regressions = []
+    for nom, res in actuel["resultats"].items():
+        ref = reference["resultats"].get(nom)
+        if ref is None:
+            continue
+        if res["operations_par_appel"] > ref["operations_par_appel"]:
+            regressions.append(f"{nom} opérations : {ref['operations_par_appel']} -> {res['operations_par_appel']}")
+        for cle in ("median_us", "alloc_pic_octets"):
+            if ref[cle] > 0 and res[cle] > ref[cle] * (1 + seuil):
+                regressions.append(f"{nom} {cle} : {ref[cle]} -> {res[cle]}")
+    return regressions
+
+def main(argv: list = None) -> int:
+    """Point d'entrée en ligne de commande des micro-benchmarks."""
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de la couche modèle de caveavin, sur une base en mémoire.")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--echauffement", type=int, default=10)
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--filtre", default="", help="N'exécute que les benchmarks dont le nom contient ce texte")
+    parser.add_argument("--sortie", default="bench_modeles.json")
+    parser.add_argument("--comparer", help="Résultats de référence à comparer")
+    parser.add_argument("--seuil", type=float, default=0.15, help="Régression relative tolérée (temps, allocations)")
+    args = parser.parse_args(argv)
+
+    reference = jeu_de_donnees(args.graine)
+    resultats = {}
+    for nom, preparer in BENCHMARKS.items():
+        if args.filtre not in nom:
+            continue
+        res = resultats[nom] = mesurer_benchmark(preparer, reference, args.iterations, args.echauffement)
+        print(f"{nom:<32} {res['median_us']:>10.1f} µs  {res['operations_par_appel']:>5} op  "
+              f"pic={res['alloc_pic_octets']:>9} o  net={res['alloc_net_octets']:>8} o")
+
+    sortie = {
+        "commit": commit_courant(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "parametres": vars(args),
+        "resultats": resultats,
+    }
+    with open(args.sortie, "w", encoding="utf-8") as fichier:
+        json.dump(sortie, fichier, indent=2, ensure_ascii=False)
+
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as fichier:
+            regressions = comparer(sortie, json.load(fichier), args.seuil)
+        for regression in regressions:
+            print(f"RÉGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import logging
+import os
+import threading
+from collections import Counter, deque
+from contextvars import ContextVar
+from Classes.connexiondb import operation_listeners
+
+#########################
+##### Configuration #####
+#########################
+
+config_budget: dict = {
+    # En mode strict (tests), un dépassement de budget lève une exception au lieu d'un avertissement
+    "strict": os.environ.get("CAVEAVIN_BUDGET_STRICT", "0") == "1",
+    "seuil_repetitions": 3,  # Nombre de requêtes de même forme à partir duquel un N+1 est signalé
+    "rapports_max": 100,  # Nombre de rapports de requêtes conservés pour les tests
+}
+
+logger = logging.getLogger(__name__)
+
+class BudgetDepasse(AssertionError):
+    """Levée en mode strict quand une route dépasse son budget d'opérations MongoDB."""
+
+def forme_requete(collection: str, operation: str, query, sort=None, projection: dict = None) -> str:
+    """
+    Retourne la forme d'une requête : sa structure sans les valeurs.
+
+    ``{"nom": "Margaux"}`` et ``{"nom": "Pétrus"}`` ont la même forme, ce qui
+    permet de repérer les boucles qui répètent la même requête (N+1).
+
+    Parameters
+    ----------
+    collection : str
+        Le nom de la collection.
+    operation : str
+        Le nom de l'opération.
+    query : dict
+        Le filtre de la requête.
+    sort : list or dict, optional
+        Le tri (couples ``(champ, sens)`` ou dictionnaire), gardé dans son ordre.
+    projection : dict, optional
+        La projection ; seuls ses champs comptent.
+
+    Returns
+    -------
+    str
+        La forme de la requête, par exemple
+        ``taches.find_one_and_update {etat: ?} tri {disponible_le: 1}``.
+    """
+    forme = f"{collection}.{operation} {_squelette(query)}"
+    if sort:
+        couples = sort.items() if isinstance(sort, dict) else sort
+        forme += " tri {" + ", ".join(f"{cle}: {sens}" for cle, sens in couples) + "}"
+    if projection:
+        forme += " projection {" + ", ".join(sorted(str(cle) for cle in projection)) + "}"
+    return forme
+
+def _squelette(valeur) -> str:
+    if isinstance(valeur, dict):
+        return "{" + ", ".join(
+            f"{cle}: {_squelette(val) if str(cle).startswith('$') or isinstance(val, dict) else '?'}"
+            for cle, val in sorted(valeur.items(), key=lambda item: str(item[0]))
+        ) + "}"
+    if isinstance(valeur, list):
+        return "[" + ", ".join(sorted({_squelette(val) for val in valeur})) + "]"
+    return "?" if valeur is not None else ""
+
+class CompteurRequetes:
+    """
+    Compte les opérations MongoDB d'une requête HTTP.
+
+    Attributes
+    ----------
+    total : int
+        Le nombre total d'opérations.
+    formes : Counter
+        Le nombre d'opérations par forme de requête.
+    """
+
+    def __init__(self):
+        self.total: int = 0
+        self.formes: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def ajouter(self, forme: str) -> None:
+        with self._lock:
+            self.total += 1
+            self.formes[forme] += 1
+
+    def repetitions(self, seuil: int) -> dict:
+        """Retourne les formes de requête répétées au moins ``seuil`` fois."""
+        return {forme: nombre for forme, nombre in self.formes.items() if nombre >= seuil}
+
+compteur_courant: ContextVar = ContextVar("compteur_requetes", default=None)
+
+# Derniers rapports (chemin, route, total, formes), consultés par les tests
+derniers_rapports: deque = deque(maxlen=config_budget["rapports_max"])
+
+def _observer_operation(collection: str, operation: str, query, duree: float, erreur, details: dict = None) -> None:
+    """Compte chaque opération Connexdb dans le compteur de la requête en cours."""
+    compteur: CompteurRequetes = compteur_courant.get()
+    if compteur is not None:
+        compteur.ajouter(forme_requete(collection, operation, query))
+
+operation_listeners.append(_observer_operation)
+
+def budget_db(max_operations: int):
+    """
+    Déclare le nombre maximal d'opérations MongoDB d'une route.
+
+    À placer sous le décorateur de route :
+
+    .. code-block:: python
+
+        @router.get("/collection")
+        @budget_db(4)
+        async def collection(...): ...
+
+    Parameters
+    ----------
+    max_operations : int
+        Le nombre maximal d'opérations autorisées par requête.
+    """
+    def decorateur(endpoint):
+        endpoint.__budget_db__ = max_operations
+        return endpoint
+    return decorateur
+
+class BudgetMiddleware:
+    """
+    Middleware ASGI qui compte les opérations MongoDB de chaque requête.
+
+    Il signale les formes de requête répétées (boucles N+1) et les routes qui
+    dépassent le budget déclaré avec ``budget_db`` : avertissement en production,
+    exception ``BudgetDepasse`` en mode strict.
+    """
+
+    def __init__(self, app, **options):
+        self.app = app
+        self.config: dict = {**config_budget, **options}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        compteur = CompteurRequetes()
+        jeton = compteur_courant.set(compteur)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            compteur_courant.reset(jeton)
+        self.verifier(scope, compteur)
+
+    def verifier(self, scope: dict, compteur: CompteurRequetes) -> None:
+        """Contrôle le compteur d'une requête terminée par rapport à son budget."""
+        route = getattr(scope.get("route"), "path", scope["path"])
+        budget = getattr(scope.get("endpoint"), "__budget_db__", None)
+        repetees = compteur.repetitions(self.config["seuil_repetitions"])
+
+        derniers_rapports.append({
+            "chemin": scope["path"],
+            "route": route,
+            "total": compteur.total,
+            "budget": budget,
+            "formes": dict(compteur.formes),
+        })
+
+        for forme, nombre in repetees.items():
+            logger.warning("N+1 suspect sur %s : %d x %s", route, nombre, forme)
+
+        if budget is not None and compteur.total > budget:
+            message = f"{route} a effectué {compteur.total} opérations MongoDB (budget : {budget})"
+            if self.config["strict"]:
+                raise BudgetDepasse(message)
+            logger.warning(message)
+
+def verifier_max_requetes(client, methode: str, url: str, maximum: int, **kwargs):
+    """
+    Aide de test : effectue une requête et vérifie son nombre d'opérations MongoDB.
+
+    Parameters
+    ----------
+    client : TestClient
+        Le client de test de l'application.
+    methode : str
+        La méthode HTTP ("GET", "POST"...).
+    url : str
+        L'URL appelée.
+    maximum : int
+        Le nombre maximal d'opérations MongoDB attendu.
+    **kwargs
+        Arguments supplémentaires transmis à ``client.request``.
+
+    Returns
+    -------
+    Response
+        La réponse de la requête.
+
+    Raises
+    ------
+    AssertionError
+        Si la requête a effectué plus de ``maximum`` opérations.
+    """
+    derniers_rapports.clear()
+    response = client.request(methode, url, **kwargs)
+    assert derniers_rapports, "Aucun rapport : BudgetMiddleware n'est pas installé"
+    total = sum(rapport["total"] for rapport in derniers_rapports)
+    formes = Counter()
+    for rapport in derniers_rapports:
+        formes.update(rapport["formes"])
+    assert total <= maximum, f"{methode} {url} : {total} opérations MongoDB (maximum {maximum}) : {dict(formes)}"
+    return response
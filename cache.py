@@ -0,0 +1,420 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+from fastapi import Response
+
+#########################
+##### Configuration #####
+#########################
+
+config_cache: dict = {
+    "fragments_max": 2048,  # Nombre maximal de fragments gardés en mémoire
+    "reponses_actif": os.environ.get("CAVEAVIN_CACHE_REPONSES", "1") == "1",
+    "reponses_max": 512,  # Nombre maximal de réponses gardées en mémoire
+    "reponses_octets_max": 32 * 1024 * 1024,  # Taille maximale (octets) des réponses gardées en mémoire
+    "reponses_duree": 60.0,  # Durée de vie (s) d'une réponse, même sans modification connue
+    # Tier disque partagé par les workers d'une même machine (désactivé si vide)
+    "reponses_dossier": os.environ.get("CAVEAVIN_CACHE_DOSSIER", ""),
+    "reponses_disque_max": 20000,  # Nombre maximal de réponses gardées sur disque
+}
+
+# Champs de la session rendus dans les pages (barre de navigation) : la portée d'une page mise en cache
+CHAMPS_UTILISATEUR: tuple = ("login", "perm", "nom", "prenom", "email")
+
+# En-têtes d'une réponse conservés avec son corps
+ENTETES_CONSERVES: tuple = ("etag", "last-modified", "cache-control", "vary")
+
+# Champs affichés par chaque type de fragment : la version d'un document sans ``_rev``
+# (données antérieures aux révisions) est calculée sur eux seuls, sans la photo
+CHAMPS_FRAGMENTS: dict = {
+    "bouteille": ("nom", "type", "annee", "region", "prix", "num_etagere", "moyen", "commentaire"),
+    "bouteille_details": ("nom", "type", "annee", "region", "prix", "num_etagere", "cave", "moyen"),
+    "cave": ("nb_emplacement", "etageres"),
+    "etagere": ("num", "login", "nb_place", "nb_bouteille", "cave"),
+}
+
+def _lire(document, champ: str):
+    return document.get(champ) if isinstance(document, dict) else getattr(document, champ, None)
+
+def version_document(document, champs: tuple = None) -> str:
+    """
+    Calcule la version d'un document MongoDB.
+
+    Si le document (ou la vue) porte un champ de révision (``_rev``), celui-ci est utilisé
+    directement ; sinon, une empreinte du contenu du document est calculée.
+
+    Parameters
+    ----------
+    document : Any
+        Le document (ou la valeur) dont on veut la version.
+    champs : tuple, optional
+        Les seuls champs pris dans l'empreinte d'un document sans ``_rev`` (par
+        défaut, tout le document).
+
+    Returns
+    -------
+    str
+        Une chaîne identifiant la version du document.
+    """
+    # Les documents comme les vues (Classes/vues.py) portent la révision dans ``_rev``
+    rev = _lire(document, "_rev")
+    if rev is not None:
+        return f"r{rev}"
+
+    if champs is not None:
+        document = [_lire(document, champ) for champ in champs]
+    empreinte = hashlib.blake2b(digest_size=12)
+    empreinte.update(repr(_normaliser(document)).encode("utf-8", "replace"))
+    return empreinte.hexdigest()
+
+def cle_etagere(num, login) -> str:
+    """
+    Retourne la clé d'une étagère dans les caches : son numéro n'est unique
+    que parmi les étagères de son propriétaire.
+    """
+    return f"{login or ''}:{num}"
+
+def _normaliser(valeur):
+    """Rend une valeur comparable de façon stable (les dictionnaires sont triés par clé)."""
+    if isinstance(valeur, dict):
+        return tuple(sorted((str(cle), _normaliser(val)) for cle, val in valeur.items()))
+    if isinstance(valeur, (list, tuple)):
+        return tuple(_normaliser(val) for val in valeur)
+    return valeur
+
+class FragmentCache:
+    """
+    Cache LRU en mémoire pour les fragments HTML rendus (cartes de bouteilles, d'étagères...).
+
+    Chaque fragment est indexé par ``(type, clé, version)`` : une nouvelle version
+    d'un document produit donc automatiquement une nouvelle entrée. Les entrées
+    obsolètes sont libérées par ``invalider`` lorsque le modèle est modifié.
+
+    Attributes
+    ----------
+    taille_max : int
+        Le nombre maximal de fragments conservés.
+    hits : int
+        Le nombre de fragments servis depuis le cache.
+    misses : int
+        Le nombre de fragments rendus faute d'entrée dans le cache.
+    """
+
+    def __init__(self, taille_max: int = 2048):
+        self.taille_max = taille_max
+        self.hits = 0
+        self.misses = 0
+        self._entrees: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtenir(self, type_: str, cle: str, version: str, rendu: Callable[[], str]) -> str:
+        """
+        Retourne le fragment en cache ou le rend puis le stocke.
+
+        Parameters
+        ----------
+        type_ : str
+            Le type d'entité ("bouteille", "etagere", "cave").
+        cle : str
+            L'identifiant de l'entité (nom de la bouteille, numéro de l'étagère...).
+        version : str
+            La version du document, voir ``version_document``.
+        rendu : Callable[[], str]
+            Fonction qui rend le fragment en cas d'absence dans le cache.
+
+        Returns
+        -------
+        str
+            Le fragment HTML rendu.
+        """
+        entree = (type_, str(cle), version)
+        with self._lock:
+            fragment = self._entrees.get(entree)
+            if fragment is not None:
+                self._entrees.move_to_end(entree)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+
+        fragment = rendu()
+
+        with self._lock:
+            # Une seule version par entité est conservée
+            for ancienne in [e for e in self._entrees if e[:2] == entree[:2]]:
+                del self._entrees[ancienne]
+            self._entrees[entree] = fragment
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+        return fragment
+
+    def invalider(self, type_: str, cle) -> None:
+        """
+        Supprime toutes les versions en cache d'une entité.
+
+        Parameters
+        ----------
+        type_ : str
+            Le type d'entité ("bouteille", "etagere", "cave").
+        cle : Any
+            L'identifiant de l'entité.
+        """
+        cle = str(cle)
+        with self._lock:
+            for entree in [e for e in self._entrees if e[0] == type_ and e[1] == cle]:
+                del self._entrees[entree]
+
+    def stats(self) -> dict:
+        """Retourne les statistiques du cache (taille, hits, misses)."""
+        with self._lock:
+            return {"taille": len(self._entrees), "hits": self.hits, "misses": self.misses}
+
+class CacheReponses:
+    """
+    Cache des réponses rendues, en mémoire (LRU borné) et, en option, sur disque.
+
+    Une réponse est indexée par sa route, ses paramètres et la portée de
+    l'utilisateur (voir ``cle_reponse``) et porte des étiquettes : les entités
+    rendues ("bouteille:<nom>", "cave:<nom>", "user:<login>"...) ou une
+    collection entière ("bouteille" pour une recherche). Chaque étiquette a un
+    numéro de génération, avancé par ``purger`` quand un modèle modifie
+    l'entité ; une réponse n'est servie que si les générations de ses
+    étiquettes n'ont pas changé depuis le début de son rendu.
+
+    Avec le tier disque, les réponses et les générations sont des fichiers
+    d'un dossier partagé : une modification faite par un worker invalide les
+    réponses de tous les autres, et une réponse rendue par l'un est servie
+    par tous. Sans ce tier, un worker ne voit que ses propres modifications et
+    ``reponses_duree`` borne l'âge des réponses servies.
+
+    Attributes
+    ----------
+    hits : int
+        Le nombre de réponses servies depuis le cache.
+    misses : int
+        Le nombre de réponses absentes ou périmées.
+    """
+
+    def __init__(self, **options):
+        self.config: dict = {**config_cache, **options}
+        self.hits = 0
+        self.misses = 0
+        self._entrees: OrderedDict = OrderedDict()
+        self._octets: int = 0
+        self._generations: dict = {}
+        self._ecritures_disque: int = 0
+        self._lock = threading.Lock()
+        self.dossier: str = self.config["reponses_dossier"] or None
+        if self.dossier:
+            os.makedirs(os.path.join(self.dossier, "reponses"), exist_ok=True)
+            os.makedirs(os.path.join(self.dossier, "etiquettes"), exist_ok=True)
+
+    @property
+    def actif(self) -> bool:
+        return self.config["reponses_actif"]
+
+    def instantane(self, *etiquettes: str) -> dict:
+        """
+        Relève les générations des étiquettes d'une réponse, avant de la rendre.
+
+        Une modification faite pendant le rendu avance une génération : la
+        réponse, peut-être déjà périmée, sera écartée à la première lecture.
+        """
+        return {etiquette: self._generation(etiquette) for etiquette in etiquettes}
+
+    def lire(self, cle: str) -> dict:
+        """
+        Retourne la réponse en cache (statut, type, en-têtes et corps), ou None.
+
+        Parameters
+        ----------
+        cle : str
+            La clé de la réponse, voir ``cle_reponse``.
+        """
+        if not self.actif:
+            return None
+        with self._lock:
+            entree: dict = self._entrees.get(cle)
+            if entree is not None:
+                self._entrees.move_to_end(cle)
+        if entree is None and self.dossier:
+            entree = self._lire_disque(cle)
+            if entree is not None:
+                self._garder(cle, entree)
+        if entree is None or not self._valide(entree):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entree
+
+    def stocker(self, cle: str, entree: dict, generations: dict) -> None:
+        """
+        Garde une réponse rendue.
+
+        Parameters
+        ----------
+        cle : str
+            La clé de la réponse, voir ``cle_reponse``.
+        entree : dict
+            Le statut, le type, les en-têtes et le corps de la réponse.
+        generations : dict
+            Les générations de ses étiquettes relevées avant le rendu (``instantane``).
+        """
+        if not self.actif:
+            return
+        entree = {**entree, "generations": generations, "expire": time.time() + self.config["reponses_duree"]}
+        self._garder(cle, entree)
+        if self.dossier:
+            self._ecrire_disque(cle, entree)
+
+    def purger(self, *etiquettes: str) -> None:
+        """Invalide les réponses portant l'une des étiquettes (appelée par les modèles après une modification)."""
+        for etiquette in etiquettes:
+            if self.dossier:
+                with open(self._chemin_etiquette(etiquette), "a+") as fichier:
+                    fcntl.flock(fichier, fcntl.LOCK_EX)
+                    fichier.seek(0)
+                    generation = int(fichier.read() or 0) + 1
+                    fichier.seek(0)
+                    fichier.truncate()
+                    fichier.write(str(generation))
+            with self._lock:
+                self._generations[etiquette] = self._generations.get(etiquette, 0) + 1
+
+    def stats(self) -> dict:
+        """Retourne les statistiques du cache (taille, octets, hits, misses)."""
+        with self._lock:
+            return {"taille": len(self._entrees), "octets": self._octets, "hits": self.hits, "misses": self.misses}
+
+    def _valide(self, entree: dict) -> bool:
+        return entree["expire"] > time.time() and all(
+            self._generation(etiquette) == generation for etiquette, generation in entree["generations"].items()
+        )
+
+    def _generation(self, etiquette: str) -> int:
+        if self.dossier:
+            try:
+                with open(self._chemin_etiquette(etiquette)) as fichier:
+                    return int(fichier.read() or 0)
+            except FileNotFoundError:
+                return 0
+        with self._lock:
+            return self._generations.get(etiquette, 0)
+
+    def _garder(self, cle: str, entree: dict) -> None:
+        with self._lock:
+            ancienne = self._entrees.pop(cle, None)
+            if ancienne is not None:
+                self._octets -= len(ancienne["corps"])
+            self._entrees[cle] = entree
+            self._octets += len(entree["corps"])
+            while self._entrees and (len(self._entrees) > self.config["reponses_max"]
+                                     or self._octets > self.config["reponses_octets_max"]):
+                _, retiree = self._entrees.popitem(last=False)
+                self._octets -= len(retiree["corps"])
+
+    def _chemin_etiquette(self, etiquette: str) -> str:
+        return os.path.join(self.dossier, "etiquettes", hashlib.blake2b(etiquette.encode("utf-8"), digest_size=12).hexdigest())
+
+    def _chemin_reponse(self, cle: str) -> str:
+        return os.path.join(self.dossier, "reponses", cle)
+
+    def _lire_disque(self, cle: str) -> dict:
+        # Une ligne JSON (statut, type, en-têtes, générations, expiration) puis le corps
+        try:
+            with open(self._chemin_reponse(cle), "rb") as fichier:
+                entete = json.loads(fichier.readline())
+                return {**entete, "corps": fichier.read()}
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _ecrire_disque(self, cle: str, entree: dict) -> None:
+        entete = {champ: valeur for champ, valeur in entree.items() if champ != "corps"}
+        temporaire = f"{self._chemin_reponse(cle)}.{os.getpid()}.{threading.get_ident()}"
+        with open(temporaire, "wb") as fichier:
+            fichier.write(json.dumps(entete).encode("utf-8") + b"\n")
+            fichier.write(entree["corps"])
+        os.replace(temporaire, self._chemin_reponse(cle))
+        with self._lock:
+            self._ecritures_disque += 1
+            elaguer = self._ecritures_disque % 256 == 0
+        if elaguer:
+            self._elaguer_disque()
+
+    def _elaguer_disque(self) -> None:
+        """Supprime les réponses expirées du disque, puis les plus anciennes au-delà de ``reponses_disque_max``."""
+        dossier = os.path.join(self.dossier, "reponses")
+        maintenant = time.time()
+        fichiers: list = []
+        for nom in os.listdir(dossier):
+            chemin = os.path.join(dossier, nom)
+            try:
+                modification = os.path.getmtime(chemin)
+            except FileNotFoundError:
+                continue
+            fichiers.append((modification, chemin))
+        fichiers.sort()
+        en_trop = len(fichiers) - self.config["reponses_disque_max"]
+        for index, (modification, chemin) in enumerate(fichiers):
+            if index >= en_trop and modification + self.config["reponses_duree"] > maintenant:
+                break
+            try:
+                os.remove(chemin)
+            except FileNotFoundError:
+                pass
+
+def cle_reponse(route: str, parametres: dict, user_cookies: dict = None) -> str:
+    """
+    Calcule la clé d'une réponse : sa route, ses paramètres et la portée de l'utilisateur.
+
+    La portée est faite des champs de la session rendus dans la page : deux
+    utilisateurs n'ont jamais la même clé, tous les visiteurs anonymes partagent la leur.
+    """
+    portee = [(user_cookies or {}).get(champ) for champ in CHAMPS_UTILISATEUR]
+    return version_document([route, parametres, portee])
+
+def reponse_en_cache(cle: str) -> Response:
+    """Retourne la réponse gardée sous cette clé, ou None si elle est absente ou périmée."""
+    entree: dict = reponses_cache.lire(cle)
+    if entree is None:
+        return None
+    return Response(content=entree["corps"], status_code=entree["statut"], headers=entree["entetes"],
+                    media_type=entree["type"])
+
+def mettre_en_cache(cle: str, response: Response, generations: dict) -> Response:
+    """
+    Garde une réponse rendue avec succès et la retourne.
+
+    Parameters
+    ----------
+    cle : str
+        La clé de la réponse, voir ``cle_reponse``.
+    response : Response
+        La réponse rendue (son corps est déjà calculé).
+    generations : dict
+        Les générations de ses étiquettes, relevées avant le rendu.
+    """
+    if response.status_code == 200:
+        reponses_cache.stocker(cle, {
+            "statut": response.status_code,
+            "type": response.media_type,
+            "entetes": {nom: valeur for nom, valeur in response.headers.items() if nom in ENTETES_CONSERVES},
+            "corps": bytes(response.body),
+        }, generations)
+    return response
+
+def etiquettes_changement(entite: str, cle, logins: list = None) -> tuple:
+    """Retourne les étiquettes à purger après la modification d'une entité : l'entité, sa collection et ses utilisateurs."""
+    return (f"{entite}:{cle}", entite, *(f"user:{login}" for login in logins or ()))
+
+# Instance partagée par le moteur de templates et les modèles
+fragment_cache: FragmentCache = FragmentCache(config_cache["fragments_max"])
+
+# Instance partagée par les routes et les modèles
+reponses_cache: CacheReponses = CacheReponses()
@@ -0,0 +1,142 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from urllib.parse import parse_qsl
+from log import masquer, decoder_corps
+from session import sessions, config_session
+
+#########################
+##### Configuration #####
+#########################
+
+config_capture: dict = {
+    "actif": os.environ.get("CAVEAVIN_CAPTURE", "0") == "1",
+    "dossier": os.environ.get("CAVEAVIN_CAPTURE_DOSSIER", "captures"),
+    "taille_max_fichier": 50 * 1024 * 1024,  # Taille d'un fichier de capture avant rotation, en octets
+    "fichiers_max": 20,  # Nombre de fichiers de capture conservés
+    "taille_max_corps": 64 * 1024,  # Au-delà, le corps n'est pas conservé et la requête n'est pas rejouable
+    "taux_echantillonnage": 1.0,  # Part des requêtes capturées
+    "exclure": ("/metrics", "/static", "/cave/live/", "/etagere/live"),  # Préfixes de chemins jamais capturés
+}
+
+# Types de corps conservés (décodés puis masqués) ; les autres ne sont décrits que par leur taille
+TYPES_CORPS: tuple = ("application/x-www-form-urlencoded", "application/json")
+
+logger = logging.getLogger(__name__)
+
+class EcrivainCapture:
+    """
+    Écrit les requêtes capturées, une ligne JSON par requête, dans des fichiers tournants.
+
+    Comme pour les journaux, l'écriture sur disque est faite par un thread
+    dédié : le middleware ne fait que déposer la ligne dans une file.
+    """
+
+    def __init__(self, dossier: str, taille_max_fichier: int, fichiers_max: int):
+        os.makedirs(dossier, exist_ok=True)
+        fichier = RotatingFileHandler(
+            os.path.join(dossier, "capture.jsonl"),
+            maxBytes=taille_max_fichier,
+            backupCount=fichiers_max,
+            encoding="utf-8",
+        )
+        fichier.setFormatter(logging.Formatter("%(message)s"))
+
+        file_capture: queue.SimpleQueue = queue.SimpleQueue()
+        self._logger = logging.getLogger("caveavin.capture")
+        self._logger.handlers = [QueueHandler(file_capture)]
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+
+        self.listener = QueueListener(file_capture, fichier)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def ecrire(self, entree: dict) -> None:
+        self._logger.info(json.dumps(entree, ensure_ascii=False, default=str))
+
+class CaptureMiddleware:
+    """
+    Middleware ASGI qui enregistre le trafic réel pour le rejouer (``outils.rejouer``).
+
+    Chaque requête capturée donne une ligne JSON : instant, méthode, chemin,
+    route, paramètres, en-têtes utiles, corps décodé, statut, durée et taille de
+    la réponse. Les champs sensibles (mots de passe, cookies, photos) sont masqués
+    avec ``log.masquer`` ; seul le login de l'utilisateur est conservé afin que
+    le rejeu puisse rejouer chaque session.
+    """
+
+    def __init__(self, app, **options):
+        self.app = app
+        self.config: dict = {**config_capture, **options}
+        self.ecrivain: EcrivainCapture = None
+        if self.config["actif"]:
+            self.ecrivain = EcrivainCapture(self.config["dossier"], self.config["taille_max_fichier"], self.config["fichiers_max"])
+
+    async def __call__(self, scope, receive, send):
+        if (self.ecrivain is None or scope["type"] != "http"
+                or scope["path"].startswith(self.config["exclure"])
+                or random.random() >= self.config["taux_echantillonnage"]):
+            await self.app(scope, receive, send)
+            return
+
+        ts = time.time()
+        start_time = time.perf_counter()
+        corps = bytearray()
+        etat: dict = {"taille_corps": 0, "statut": 500, "taille_reponse": 0}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                morceau = message.get("body", b"")
+                etat["taille_corps"] += len(morceau)
+                if len(corps) < self.config["taille_max_corps"]:
+                    corps.extend(morceau[:self.config["taille_max_corps"] - len(corps)])
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                etat["statut"] = message["status"]
+            elif message["type"] == "http.response.body":
+                etat["taille_reponse"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            try:
+                self.ecrivain.ecrire(self.entree(scope, ts, time.perf_counter() - start_time, bytes(corps), etat))
+            except Exception as e:
+                logger.error("Capture de %s impossible : %s", scope["path"], e)
+
+    def entree(self, scope: dict, ts: float, duree: float, corps: bytes, etat: dict) -> dict:
+        """Construit la ligne de capture, sans données sensibles, d'une requête terminée."""
+        en_tetes = {cle.decode("latin-1"): valeur.decode("latin-1") for cle, valeur in scope["headers"]}
+        content_type = en_tetes.get("content-type", "")
+        cookies = dict(
+            morceau.strip().split("=", 1) for morceau in en_tetes.get("cookie", "").split(";") if "=" in morceau
+        )
+        complet = etat["taille_corps"] <= self.config["taille_max_corps"]
+
+        entree: dict = {
+            "ts": round(ts, 6),
+            "methode": scope["method"],
+            "chemin": scope["path"],
+            "route": getattr(scope.get("route"), "path", None),
+            "query": masquer(dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))),
+            "utilisateur": sessions.identifier(cookies.get(config_session["cookie"])),
+            "content_type": content_type,
+            "taille_corps": etat["taille_corps"],
+            "rejouable": complet and (not corps or content_type.startswith(TYPES_CORPS)),
+            "statut": etat["statut"],
+            "duree_ms": round(duree * 1000, 3),
+            "taille_reponse": etat["taille_reponse"],
+        }
+        if corps and complet and content_type.startswith(TYPES_CORPS):
+            entree["corps"] = decoder_corps(corps, content_type)
+        return entree
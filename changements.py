@@ -0,0 +1,324 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable
+from bson import ObjectId
+from Classes.connexiondb import Connexdb, after_commit
+from route.dependencies import lectures_concurrentes
+from cache import fragment_cache, reponses_cache, etiquettes_changement, cle_etagere
+
+#########################
+##### Configuration #####
+#########################
+
+config_changements: dict = {
+    "collection": "journal",  # Journal des modifications, en ajout seul
+    "compteurs": "compteurs",  # Compteur de la séquence du journal
+    "sync_max": 500,  # Entrées du journal parcourues au plus par synchronisation
+    "delai_trou": 5.0,  # Délai (s) au-delà duquel un numéro de séquence manquant est considéré perdu
+}
+
+CREATION: str = "creation"
+MODIFICATION: str = "modification"
+SUPPRESSION: str = "suppression"
+
+# Collection et champ identifiant de chaque type d'entité journalisée ; le numéro
+# d'une étagère n'est unique que chez son propriétaire : sa clé est ``cle_etagere(num, login)``
+ENTITES: dict = {
+    "bouteille": ("bouteille", "nom"),
+    "cave": ("caves", "nom"),
+    "etagere": ("etagere", "num"),
+    "user": ("user", "login"),
+}
+
+# Fragments HTML rendus pour chaque type d'entité, libérés à chaque modification
+FRAGMENTS: dict = {
+    "bouteille": ("bouteille", "bouteille_details"),
+    "cave": ("cave",),
+    "etagere": ("etagere",),
+}
+
+# Champs jamais transmis aux clients
+CHAMPS_PRIVES: tuple = ("password", "session_gen")
+
+logger = logging.getLogger(__name__)
+
+# Fonctions appelées avec chaque entrée ajoutée au journal
+ecouteurs_changements: list[Callable[[dict], None]] = []
+
+def enregistrer_changement(config_db: dict, entite: str, cle, operation: str, logins: list = None,
+                           details: dict = None) -> dict:
+    """
+    Enregistre la modification d'une entité dans le journal des modifications.
+
+    Parameters
+    ----------
+    config_db : dict
+        La configuration de connexion à la base de données.
+    entite : str
+        Le type d'entité ("bouteille", "cave", "etagere" ou "user").
+    cle : Any
+        L'identifiant de l'entité (nom, ``cle_etagere`` ou login).
+    operation : str
+        CREATION, MODIFICATION ou SUPPRESSION.
+    logins : list, optional
+        Les utilisateurs concernés ; None si l'entité n'appartient à personne en particulier.
+    details : dict, optional
+        Les champs modifiés utiles aux écouteurs sans relire l'entité
+        (occupation d'une étagère, emplacement d'une bouteille...).
+
+    Returns
+    -------
+    dict
+        L'entrée ajoutée au journal (sans ``seq`` si l'écriture a échoué).
+    """
+    return enregistrer_changements(config_db, entite, [cle], operation, logins, details)[0]
+
+def enregistrer_changements(config_db: dict, entite: str, cles: list, operation: str, logins: list = None,
+                            details: dict = None) -> list:
+    """
+    Enregistre la même modification de plusieurs entités d'un type dans le journal.
+
+    La version des entités est d'abord avancée : leur révision ``_rev`` est
+    incrémentée et ``maj_le`` reçoit la date de la modification (voir
+    validateurs.py). Chaque entrée reçoit ensuite le numéro suivant d'une
+    séquence croissante : les numéros sont réservés en bloc par un seul
+    ``$inc`` atomique sur le compteur, et les entrées sont écrites avec un
+    seul ``insert_many``. Les fragments HTML et les réponses en cache des
+    entités sont ensuite libérés et les écouteurs prévenus ; dans une
+    transaction, seulement après sa validation. Un échec du journal
+    n'annule pas les modifications : il est seulement signalé dans les logs.
+
+    Parameters
+    ----------
+    config_db : dict
+        La configuration de connexion à la base de données.
+    entite : str
+        Le type d'entité ("bouteille", "cave", "etagere" ou "user").
+    cles : list
+        Les identifiants des entités modifiées.
+    operation : str
+        CREATION, MODIFICATION ou SUPPRESSION.
+    logins : list, optional
+        Les utilisateurs concernés ; None si les entités n'appartiennent à personne en particulier.
+    details : dict, optional
+        Les champs modifiés, communs à toutes les entités, utiles aux écouteurs.
+
+    Returns
+    -------
+    list
+        Les entrées ajoutées au journal, dans l'ordre des clés.
+    """
+    date: float = time.time()
+    entrees: list = [
+        {"entite": entite, "cle": cle, "operation": operation, "logins": logins, "date": date} for cle in cles
+    ]
+    if details:
+        for entree in entrees:
+            entree["details"] = details
+    if not entrees:
+        return entrees
+
+    connex: Connexdb = Connexdb(**config_db)
+    if operation != SUPPRESSION:
+        versions: dict = connex.update_many_in_collection(
+            ENTITES[entite][0], requete_entites(entite, cles),
+            {"$inc": {"_rev": 1}, "$set": {"maj_le": datetime.fromtimestamp(date, timezone.utc)}}
+        )
+        if versions.get("status") != 200:
+            logger.error("Version de %d %s non mise à jour : %s", len(entrees), entite, versions.get("message"))
+
+    compteur: dict = connex.find_one_and_update_in_collection(
+        config_changements["compteurs"], {"_id": config_changements["collection"]},
+        {"$inc": {"seq": len(entrees)}}, upsert=True
+    )
+    if compteur.get("status") != 200:
+        logger.error("Journalisation de %d %s impossible : %s", len(entrees), entite, compteur.get("message"))
+        after_commit(lambda: _publier(entite, cles, logins, []))
+        return entrees
+
+    premier: int = compteur["data"]["seq"] - len(entrees) + 1
+    for seq, entree in enumerate(entrees, start=premier):
+        entree["seq"] = seq
+    rstatus: dict = connex.insert_many_into_collection(config_changements["collection"], entrees, ordered=True)
+    if rstatus.get("status") != 200:
+        logger.error("Journalisation de %d %s impossible : %s", len(entrees), entite, rstatus.get("message"))
+
+    after_commit(lambda: _publier(entite, cles, logins, entrees))
+    return entrees
+
+def _publier(entite: str, cles: list, logins: list, entrees: list) -> None:
+    """Libère les fragments et les réponses en cache des entités modifiées, puis prévient les écouteurs."""
+    for cle in cles:
+        for type_fragment in FRAGMENTS.get(entite, ()):
+            fragment_cache.invalider(type_fragment, cle)
+        # Après la nouvelle version : une réponse rendue ensuite porte le bon ETag
+        reponses_cache.purger(*etiquettes_changement(entite, cle, logins))
+
+    for entree in entrees:
+        for ecouteur in ecouteurs_changements:
+            try:
+                ecouteur(entree)
+            except Exception:
+                logger.exception("Écouteur du journal des modifications en échec")
+
+def derniere_sequence(config_db: dict) -> int:
+    """Retourne le numéro de la dernière entrée du journal (0 si le journal est vide)."""
+    rstatus: dict = Connexdb(**config_db).get_data_from_collection(
+        config_changements["compteurs"], {"_id": config_changements["collection"]}
+    )
+    if rstatus.get("status") != 200 or not rstatus.get("data"):
+        return 0
+    return rstatus["data"][0].get("seq", 0)
+
+def changements_depuis(config_db: dict, depuis: int, login: str) -> dict:
+    """
+    Retourne les entités modifiées depuis un numéro de séquence, visibles par un utilisateur.
+
+    Les entrées du journal sont lues dans l'ordre de la séquence ; plusieurs
+    modifications d'une même entité n'en donnent qu'une, avec son état
+    actuel. Un utilisateur voit son propre compte, ses caves, les bouteilles
+    de sa collection et les étagères (les siennes et celles sans propriétaire).
+
+    Parameters
+    ----------
+    config_db : dict
+        La configuration de connexion à la base de données.
+    depuis : int
+        Le numéro de la dernière entrée déjà appliquée par le client.
+    login : str
+        Le login de l'utilisateur qui synchronise.
+
+    Returns
+    -------
+    dict
+        Le statut, ``seq`` (à renvoyer comme ``since`` à la synchronisation
+        suivante), ``suite`` (vrai s'il reste des entrées à lire) et
+        ``changements`` : pour chaque entité, son type, sa clé, l'opération et
+        ses données actuelles (None si elle a été supprimée).
+    """
+    connex: Connexdb = Connexdb(**config_db)
+    journal, utilisateur = lectures_concurrentes(
+        lambda: connex.aggregate_collection(config_changements["collection"], [
+            {"$match": {"seq": {"$gt": depuis}}},
+            {"$sort": {"seq": 1}},
+            {"$limit": config_changements["sync_max"] + 1},
+        ]),
+        lambda: connex.get_data_from_collection("user", {"login": login})
+    )
+    for rstatus in (journal, utilisateur):
+        if rstatus.get("status") != 200:
+            return {"status": rstatus.get("status"), "message": rstatus.get("message")}
+
+    entrees, seq, suite = _entrees_continues(journal["data"], depuis)
+    compte: dict = utilisateur["data"][0] if utilisateur["data"] else {}
+    visibles: dict = {}
+    for entree in entrees:
+        if _visible(entree, login, compte):
+            # Seule la dernière opération sur une entité compte
+            visibles.pop((entree["entite"], entree["cle"]), None)
+            visibles[(entree["entite"], entree["cle"])] = entree["operation"]
+
+    # L'état actuel des entités encore présentes : une lecture par type d'entité
+    par_entite: dict = {}
+    for (entite, cle), operation in visibles.items():
+        if operation != SUPPRESSION:
+            par_entite.setdefault(entite, []).append(cle)
+    types: list = list(par_entite)
+    lectures: list = lectures_concurrentes(*(
+        (lambda entite=entite: connex.get_data_from_collection(
+            ENTITES[entite][0], requete_entites(entite, par_entite[entite])
+        )) for entite in types
+    ))
+    documents: dict = {}
+    for entite, rstatus in zip(types, lectures):
+        if rstatus.get("status") != 200:
+            return {"status": rstatus.get("status"), "message": rstatus.get("message")}
+        for document in rstatus["data"]:
+            documents[(entite, cle_document(entite, document))] = document
+
+    changements: list = []
+    for (entite, cle), operation in visibles.items():
+        document = documents.get((entite, cle))
+        changements.append({
+            "entite": entite,
+            "cle": cle,
+            # Une entité disparue depuis la modification est signalée comme supprimée
+            "operation": operation if document is not None else SUPPRESSION,
+            "data": _exportable(document) if document is not None else None,
+        })
+
+    return {"status": 200, "seq": seq, "suite": suite, "changements": changements}
+
+def requete_entites(entite: str, cles: list) -> dict:
+    """
+    Retourne la requête MongoDB des entités d'un type désignées par leurs clés.
+
+    Une étagère est cherchée par son numéro et son propriétaire : une clé
+    sans propriétaire désigne une étagère dont le login est vide ou absent.
+    Les anciennes entrées, identifiées par le seul numéro, ne désignent
+    aucune étagère de façon sûre et sont ignorées.
+    """
+    if entite != "etagere":
+        return {ENTITES[entite][1]: {"$in": list(cles)}}
+    conditions: list = []
+    for cle in cles:
+        if ":" not in str(cle):
+            continue
+        login, num = str(cle).rsplit(":", 1)
+        conditions.append({"num": int(num), "login": login or {"$in": ["", None]}})
+    return {"$or": conditions} if conditions else {"_id": {"$in": []}}
+
+def cle_document(entite: str, document: dict):
+    """Retourne la clé d'une entité dans le journal, depuis son document."""
+    if entite == "etagere":
+        return cle_etagere(document.get("num"), document.get("login"))
+    return document.get(ENTITES[entite][1])
+
+def _entrees_continues(entrees: list, depuis: int) -> tuple:
+    """
+    Garde les entrées jusqu'au premier trou récent de la séquence.
+
+    Un numéro est tiré avant l'écriture de son entrée : une entrée plus
+    récente peut donc être visible avant une plus ancienne. S'arrêter au trou
+    évite qu'un client saute l'entrée encore en cours d'écriture ; un trou
+    plus ancien que ``delai_trou`` provient d'une écriture échouée et est ignoré.
+    """
+    limite: float = time.time() - config_changements["delai_trou"]
+    suite: bool = len(entrees) > config_changements["sync_max"]
+    entrees = entrees[:config_changements["sync_max"]]
+    seq: int = depuis
+    for index, entree in enumerate(entrees):
+        if entree["seq"] != seq + 1 and entree["date"] > limite:
+            # Les entrées suivantes seront retournées par une prochaine synchronisation
+            return entrees[:index], seq, False
+        seq = entree["seq"]
+    return entrees, seq, suite
+
+def _visible(entree: dict, login: str, compte: dict) -> bool:
+    """Indique si une entrée du journal concerne l'utilisateur."""
+    if login in (entree.get("logins") or []):
+        return True
+    match entree["entite"]:
+        case "bouteille":
+            return entree["cle"] in compte.get("bouteille_reserver", [])
+        case "cave":
+            return entree["cle"] in compte.get("caves", [])
+        case "etagere":
+            return entree.get("logins") is None
+    return False
+
+def _exportable(document: dict) -> dict:
+    """Prépare un document pour le JSON : ObjectId et dates en chaînes, sans champs privés ni données binaires."""
+    return {
+        champ: _valeur_json(valeur)
+        for champ, valeur in document.items()
+        if champ not in CHAMPS_PRIVES and not isinstance(valeur, bytes)
+    }
+
+def _valeur_json(valeur):
+    if isinstance(valeur, ObjectId):
+        return str(valeur)
+    if isinstance(valeur, datetime):
+        return valeur.isoformat()
+    return valeur
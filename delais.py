@@ -0,0 +1,84 @@
+import logging
+import time
+from Classes.connexiondb import request_deadline
+from metrics import registre
+
+#########################
+##### Configuration #####
+#########################
+
+config_delais: dict = {
+    "actif": True,
+    "defaut": 10.0,  # Délai d'une requête, en secondes, pour les routes non listées
+    "routes": {  # Délai par préfixe de chemin (le préfixe le plus long l'emporte)
+        "/user/auth": 3.0,
+        "/user/collection": 5.0,
+        "/bottle/search": 3.0,
+        "/etagere/": 3.0,
+        "/cave/get/": 5.0,
+        "/sync": 3.0,
+        "/api/v1/": 3.0,
+        "/api/batch": 10.0,
+    },
+    "retry_after": 2,  # Valeur de l'en-tête Retry-After des réponses 503, en secondes
+}
+
+logger = logging.getLogger(__name__)
+
+delais_depasses = registre.compteur(
+    "caveavin_deadline_exceeded_total",
+    "Nombre de requêtes interrompues faute de temps, par route.",
+    ("route",)
+)
+
+def delai_route(path: str, routes: dict = None, defaut: float = None) -> float:
+    """
+    Retourne le délai configuré pour un chemin.
+
+    Parameters
+    ----------
+    path : str
+        Le chemin de la requête.
+    routes : dict, optional
+        Les délais par préfixe (par défaut ceux de ``config_delais``).
+    defaut : float, optional
+        Le délai des chemins sans préfixe configuré.
+
+    Returns
+    -------
+    float
+        Le délai en secondes.
+    """
+    routes = config_delais["routes"] if routes is None else routes
+    meilleur: str = ""
+    for prefixe in routes:
+        if path.startswith(prefixe) and len(prefixe) > len(meilleur):
+            meilleur = prefixe
+    return routes.get(meilleur, config_delais["defaut"] if defaut is None else defaut)
+
+class DelaiMiddleware:
+    """
+    Middleware ASGI qui fixe l'échéance de chaque requête.
+
+    L'échéance est portée par le contexte de la requête (``request_deadline``) :
+    chaque opération de ``Connexdb`` s'exécute avec le temps restant comme
+    ``maxTimeMS`` et délai de socket, et lève ``DeadlineExceeded`` quand il est
+    écoulé. L'application répond alors 503 au lieu de garder un worker occupé
+    pour un client qui a abandonné.
+    """
+
+    def __init__(self, app, **options):
+        self.app = app
+        self.config: dict = {**config_delais, **options}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.config["actif"]:
+            await self.app(scope, receive, send)
+            return
+
+        delai = delai_route(scope["path"], self.config["routes"], self.config["defaut"])
+        jeton = request_deadline.set(time.monotonic() + delai)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_deadline.reset(jeton)
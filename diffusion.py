@@ -0,0 +1,191 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import AsyncIterator
+from changements import ecouteurs_changements
+from metrics import registre
+
+#########################
+##### Configuration #####
+#########################
+
+config_diffusion: dict = {
+    "file_max": 256,  # Événements en attente d'envoi par connexion ; au-delà, le client doit se resynchroniser
+    "battement": 15.0,  # Délai (s) entre deux commentaires de maintien si aucun événement n'est envoyé
+    "reconnexion": 3000,  # Délai (ms) de reconnexion conseillé aux clients (champ ``retry`` du flux)
+}
+
+# Canal de toutes les étagères (page /etagere/)
+CANAL_ETAGERES: str = "etageres"
+
+# En-têtes des réponses text/event-stream : ni cache, ni mise en tampon par un proxy
+ENTETES_FLUX: dict = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Champs des détails d'une modification transmis aux abonnés : occupation et emplacement
+CHAMPS_DIFFUSES: tuple = ("cave", "num_etagere", "nb_place", "nb_bouteille", "nb_emplacement", "etageres")
+
+logger = logging.getLogger(__name__)
+
+diffusion_abonnes = registre.jauge(
+    "caveavin_live_subscribers",
+    "Nombre de connexions ouvertes aux flux d'occupation en direct."
+)
+diffusion_evenements = registre.compteur(
+    "caveavin_live_events_total",
+    "Nombre d'événements publiés aux flux d'occupation, par type d'entité.",
+    ("entite",)
+)
+diffusion_debordements = registre.compteur(
+    "caveavin_live_overflows_total",
+    "Nombre de connexions fermées faute de lire leurs événements assez vite."
+)
+
+def canal_cave(nom_cave: str) -> str:
+    return f"cave:{nom_cave}"
+
+def canaux_changement(entree: dict) -> tuple:
+    """
+    Retourne les canaux concernés par une entrée du journal des modifications.
+
+    Une étagère est publiée sur le canal des étagères et sur celui de sa cave ;
+    le placement d'une bouteille, sur le canal de sa cave. Les autres
+    modifications ne changent pas l'occupation et ne sont pas publiées.
+    """
+    details: dict = entree.get("details") or {}
+    match entree["entite"]:
+        case "cave":
+            return (canal_cave(entree["cle"]),)
+        case "etagere":
+            return (CANAL_ETAGERES, canal_cave(details["cave"])) if details.get("cave") else (CANAL_ETAGERES,)
+        case "bouteille" if details.get("cave"):
+            return (canal_cave(details["cave"]),)
+    return ()
+
+class Abonnement:
+    """
+    Connexion abonnée à des canaux : une file d'événements déjà encodés.
+
+    Un abonnement ne coûte qu'une file et un ``asyncio.Event`` : le flux
+    attend sur l'événement sans thread ni requête MongoDB.
+    """
+
+    __slots__ = ("canaux", "evenements", "signal", "deborde")
+
+    def __init__(self, canaux: tuple):
+        self.canaux = canaux
+        self.evenements: deque = deque()
+        self.signal: asyncio.Event = asyncio.Event()
+        self.deborde: bool = False
+
+    def pousser(self, evenement: bytes, file_max: int) -> None:
+        if len(self.evenements) >= file_max:
+            # Le client est trop lent : plutôt que de garder ses événements, il sera invité à recharger
+            self.deborde = True
+            self.evenements.clear()
+        else:
+            self.evenements.append(evenement)
+        self.signal.set()
+
+class Diffuseur:
+    """
+    Publication et abonnement en mémoire, dans le processus, pour les flux SSE.
+
+    Les modèles publient leurs modifications via le journal des modifications
+    (``changements.ecouteurs_changements``), depuis n'importe quel thread ;
+    chaque événement est encodé une seule fois puis distribué aux abonnés
+    dans la boucle d'événements. Chaque worker n'envoie que les modifications
+    faites par ses propres requêtes : avec plusieurs workers, le client
+    complète avec ``/sync``.
+
+    Attributes
+    ----------
+    abonnes : dict
+        Les abonnements de chaque canal.
+    """
+
+    def __init__(self, **options):
+        self.config: dict = {**config_diffusion, **options}
+        self.abonnes: dict = {}
+        self._boucle: asyncio.AbstractEventLoop = None
+
+    def publier(self, entree: dict) -> None:
+        """Publie une entrée du journal des modifications (appelable depuis n'importe quel thread)."""
+        canaux: tuple = canaux_changement(entree)
+        if not canaux or self._boucle is None:
+            return
+        evenement: bytes = encoder_evenement(entree)
+        diffusion_evenements.inc(entree["entite"])
+        try:
+            self._boucle.call_soon_threadsafe(self._distribuer, canaux, evenement)
+        except RuntimeError:
+            # La boucle est fermée (arrêt du serveur)
+            self._boucle = None
+
+    def _distribuer(self, canaux: tuple, evenement: bytes) -> None:
+        destinataires: set = set()
+        for canal in canaux:
+            destinataires.update(self.abonnes.get(canal, ()))
+        for abonnement in destinataires:
+            abonnement.pousser(evenement, self.config["file_max"])
+
+    def abonner(self, *canaux: str) -> Abonnement:
+        """Ouvre un abonnement aux canaux donnés (dans la boucle d'événements)."""
+        self._boucle = asyncio.get_running_loop()
+        abonnement = Abonnement(canaux)
+        for canal in canaux:
+            self.abonnes.setdefault(canal, set()).add(abonnement)
+        diffusion_abonnes.inc()
+        return abonnement
+
+    def desabonner(self, abonnement: Abonnement) -> None:
+        for canal in abonnement.canaux:
+            abonnes: set = self.abonnes.get(canal, set())
+            abonnes.discard(abonnement)
+            if not abonnes:
+                self.abonnes.pop(canal, None)
+        diffusion_abonnes.dec()
+
+    async def flux(self, *canaux: str) -> AsyncIterator[bytes]:
+        """
+        Produit le flux ``text/event-stream`` d'un abonnement aux canaux donnés.
+
+        Un commentaire est envoyé toutes les ``battement`` secondes sans
+        événement, pour garder la connexion ouverte à travers les proxys. Si
+        le client a laissé trop d'événements en attente, un événement
+        ``resynchroniser`` est envoyé et le flux se termine.
+        """
+        abonnement: Abonnement = self.abonner(*canaux)
+        try:
+            yield f"retry: {self.config['reconnexion']}\n\n".encode("utf-8")
+            while True:
+                try:
+                    await asyncio.wait_for(abonnement.signal.wait(), timeout=self.config["battement"])
+                except asyncio.TimeoutError:
+                    yield b": maintien\n\n"
+                    continue
+                abonnement.signal.clear()
+                if abonnement.deborde:
+                    diffusion_debordements.inc()
+                    yield b"event: resynchroniser\ndata: {}\n\n"
+                    return
+                while abonnement.evenements:
+                    yield abonnement.evenements.popleft()
+        finally:
+            self.desabonner(abonnement)
+
+def encoder_evenement(entree: dict) -> bytes:
+    """Encode une entrée du journal en événement SSE : type d'entité, clé, opération et occupation."""
+    details: dict = entree.get("details") or {}
+    donnees: dict = {
+        "cle": entree["cle"],
+        "operation": entree["operation"],
+        **{champ: details[champ] for champ in CHAMPS_DIFFUSES if champ in details},
+    }
+    lignes: str = f"event: {entree['entite']}\ndata: {json.dumps(donnees, ensure_ascii=False)}\n\n"
+    if "seq" in entree:
+        lignes = f"id: {entree['seq']}\n" + lignes
+    return lignes.encode("utf-8")
+
+diffuseur: Diffuseur = Diffuseur()
+ecouteurs_changements.append(diffuseur.publier)
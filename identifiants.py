@@ -0,0 +1,139 @@
+import asyncio
+import base64
+import contextvars
+import hashlib
+import hmac
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from metrics import registre
+
+#########################
+##### Configuration #####
+#########################
+
+config_identifiants: dict = {
+    # Paramètres de coût de scrypt : avec n=2**15, r=8, chaque empreinte utilise 32 Mo et ~100 ms de CPU
+    "n": int(os.environ.get("CAVEAVIN_SCRYPT_N", 2 ** 15)),
+    "r": int(os.environ.get("CAVEAVIN_SCRYPT_R", 8)),
+    "p": int(os.environ.get("CAVEAVIN_SCRYPT_P", 1)),
+    "taille_sel": 16,
+    "taille_cle": 32,
+    "threads": 4,  # Threads dédiés au calcul des empreintes (hashlib.scrypt libère le GIL)
+    "calculs_max": 8,  # Calculs d'empreinte admis simultanément (en cours ou en file dans le pool)
+    "attente_max": 5.0,  # Attente maximale d'une place, en secondes, avant de refuser la connexion
+}
+
+PREFIXE: str = "scrypt"
+
+calculs_refuses = registre.compteur(
+    "caveavin_password_hash_rejected_total",
+    "Nombre de calculs d'empreinte refusés faute de place (afflux de connexions)."
+)
+
+class IdentifiantsSatures(Exception):
+    """Levée quand trop de calculs d'empreinte sont déjà en cours."""
+
+def _b64(donnees: bytes) -> str:
+    return base64.b64encode(donnees).decode("ascii")
+
+def _memoire_max(n: int, r: int, p: int) -> int:
+    # scrypt utilise 128 * r * (n + p) octets ; une marge évite l'erreur "memory limit exceeded" d'OpenSSL
+    return 128 * r * (n + p) + 1024 * 1024
+
+def hacher(mot_de_passe: str) -> str:
+    """
+    Calcule l'empreinte scrypt d'un mot de passe.
+
+    Parameters
+    ----------
+    mot_de_passe : str
+        Le mot de passe en clair.
+
+    Returns
+    -------
+    str
+        L'empreinte au format ``scrypt$n$r$p$sel$cle`` (sel et clé en base64).
+    """
+    n, r, p = config_identifiants["n"], config_identifiants["r"], config_identifiants["p"]
+    sel = secrets.token_bytes(config_identifiants["taille_sel"])
+    cle = hashlib.scrypt(mot_de_passe.encode("utf-8"), salt=sel, n=n, r=r, p=p,
+                         maxmem=_memoire_max(n, r, p), dklen=config_identifiants["taille_cle"])
+    return f"{PREFIXE}${n}${r}${p}${_b64(sel)}${_b64(cle)}"
+
+def est_empreinte(valeur) -> bool:
+    """Indique si une valeur est une empreinte produite par ``hacher``."""
+    return isinstance(valeur, str) and valeur.startswith(PREFIXE + "$") and valeur.count("$") == 5
+
+def verifier(mot_de_passe: str, empreinte: str) -> tuple:
+    """
+    Vérifie un mot de passe contre une empreinte stockée.
+
+    Les mots de passe enregistrés en clair avant l'introduction des empreintes
+    sont acceptés, et signalés comme à recalculer.
+
+    Parameters
+    ----------
+    mot_de_passe : str
+        Le mot de passe fourni.
+    empreinte : str
+        La valeur stockée dans la base.
+
+    Returns
+    -------
+    tuple
+        ``(valide, a_recalculer)`` : ``a_recalculer`` est vrai si le mot de passe
+        est valide mais stocké en clair ou avec d'anciens paramètres de coût.
+    """
+    if not isinstance(empreinte, str) or mot_de_passe is None:
+        return False, False
+    if not est_empreinte(empreinte):
+        valide = hmac.compare_digest(mot_de_passe.encode("utf-8"), empreinte.encode("utf-8"))
+        return valide, valide
+
+    _, n, r, p, sel, cle = empreinte.split("$")
+    n, r, p = int(n), int(r), int(p)
+    attendue = base64.b64decode(cle)
+    calculee = hashlib.scrypt(mot_de_passe.encode("utf-8"), salt=base64.b64decode(sel), n=n, r=r, p=p,
+                              maxmem=_memoire_max(n, r, p), dklen=len(attendue))
+    valide = hmac.compare_digest(calculee, attendue)
+    a_jour = (n, r, p) == (config_identifiants["n"], config_identifiants["r"], config_identifiants["p"])
+    return valide, valide and not a_jour
+
+executeur_empreintes: ThreadPoolExecutor = ThreadPoolExecutor(
+    max_workers=config_identifiants["threads"],
+    thread_name_prefix="empreintes"
+)
+_places: asyncio.Semaphore = asyncio.Semaphore(config_identifiants["calculs_max"])
+
+async def executer(fonction, *args):
+    """
+    Exécute une opération qui calcule des empreintes dans le pool dédié.
+
+    Le calcul d'une empreinte prend plusieurs dizaines de millisecondes : il
+    ne doit pas bloquer la boucle d'événements. Le nombre de calculs admis
+    simultanément est borné ; au-delà de ``attente_max`` d'attente, la demande
+    est refusée pour protéger le serveur d'un afflux de connexions.
+
+    Parameters
+    ----------
+    fonction : Callable
+        La fonction (synchrone) à exécuter, par exemple ``Personne.auth``.
+    *args
+        Ses arguments.
+
+    Raises
+    ------
+    IdentifiantsSatures
+        Si aucune place ne s'est libérée à temps.
+    """
+    try:
+        await asyncio.wait_for(_places.acquire(), timeout=config_identifiants["attente_max"])
+    except asyncio.TimeoutError:
+        calculs_refuses.inc()
+        raise IdentifiantsSatures("Trop de connexions simultanées")
+    try:
+        contexte = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(executeur_empreintes, contexte.run, fonction, *args)
+    finally:
+        _places.release()
@@ -1,56 +1,250 @@
-from fastapi import FastAPI, Request
+import atexit
+import json
 import logging
+import queue
+import random
 import time
-from starlette.middleware.base import BaseHTTPMiddleware
+from logging.handlers import QueueHandler, QueueListener
+from urllib.parse import parse_qsl
+from profiling import config_profil
 
-# Configuration de base du logger pour afficher les messages d'information
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+#########################
+##### Configuration #####
+#########################
+
+config_log: dict = {
+    "niveau": logging.INFO,
+    "taux_echantillonnage": 1.0,  # Part des requêtes réussies qui sont journalisées (les erreurs le sont toujours)
+    "verbosite_defaut": "normal",  # "minimal", "normal" ou "complet"
+    "verbosite_routes": {  # Verbosité par préfixe de route
+        "/user/auth": "minimal",
+        "/user/create": "minimal",
+        "/user/update": "minimal",
+    },
+    "log_corps": False,  # Le corps des requêtes n'est jamais lu sauf activation explicite
+    "taille_max_corps": 2048,  # Nombre maximal d'octets de corps conservés pour le journal
+    "champs_sensibles": {
+        "password", "cookie", "set-cookie", "authorization", "session", "photo",
+        # Jeton de profilage, en paramètre de requête ou en en-tête
+        config_profil["parametre"], config_profil["en_tete"],
+    },
+}
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class JsonFormatter(logging.Formatter):
     """
-    Middleware pour enregistrer les détails des requêtes et des réponses.
+    Formateur qui écrit chaque enregistrement sous la forme d'une ligne JSON.
 
-    Ce middleware enregistre les informations sur les requêtes entrantes, 
-    y compris les en-têtes, le corps, le statut de la réponse et le temps d'exécution.
+    Les champs structurés passés via ``extra={"donnees": {...}}`` sont fusionnés
+    à la racine de l'objet JSON.
     """
 
-    async def dispatch(self, request: Request, call_next):
+    def format(self, record: logging.LogRecord) -> str:
         """
-        Intercepte la requête, enregistre les détails, et traite la réponse.
+        Sérialise l'enregistrement en JSON.
 
         Parameters
         ----------
-        request : Request
-            L'objet de requête FastAPI représentant la requête HTTP entrante.
-        call_next : Callable
-            Fonction qui traite la requête et retourne la réponse.
+        record : logging.LogRecord
+            L'enregistrement à formater.
 
         Returns
         -------
-        Response
-            La réponse HTTP retournée après le traitement de la requête.
+        str
+            La ligne JSON correspondante.
         """
-        start_time = time.time()  # Démarre le chronomètre pour le temps de traitement
+        ligne: dict = {
+            "ts": round(record.created, 3),
+            "niveau": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        ligne.update(getattr(record, "donnees", {}))
+        if record.exc_info:
+            ligne["exception"] = self.formatException(record.exc_info)
+        return json.dumps(ligne, ensure_ascii=False, default=str)
+
+def configurer_logging(niveau: int = logging.INFO) -> QueueListener:
+    """
+    Configure le logger racine pour écrire via une file d'attente.
+
+    Les appels de journalisation ne font que déposer l'enregistrement dans une
+    file ; l'écriture effective (formatage JSON et I/O) est faite par un thread
+    dédié, en dehors de la boucle d'événements.
+
+    Parameters
+    ----------
+    niveau : int
+        Le niveau de journalisation du logger racine.
+
+    Returns
+    -------
+    QueueListener
+        Le thread d'écriture démarré.
+    """
+    file_logs: queue.SimpleQueue = queue.SimpleQueue()
+
+    sortie = logging.StreamHandler()
+    sortie.setFormatter(JsonFormatter())
+
+    racine = logging.getLogger()
+    racine.handlers = [QueueHandler(file_logs)]
+    racine.setLevel(niveau)
+
+    listener = QueueListener(file_logs, sortie, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+listener: QueueListener = configurer_logging(config_log["niveau"])
+logger = logging.getLogger(__name__)
+
+def masquer(donnees, champs_sensibles: set = None):
+    """
+    Remplace les valeurs des champs sensibles par ``"***"``.
+
+    Parameters
+    ----------
+    donnees : Any
+        Un dictionnaire (éventuellement imbriqué), une liste ou une valeur simple.
+    champs_sensibles : set, optional
+        Les noms de champs à masquer (par défaut ceux de ``config_log``).
+
+    Returns
+    -------
+    Any
+        Une copie des données avec les champs sensibles masqués.
+    """
+    champs = champs_sensibles if champs_sensibles is not None else config_log["champs_sensibles"]
+    if isinstance(donnees, dict):
+        return {
+            cle: "***" if str(cle).lower() in champs else masquer(valeur, champs)
+            for cle, valeur in donnees.items()
+        }
+    if isinstance(donnees, list):
+        return [masquer(valeur, champs) for valeur in donnees]
+    return donnees
+
+def decoder_corps(corps: bytes, content_type: str):
+    """
+    Décode un corps de requête pour la journalisation, sans les champs sensibles.
+
+    Parameters
+    ----------
+    corps : bytes
+        Le début du corps de la requête (tronqué à ``taille_max_corps``).
+    content_type : str
+        L'en-tête Content-Type de la requête.
+
+    Returns
+    -------
+    Any
+        Le corps décodé et masqué, ou un résumé si le format n'est pas lisible.
+    """
+    try:
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            return masquer(dict(parse_qsl(corps.decode("utf-8"))))
+        if content_type.startswith("application/json"):
+            return masquer(json.loads(corps))
+    except (UnicodeDecodeError, ValueError):
+        pass
+    return f"<{len(corps)} octets {content_type or 'inconnu'}>"
+
+class RequestLoggingMiddleware:
+    """
+    Middleware ASGI pour enregistrer les détails des requêtes et des réponses.
+
+    Chaque requête produit une ligne JSON (méthode, route, statut, durée...).
+    Le niveau de détail dépend de la route, les requêtes réussies peuvent être
+    échantillonnées et le corps n'est lu que si ``log_corps`` est activé ; il est
+    alors capturé au fil de l'eau, sans être mis en mémoire tampon en entier.
+    """
+
+    def __init__(self, app, **options):
+        """
+        Parameters
+        ----------
+        app : ASGIApp
+            L'application ASGI suivante dans la chaîne.
+        **options
+            Surcharges des clés de ``config_log``.
+        """
+        self.app = app
+        self.config: dict = {**config_log, **options}
+
+    def verbosite(self, path: str) -> str:
+        """Retourne la verbosité configurée pour un chemin (préfixe le plus long)."""
+        meilleur: str = ""
+        for prefixe in self.config["verbosite_routes"]:
+            if path.startswith(prefixe) and len(prefixe) > len(meilleur):
+                meilleur = prefixe
+        return self.config["verbosite_routes"].get(meilleur, self.config["verbosite_defaut"])
+
+    async def __call__(self, scope, receive, send):
+        """
+        Intercepte la requête, enregistre les détails, et traite la réponse.
+
+        Parameters
+        ----------
+        scope : dict
+            Le scope ASGI de la requête.
+        receive : Callable
+            Le canal de réception des messages ASGI.
+        send : Callable
+            Le canal d'envoi des messages ASGI.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()  # Démarre le chronomètre pour le temps de traitement
+        verbosite: str = self.verbosite(scope["path"])
+        capturer_corps: bool = self.config["log_corps"] and verbosite == "complet"
+        corps = bytearray()
+        reponse: dict = {"status": 500, "taille": 0}
+
+        async def receive_wrapper():
+            message = await receive()
+            if capturer_corps and message["type"] == "http.request":
+                reste = self.config["taille_max_corps"] - len(corps)
+                if reste > 0:
+                    corps.extend(message.get("body", b"")[:reste])
+            return message
 
-        # Enregistre les détails de la requête
-        logger.info(f"Request: {request.method} {request.url}")
-        logger.info(f"Request Headers: {request.headers}")
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                reponse["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                reponse["taille"] += len(message.get("body", b""))
+            await send(message)
 
-        # Enregistre le corps de la requête pour les méthodes POST, PUT, et DELETE
-        if request.method in ["POST", "PUT", "DELETE"]:
-            body = await request.body()
-            logger.info(f"Request Body: {body.decode('utf-8')}")
+        try:
+            await self.app(scope, receive_wrapper if capturer_corps else receive, send_wrapper)
+        finally:
+            if reponse["status"] >= 500 or random.random() < self.config["taux_echantillonnage"]:
+                self.journaliser(scope, verbosite, reponse, bytes(corps) if capturer_corps else None,
+                                 time.perf_counter() - start_time)
 
-        # Traite la requête en appelant la fonction suivante dans la chaîne de middleware
-        response = await call_next(request)
+    def journaliser(self, scope: dict, verbosite: str, reponse: dict, corps, duree: float) -> None:
+        """Construit et émet la ligne de journal d'une requête terminée."""
+        route = scope.get("route")
+        donnees: dict = {
+            "methode": scope["method"],
+            "chemin": scope["path"],
+            "route": getattr(route, "path", None),
+            "statut": reponse["status"],
+            "duree_ms": round(duree * 1000, 2),
+        }
 
-        # Enregistre le statut et les en-têtes de la réponse
-        logger.info(f"Response Status: {response.status_code}")
-        logger.info(f"Response Headers: {response.headers}")
+        if verbosite in ("normal", "complet"):
+            donnees["query"] = masquer(dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))))
+            donnees["client"] = scope["client"][0] if scope.get("client") else None
+            donnees["taille_reponse"] = reponse["taille"]
 
-        # Calcule et enregistre le temps d'exécution total de la requête
-        duration = time.time() - start_time
-        logger.info(f"Processed {request.method} {request.url} in {duration:.2f} seconds")
+        if verbosite == "complet":
+            en_tetes = {cle.decode("latin-1"): valeur.decode("latin-1") for cle, valeur in scope["headers"]}
+            donnees["en_tetes"] = masquer(en_tetes)
+            if corps is not None:
+                donnees["corps"] = decoder_corps(corps, en_tetes.get("content-type", ""))
 
-        return response
+        niveau = logging.ERROR if reponse["status"] >= 500 else logging.INFO
+        logger.log(niveau, "requete", extra={"donnees": donnees})
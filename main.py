@@ -1,13 +1,29 @@
 from fastapi import FastAPI, Request, Depends, HTTPException
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, PlainTextResponse
 import uvicorn
 from route.user_route import router as user_router
 from route.cave_route import router as cave_router
 from route.bouteille_route import router as bouteille_router
 from route.etagere_route import router as etagere_router
+from route.tache_route import router as tache_router
+from route.sync_route import router as sync_router
+from route.api_route import router as api_router, ErreurAPI, reponse_erreur
+from route.batch_route import router as batch_router
 from route.dependencies import get_user_cookies, config_db
-from log import RequestLoggingMiddleware
+from log import RequestLoggingMiddleware, logger
+from metrics import MetricsMiddleware, registre, nom_route
+from timing import ServerTimingMiddleware
+from budget import BudgetMiddleware
+from profiling import ProfilingMiddleware
+from capture import CaptureMiddleware
+from admission import AdmissionMiddleware
+from delais import DelaiMiddleware, delais_depasses, config_delais
+from Classes.connexiondb import DeadlineExceeded
+from outils.audit_requetes import activer_enregistrement
+from templating import templates
+from session import config_session
+from taches import file_taches
+from tampon import tampon_ecritures
 
 #########################
 ##### Configuration #####
@@ -17,9 +33,16 @@ app = FastAPI()  # Création de l'application FastAPI
 
 # Insertion des routes d'étagère
 app.include_router(etagere_router, prefix="/etagere", tags=["etagere"])
-templates = Jinja2Templates(directory="templates")  # Configuration du moteur de templates Jinja2
-app.secret_key = 'wm7ze*2b'  # Clé secrète pour l'application
+app.secret_key = config_session["secret"]  # Clé secrète pour l'application (signature des sessions)
 app.add_middleware(RequestLoggingMiddleware)  # Ajout du middleware pour l'enregistrement des requêtes
+app.add_middleware(CaptureMiddleware)  # Ajout de la capture du trafic pour le rejeu (CAVEAVIN_CAPTURE=1)
+app.add_middleware(MetricsMiddleware)  # Ajout du middleware de mesure des latences
+app.add_middleware(BudgetMiddleware)  # Ajout du contrôle du nombre d'opérations MongoDB par requête
+app.add_middleware(ServerTimingMiddleware)  # Ajout de l'en-tête Server-Timing (MongoDB, modèles, templates)
+app.add_middleware(ProfilingMiddleware)  # Ajout du profilage à la demande (jeton X-Profil ou échantillonnage)
+app.add_middleware(AdmissionMiddleware)  # Ajout du contrôle d'admission par classe de routes (503 + Retry-After)
+app.add_middleware(DelaiMiddleware)  # Ajout de l'échéance par route, transmise à MongoDB (maxTimeMS)
+activer_enregistrement()  # Enregistre les formes de requêtes MongoDB si CAVEAVIN_AUDIT_FICHIER est défini
 
 #######################
 ##### Main Routes #####
@@ -30,6 +53,22 @@ app.include_router(user_router, prefix="/user", tags=["user"])
 app.include_router(bouteille_router, prefix="/bottle", tags=["bottle"])
 app.include_router(etagere_router, prefix="/etagere", tags=["etagere"])
 app.include_router(cave_router, prefix="/cave", tags=["cave"])
+app.include_router(tache_router, prefix="/taches", tags=["taches"])
+app.include_router(sync_router, prefix="/sync", tags=["sync"])  # Synchronisation incrémentale (journal des modifications)
+app.include_router(api_router, prefix="/api/v1", tags=["api"])  # API JSON versionnée (bouteilles, caves, étagères, notes, commentaires)
+app.include_router(batch_router, prefix="/api/batch", tags=["api"])  # Lots de sous-opérations en une requête
+
+@app.on_event("startup")
+async def demarrer_taches():
+    """Démarre la file des tâches d'arrière-plan (archivage, suppressions, imports...) et le tampon d'écriture."""
+    await file_taches.demarrer()
+    await tampon_ecritures.demarrer()  # Tampon d'écriture des commentaires et notes (CAVEAVIN_TAMPON=1)
+
+@app.on_event("shutdown")
+async def arreter_taches():
+    """Vide le tampon d'écriture et arrête la file des tâches en laissant finir celles en cours."""
+    await tampon_ecritures.arreter()
+    await file_taches.arreter()
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request, user_cookies: dict = Depends(get_user_cookies)):
@@ -53,6 +92,19 @@ async def index(request: Request, user_cookies: dict = Depends(get_user_cookies)
         **user_cookies  # Inclusion des cookies de l'utilisateur dans le contexte du template
     })
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Expose les métriques de l'application au format texte Prometheus.
+
+    Returns
+    -------
+    PlainTextResponse
+        Les histogrammes de latence par route, les compteurs MongoDB par
+        collection et les statistiques du pool et des caches.
+    """
+    return PlainTextResponse(registre.exposer(), media_type="text/plain; version=0.0.4")
+
 @app.get("/error", response_class=HTMLResponse)
 async def not_found(request: Request):
     """
@@ -68,7 +120,7 @@ async def not_found(request: Request):
     HTMLResponse
         La réponse contenant le rendu du template error.html.
     """
-    print(f"<!> 404 error for request: {request.method} {request.url}")
+    logger.warning("404 error for request: %s %s", request.method, request.url.path)
     return templates.TemplateResponse("error.html", {"request": request})
 
 @app.exception_handler(404)
@@ -88,7 +140,7 @@ async def custom_404_handler(request: Request, exc):
     HTMLResponse
         La réponse contenant le rendu du template error.html avec un statut 404.
     """
-    print(f"<!> 404 error for request: {request.method} {request.url} <!>")
+    logger.warning("404 error for request: %s %s", request.method, request.url.path)
     return templates.TemplateResponse("error.html", {"request": request}, status_code=404)
 
 # Définition du gestionnaire d'exception HTTP par défaut
@@ -134,6 +186,51 @@ async def custom_http_exception_handler(request: Request, exc: HTTPException):
     # Pour d'autres exceptions HTTP, utilise le gestionnaire par défaut
     return await http_exception_handler(request, exc)
 
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    """
+    Gestionnaire d'exception pour les requêtes qui ont dépassé leur échéance.
+
+    Parameters
+    ----------
+    request : Request
+        L'objet de requête FastAPI représentant la requête HTTP entrante.
+    exc : DeadlineExceeded
+        L'exception levée par Connexdb quand le délai de la requête est écoulé.
+
+    Returns
+    -------
+    HTMLResponse
+        La réponse contenant le rendu du template unavailable.html avec un statut 503.
+    """
+    delais_depasses.inc(nom_route(request.scope))
+    logger.warning("Deadline exceeded for request %s %s: %s", request.method, request.url.path, exc)
+    return templates.TemplateResponse(
+        "unavailable.html",
+        {"request": request},
+        status_code=503,
+        headers={"Retry-After": str(config_delais["retry_after"])}
+    )
+
+@app.exception_handler(ErreurAPI)
+async def erreur_api_handler(request: Request, exc: ErreurAPI):
+    """
+    Gestionnaire d'exception pour les erreurs des routes de l'API JSON.
+
+    Parameters
+    ----------
+    request : Request
+        L'objet de requête FastAPI représentant la requête HTTP entrante.
+    exc : ErreurAPI
+        L'erreur levée par une route de /api/v1.
+
+    Returns
+    -------
+    ReponseJSON
+        Le statut et le message de l'erreur, en JSON plutôt qu'en page HTML.
+    """
+    return reponse_erreur(exc)
+
 # Exemple de route qui génère une erreur 403
 @app.get("/restricted")
 async def restricted_route():
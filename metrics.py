@@ -0,0 +1,266 @@
+import bisect
+import threading
+import time
+from typing import Callable
+from Classes.connexiondb import Connexdb, operation_listeners
+from cache import fragment_cache, reponses_cache
+from session import sessions
+
+#########################
+##### Configuration #####
+#########################
+
+config_metrics: dict = {
+    "buckets": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+}
+
+def _labels(noms: tuple, valeurs: tuple) -> str:
+    """Formate les labels d'un échantillon au format texte Prometheus."""
+    if not noms:
+        return ""
+    paires = []
+    for nom, valeur in zip(noms, valeurs):
+        valeur = str(valeur).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        paires.append(f'{nom}="{valeur}"')
+    return "{" + ",".join(paires) + "}"
+
+class Metrique:
+    """
+    Classe de base des métriques : un nom, une aide et des séries indexées par labels.
+
+    Attributes
+    ----------
+    nom : str
+        Le nom de la métrique.
+    aide : str
+        La description de la métrique.
+    labels : tuple
+        Les noms des labels de la métrique.
+    """
+
+    type_: str = "untyped"
+
+    def __init__(self, nom: str, aide: str, labels: tuple = ()):
+        self.nom = nom
+        self.aide = aide
+        self.labels = tuple(labels)
+        self._series: dict = {}
+        self._lock = threading.Lock()
+
+    def exposer(self) -> list:
+        """Retourne les lignes de la métrique au format texte Prometheus."""
+        lignes = [f"# HELP {self.nom} {self.aide}", f"# TYPE {self.nom} {self.type_}"]
+        with self._lock:
+            for valeurs, serie in sorted(self._series.items()):
+                lignes.extend(self._lignes_serie(valeurs, serie))
+        return lignes
+
+    def _lignes_serie(self, valeurs: tuple, serie) -> list:
+        return [f"{self.nom}{_labels(self.labels, valeurs)} {serie}"]
+
+class Compteur(Metrique):
+    """Compteur monotone."""
+
+    type_ = "counter"
+
+    def inc(self, *valeurs, montant: float = 1) -> None:
+        """Incrémente la série correspondant aux valeurs de labels données."""
+        with self._lock:
+            self._series[valeurs] = self._series.get(valeurs, 0) + montant
+
+class Jauge(Metrique):
+    """Valeur instantanée pouvant monter et descendre."""
+
+    type_ = "gauge"
+
+    def inc(self, *valeurs, montant: float = 1) -> None:
+        """Incrémente la série correspondant aux valeurs de labels données."""
+        with self._lock:
+            self._series[valeurs] = self._series.get(valeurs, 0) + montant
+
+    def dec(self, *valeurs, montant: float = 1) -> None:
+        """Décrémente la série correspondant aux valeurs de labels données."""
+        self.inc(*valeurs, montant=-montant)
+
+    def set(self, *valeurs, valeur: float) -> None:
+        """Fixe la valeur de la série correspondant aux valeurs de labels données."""
+        with self._lock:
+            self._series[valeurs] = valeur
+
+class Histogramme(Metrique):
+    """Histogramme cumulatif à buckets fixes."""
+
+    type_ = "histogram"
+
+    def __init__(self, nom: str, aide: str, labels: tuple = (), buckets: tuple = None):
+        super().__init__(nom, aide, labels)
+        self.buckets = tuple(buckets or config_metrics["buckets"])
+
+    def observer(self, *valeurs, valeur: float) -> None:
+        """Ajoute une observation à la série correspondant aux valeurs de labels données."""
+        with self._lock:
+            serie = self._series.get(valeurs)
+            if serie is None:
+                serie = self._series[valeurs] = [[0] * len(self.buckets), 0, 0.0]
+            index = bisect.bisect_left(self.buckets, valeur)
+            if index < len(self.buckets):
+                serie[0][index] += 1
+            serie[1] += 1
+            serie[2] += valeur
+
+    def _lignes_serie(self, valeurs: tuple, serie) -> list:
+        compteurs, total, somme = serie
+        lignes, cumul = [], 0
+        for borne, compte in zip(self.buckets, compteurs):
+            cumul += compte
+            lignes.append(f"{self.nom}_bucket{_labels(self.labels + ('le',), valeurs + (borne,))} {cumul}")
+        lignes.append(f"{self.nom}_bucket{_labels(self.labels + ('le',), valeurs + ('+Inf',))} {total}")
+        lignes.append(f"{self.nom}_count{_labels(self.labels, valeurs)} {total}")
+        lignes.append(f"{self.nom}_sum{_labels(self.labels, valeurs)} {somme}")
+        return lignes
+
+class Registre:
+    """
+    Registre des métriques de l'application.
+
+    Les collecteurs sont des fonctions appelées au moment de l'exposition pour
+    les statistiques tenues ailleurs (pool de connexions, caches...).
+    """
+
+    def __init__(self):
+        self._metriques: list = []
+        self._collecteurs: list = []
+
+    def enregistrer(self, metrique: Metrique) -> Metrique:
+        """Ajoute une métrique au registre et la retourne."""
+        self._metriques.append(metrique)
+        return metrique
+
+    def compteur(self, nom: str, aide: str, labels: tuple = ()) -> Compteur:
+        return self.enregistrer(Compteur(nom, aide, labels))
+
+    def jauge(self, nom: str, aide: str, labels: tuple = ()) -> Jauge:
+        return self.enregistrer(Jauge(nom, aide, labels))
+
+    def histogramme(self, nom: str, aide: str, labels: tuple = (), buckets: tuple = None) -> Histogramme:
+        return self.enregistrer(Histogramme(nom, aide, labels, buckets))
+
+    def collecteur(self, nom: str, aide: str, fonction: Callable[[], dict], label: str = "stat") -> None:
+        """
+        Enregistre un collecteur exposé comme une jauge.
+
+        Parameters
+        ----------
+        nom : str
+            Le nom de la jauge exposée.
+        aide : str
+            La description de la jauge.
+        fonction : Callable[[], dict]
+            Fonction retournant un dictionnaire ``{valeur_du_label: valeur}``.
+        label : str
+            Le nom du label portant les clés du dictionnaire.
+        """
+        self._collecteurs.append((nom, aide, fonction, label))
+
+    def exposer(self) -> str:
+        """Retourne toutes les métriques au format texte Prometheus."""
+        lignes: list = []
+        for metrique in self._metriques:
+            lignes.extend(metrique.exposer())
+        for nom, aide, fonction, label in self._collecteurs:
+            lignes.extend([f"# HELP {nom} {aide}", f"# TYPE {nom} gauge"])
+            for cle, valeur in sorted(fonction().items()):
+                lignes.append(f"{nom}{_labels((label,), (cle,))} {valeur}")
+        return "\n".join(lignes) + "\n"
+
+registre: Registre = Registre()
+
+###############################
+##### Métriques standards #####
+###############################
+
+requetes_duree = registre.histogramme(
+    "caveavin_http_request_duration_seconds",
+    "Durée des requêtes HTTP par route et statut.",
+    ("methode", "route", "statut")
+)
+requetes_en_cours = registre.jauge(
+    "caveavin_http_requests_in_flight",
+    "Nombre de requêtes HTTP en cours de traitement.",
+    ("methode",)
+)
+db_operations = registre.compteur(
+    "caveavin_db_operations_total",
+    "Nombre d'opérations MongoDB par collection, opération et résultat.",
+    ("collection", "operation", "resultat")
+)
+db_duree = registre.histogramme(
+    "caveavin_db_operation_duration_seconds",
+    "Durée des opérations MongoDB par collection et opération.",
+    ("collection", "operation")
+)
+registre.collecteur(
+    "caveavin_db_pool",
+    "Statistiques du pool de connexions MongoDB partagé.",
+    Connexdb.pool_statistics
+)
+registre.collecteur(
+    "caveavin_fragment_cache",
+    "Statistiques du cache de fragments HTML.",
+    fragment_cache.stats
+)
+registre.collecteur(
+    "caveavin_response_cache",
+    "Statistiques du cache de réponses rendues.",
+    reponses_cache.stats
+)
+registre.collecteur(
+    "caveavin_sessions",
+    "Statistiques du cache de sessions.",
+    sessions.stats
+)
+
+def _observer_operation(collection: str, operation: str, query, duree: float, erreur, details: dict = None) -> None:
+    """Alimente les métriques MongoDB à chaque opération de Connexdb."""
+    db_operations.inc(collection, operation, "erreur" if erreur else "ok")
+    db_duree.observer(collection, operation, valeur=duree)
+
+operation_listeners.append(_observer_operation)
+
+def nom_route(scope: dict) -> str:
+    """Retourne le modèle de route d'une requête (``/bottle/{nom_bouteille}``) plutôt que son chemin."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "<non_route>"
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI mesurant la latence et le nombre de requêtes en cours.
+
+    La latence est agrégée par modèle de route pour garder un nombre de séries
+    borné, quel que soit le nombre de bouteilles ou de caves.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        methode: str = scope["method"]
+        statut: dict = {"code": 500}
+        start_time = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                statut["code"] = message["status"]
+            await send(message)
+
+        requetes_en_cours.inc(methode)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            requetes_en_cours.dec(methode)
+            requetes_duree.observer(methode, nom_route(scope), statut["code"],
+                                    valeur=time.perf_counter() - start_time)
@@ -0,0 +1,266 @@
+"""
+Auditeur des plans d'exécution des requêtes MongoDB.
+
+Deux temps :
+
+1. Enregistrement : avec ``CAVEAVIN_AUDIT_FICHIER=formes.json``, l'application
+   (tests, benchmarks...) enregistre chaque forme de requête émise par Connexdb
+   avec un exemple de filtre, son tri et sa projection. Les écritures sont
+   enregistrées par leur sélection (filtre des update, delete et
+   findAndModify), les aggregate par leurs étapes ``$match`` / ``$sort`` de tête.
+2. Audit : ``python -m outils.audit_requetes formes.json`` exécute ``explain()``
+   sur chaque forme contre un mongod local et signale les COLLSCAN, les tris en
+   mémoire, les ratios documents examinés / retournés et les index manquants.
+   Le code de sortie est non nul en cas de régression par rapport à la référence.
+"""
+import argparse
+import atexit
+import json
+import os
+import sys
+import threading
+from bson import json_util
+from route.dependencies import config_db
+from Classes.connexiondb import Connexdb, operation_listeners
+from budget import forme_requete
+
+# Opérations dont le filtre peut être expliqué comme un find
+OPERATIONS_FILTRE: set = {
+    "find", "find_one", "delete_one", "delete_many", "update_one", "update_many", "find_one_and_update",
+}
+
+# Opérations qui s'arrêtent au premier document : expliquées avec ``limit: 1``
+OPERATIONS_UNITAIRES: set = {"find_one", "delete_one", "update_one", "find_one_and_update"}
+
+class EnregistreurFormes:
+    """
+    Enregistre les formes de requête émises par Connexdb.
+
+    Attributes
+    ----------
+    formes : dict
+        Pour chaque forme : la collection, l'opération, un exemple de filtre,
+        le tri, la projection (ou, pour un aggregate, les étapes de tête du
+        pipeline) et le nombre d'occurrences.
+    """
+
+    def __init__(self):
+        self.formes: dict = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, collection: str, operation: str, query, duree: float, erreur, details: dict = None) -> None:
+        details = details or {}
+        if operation == "aggregate":
+            pipeline = prefixe_pipeline(details.get("pipeline") or [])
+            if not pipeline:
+                return
+            filtre, tri = filtre_pipeline(pipeline), tri_pipeline(pipeline)
+            entree = {"collection": collection, "operation": operation, "filtre": filtre, "tri": tri,
+                      "pipeline": pipeline}
+        elif operation in OPERATIONS_FILTRE and query is not None:
+            tri = _couples(details.get("sort"))
+            entree = {"collection": collection, "operation": operation, "filtre": query, "tri": tri,
+                      "projection": details.get("projection")}
+        else:
+            return
+
+        forme = forme_requete(collection, operation, entree["filtre"], tri, entree.get("projection"))
+        with self._lock:
+            connue = self.formes.get(forme)
+            if connue is None:
+                self.formes[forme] = {**entree, "occurrences": 1}
+            else:
+                connue["occurrences"] += 1
+
+    def ecrire(self, chemin: str) -> None:
+        """Écrit les formes enregistrées (fusionnées avec celles déjà présentes dans le fichier)."""
+        formes = charger_formes(chemin) if os.path.exists(chemin) else {}
+        with self._lock:
+            for forme, entree in self.formes.items():
+                if forme in formes:
+                    formes[forme]["occurrences"] += entree["occurrences"]
+                else:
+                    formes[forme] = entree
+        with open(chemin, "w", encoding="utf-8") as fichier:
+            fichier.write(json_util.dumps(formes, indent=2, ensure_ascii=False))
+
+def activer_enregistrement(chemin: str = None) -> EnregistreurFormes:
+    """
+    Active l'enregistrement des formes de requête si un fichier est configuré.
+
+    Parameters
+    ----------
+    chemin : str, optional
+        Le fichier de sortie (par défaut la variable ``CAVEAVIN_AUDIT_FICHIER``).
+
+    Returns
+    -------
+    EnregistreurFormes
+        L'enregistreur actif, ou None si aucun fichier n'est configuré.
+    """
+    chemin = chemin or os.environ.get("CAVEAVIN_AUDIT_FICHIER")
+    if not chemin:
+        return None
+    enregistreur = EnregistreurFormes()
+    operation_listeners.append(enregistreur)
+    atexit.register(enregistreur.ecrire, chemin)
+    return enregistreur
+
+def _couples(tri) -> list:
+    """Retourne un tri (liste de couples ou dictionnaire) sous forme de couples ``[champ, sens]``, ou None."""
+    if not tri:
+        return None
+    return [[cle, sens] for cle, sens in (tri.items() if isinstance(tri, dict) else tri)]
+
+def prefixe_pipeline(pipeline: list) -> list:
+    """
+    Retourne les étapes ``$match`` et ``$sort`` de tête d'un pipeline, les seules servies par un index.
+
+    Un ``$limit`` de tête est gardé : appliqué avec le tri par le moteur de
+    requête, il borne les documents examinés et rend le ratio représentatif.
+    """
+    prefixe = []
+    for etape in pipeline:
+        if not isinstance(etape, dict) or set(etape) - {"$match", "$sort", "$limit"}:
+            break
+        prefixe.append(etape)
+    return prefixe
+
+def filtre_pipeline(prefixe: list) -> dict:
+    """Réunit les filtres des étapes ``$match`` d'un préfixe de pipeline."""
+    filtre: dict = {}
+    for etape in prefixe:
+        filtre.update(etape.get("$match", {}))
+    return filtre
+
+def tri_pipeline(prefixe: list) -> list:
+    """Retourne le dernier tri ``$sort`` d'un préfixe de pipeline (celui qui ordonne le résultat), ou None."""
+    tris = [etape["$sort"] for etape in prefixe if "$sort" in etape]
+    return _couples(tris[-1]) if tris else None
+
+def charger_formes(chemin: str) -> dict:
+    """Charge un fichier de formes écrit par ``EnregistreurFormes.ecrire``."""
+    with open(chemin, encoding="utf-8") as fichier:
+        return json_util.loads(fichier.read())
+
+def _etapes(plan: dict) -> list:
+    """Retourne la liste des étapes (COLLSCAN, IXSCAN, FETCH...) d'un plan d'exécution."""
+    etapes = [plan.get("stage")]
+    for cle in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(cle), dict):
+            etapes.extend(_etapes(plan[cle]))
+    for sous_plan in plan.get("inputStages", []):
+        etapes.extend(_etapes(sous_plan))
+    return [etape for etape in etapes if etape]
+
+def expliquer(db, entree: dict) -> dict:
+    """
+    Exécute ``explain`` sur une forme de requête et résume le plan.
+
+    Parameters
+    ----------
+    db : Database
+        La base de données MongoDB.
+    entree : dict
+        L'entrée de la forme (collection, opération, filtre, tri, projection ou pipeline).
+
+    Returns
+    -------
+    dict
+        Les étapes du plan gagnant, les documents et clés examinés, les
+        documents retournés, le ratio examinés / retournés et l'index suggéré
+        (champs du filtre puis du tri).
+    """
+    if entree["operation"] == "aggregate":
+        commande: dict = {"aggregate": entree["collection"], "pipeline": entree["pipeline"], "cursor": {}}
+    else:
+        commande = {"find": entree["collection"], "filter": entree["filtre"]}
+        if entree.get("tri"):
+            commande["sort"] = {cle: sens for cle, sens in entree["tri"]}
+        if entree.get("projection"):
+            commande["projection"] = entree["projection"]
+        if entree["operation"] in OPERATIONS_UNITAIRES:
+            commande["limit"] = 1
+    explication = db.command("explain", commande, verbosity="executionStats")
+    if "stages" in explication:
+        # Aggregate dont le préfixe n'est pas absorbé par la requête : le plan est dans l'étape $cursor
+        explication = explication["stages"][0].get("$cursor", {})
+
+    plan = explication.get("queryPlanner", {}).get("winningPlan", {})
+    stats = explication.get("executionStats", {})
+    etapes = _etapes(plan)
+    examines = stats.get("totalDocsExamined", 0)
+    retournes = stats.get("nReturned", 0)
+    collscan, tri_memoire = "COLLSCAN" in etapes, "SORT" in etapes
+    index: dict = {cle: 1 for cle in entree["filtre"] if not str(cle).startswith("$")}
+    for cle, sens in entree.get("tri") or []:
+        index.setdefault(cle, sens)
+
+    return {
+        "etapes": etapes,
+        "collscan": collscan,
+        "tri_memoire": tri_memoire,
+        "docs_examines": examines,
+        "cles_examinees": stats.get("totalKeysExamined", 0),
+        "docs_retournes": retournes,
+        "ratio": examines / max(retournes, 1),
+        "index_suggere": index if (collscan or tri_memoire) and index else None,
+    }
+
+def auditer(db, formes: dict, reference: dict, ratio_max: float) -> tuple:
+    """
+    Audite toutes les formes et retourne le rapport et la liste des régressions.
+
+    Une régression est un COLLSCAN ou un tri en mémoire absent de la
+    référence, ou un ratio documents examinés / retournés supérieur à
+    ``ratio_max`` (et à celui de la référence).
+    """
+    rapport, regressions = {}, []
+    for forme, entree in sorted(formes.items()):
+        resultat = expliquer(db, entree)
+        resultat["occurrences"] = entree.get("occurrences", 1)
+        rapport[forme] = resultat
+
+        connu = reference.get(forme, {})
+        if resultat["collscan"] and not connu.get("collscan"):
+            regressions.append(f"COLLSCAN : {forme} (index suggéré : {resultat['index_suggere']})")
+        if resultat["tri_memoire"] and not connu.get("tri_memoire"):
+            regressions.append(f"tri en mémoire : {forme} (index suggéré : {resultat['index_suggere']})")
+        if resultat["ratio"] > max(ratio_max, connu.get("ratio", 0)):
+            regressions.append(f"ratio {resultat['ratio']:.1f} : {forme}")
+    return rapport, regressions
+
+def main(argv: list = None) -> int:
+    """Point d'entrée en ligne de commande de l'auditeur."""
+    parser = argparse.ArgumentParser(description="Audit des plans d'exécution des requêtes MongoDB de caveavin.")
+    parser.add_argument("formes", help="Fichier de formes enregistré via CAVEAVIN_AUDIT_FICHIER")
+    parser.add_argument("--reference", help="Rapport de référence (formes connues et acceptées)")
+    parser.add_argument("--ecrire-reference", help="Écrit le rapport obtenu comme nouvelle référence")
+    parser.add_argument("--ratio-max", type=float, default=10.0, help="Ratio documents examinés / retournés toléré")
+    parser.add_argument("--host", default=config_db["host"])
+    parser.add_argument("--port", type=int, default=config_db["port"])
+    args = parser.parse_args(argv)
+
+    connex = Connexdb(**{**config_db, "host": args.host, "port": args.port})
+    reference: dict = {}
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as fichier:
+            reference = json.load(fichier)
+    rapport, regressions = auditer(connex.db, charger_formes(args.formes), reference, args.ratio_max)
+
+    for forme, resultat in rapport.items():
+        etat = "COLLSCAN" if resultat["collscan"] else "SORT" if resultat["tri_memoire"] else "ok"
+        print(f"{etat:<8} "
+              f"examinés={resultat['docs_examines']:>8} retournés={resultat['docs_retournes']:>6} "
+              f"ratio={resultat['ratio']:>8.1f} x{resultat['occurrences']:<5} {forme}")
+
+    if args.ecrire_reference:
+        with open(args.ecrire_reference, "w", encoding="utf-8") as fichier:
+            json.dump(rapport, fichier, indent=2, ensure_ascii=False)
+
+    for regression in regressions:
+        print(f"RÉGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
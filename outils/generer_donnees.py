@@ -0,0 +1,244 @@
+"""
+Générateur de jeux de données synthétiques pour les tests à grande échelle.
+
+Remplit la base caveavin avec des données réalistes et reproductibles (même
+graine, mêmes données) : utilisateurs, caves, étagères, bouteilles dont la
+popularité suit une loi de Zipf, notes et commentaires en loi de puissance,
+archives et, en option, photos binaires. Les documents sont insérés par lots
+(``insert_many`` non ordonné) sur plusieurs threads.
+
+Exemple ::
+
+    python -m outils.generer_donnees --utilisateurs 100000 --bouteilles 500000 \\
+        --notes 4000000 --commentaires 4000000 --threads 8
+"""
+import argparse
+import itertools
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from route.dependencies import config_db
+from Classes.connexiondb import Connexdb
+from identifiants import hacher
+
+TYPES: list = ["Rouge", "Blanc", "Rosé", "Champagne", "Liquoreux"]
+REGIONS: list = ["Bordeaux", "Bourgogne", "Alsace", "Loire", "Rhône", "Champagne", "Languedoc", "Provence"]
+MOTS: list = ["fruité", "boisé", "tannique", "souple", "minéral", "épicé", "long en bouche", "frais", "puissant", "élégant"]
+
+class Generateur:
+    """
+    Produit les documents du jeu de données à partir d'une graine.
+
+    Attributes
+    ----------
+    rng : random.Random
+        Le générateur aléatoire (seul responsable du caractère reproductible).
+    prefixe : str
+        Le préfixe des logins, noms de caves et de bouteilles générés.
+    noms_bouteilles : list
+        Les noms des bouteilles générées.
+    """
+
+    def __init__(self, graine: int, prefixe: str, bouteilles: int, exposant_zipf: float):
+        self.rng = random.Random(graine)
+        self.prefixe = prefixe
+        self.noms_bouteilles = [f"{prefixe}bouteille_{i}" for i in range(bouteilles)]
+        # Poids cumulés de Zipf : la bouteille de rang i est choisie avec une probabilité ~ 1 / (i + 1)^s
+        self._poids_cumules = list(itertools.accumulate(1 / (i + 1) ** exposant_zipf for i in range(bouteilles)))
+        # Empreinte commune du mot de passe "caveavin" (son sel est le seul élément non reproductible)
+        self.empreinte = hacher("caveavin")
+
+    def bouteille_populaire(self) -> str:
+        """Tire une bouteille selon sa popularité."""
+        return self.rng.choices(self.noms_bouteilles, cum_weights=self._poids_cumules)[0]
+
+    def bouteilles(self, taille_photo: int):
+        for nom in self.noms_bouteilles:
+            yield {
+                "nom": nom,
+                "type": self.rng.choice(TYPES),
+                "annee": self.rng.randint(1970, 2023),
+                "region": self.rng.choice(REGIONS),
+                "commentaires": [],
+                "notes": -1.0,
+                "moyen": -1.0,
+                "photo": self.rng.randbytes(taille_photo) if taille_photo else b"",
+                "prix": round(self.rng.lognormvariate(3.0, 0.8), 2),
+                "num_etagere": -1,
+                "numbers": 1,
+            }
+
+    def utilisateurs_caves_etageres(self, utilisateurs: int, caves_par_utilisateur: int,
+                                    etageres_par_cave: int, places_par_etagere: int, reservations: int):
+        """
+        Génère les utilisateurs avec leurs caves et étagères.
+
+        Produit des couples ``(collection, document)`` ; les bouteilles réservées
+        par chaque utilisateur sont tirées selon leur popularité.
+        """
+        num_etagere = 0
+        for u in range(utilisateurs):
+            login = f"{self.prefixe}user_{u}"
+            noms_caves = []
+            for c in range(caves_par_utilisateur):
+                nom_cave = f"{self.prefixe}cave_{u}_{c}"
+                noms_caves.append(nom_cave)
+                nums = list(range(num_etagere, num_etagere + etageres_par_cave))
+                num_etagere += etageres_par_cave
+                yield "caves", {"nom": nom_cave, "nb_emplacement": etageres_par_cave * places_par_etagere, "etageres": nums}
+                for num in nums:
+                    yield "etagere", {
+                        "num": num, "nb_place": places_par_etagere, "nb_bouteille": 0,
+                        "bouteilles": [], "caves": nom_cave, "login": login,
+                    }
+            nb_reservees = min(int(self.rng.paretovariate(1.2)), reservations) if reservations else 0
+            yield "user", {
+                "id": u,
+                "perm": "admin" if u == 0 else "user",
+                "login": login,
+                "password": self.empreinte,
+                "nom": f"Nom{u}",
+                "prenom": f"Prenom{u}",
+                "email": f"{login}@exemple.fr",
+                "bouteille_reserver": list(dict.fromkeys(self.bouteille_populaire() for _ in range(nb_reservees))),  # Ordre du tirage, sans doublons
+                "caves": noms_caves,
+            }
+
+    def notes(self, nombre: int, utilisateurs: int):
+        for _ in range(nombre):
+            yield {
+                "auteur": f"{self.prefixe}user_{int(self.rng.paretovariate(1.1)) % utilisateurs}",
+                "note": self.rng.choices([1, 2, 3, 4, 5], weights=[1, 2, 5, 9, 6])[0],
+                "nom_bouteille": self.bouteille_populaire(),
+            }
+
+    def commentaires(self, nombre: int, utilisateurs: int):
+        for _ in range(nombre):
+            yield {
+                "auteur": f"{self.prefixe}user_{int(self.rng.paretovariate(1.1)) % utilisateurs}",
+                "comment": " ".join(self.rng.sample(MOTS, self.rng.randint(1, 4))).capitalize() + ".",
+                "nom_bouteille": self.bouteille_populaire(),
+                "date": f"{self.rng.randint(2015, 2024)}-{self.rng.randint(1, 12):02d}-{self.rng.randint(1, 28):02d}",
+            }
+
+    def archives(self, nombre: int):
+        for a in range(nombre):
+            yield {
+                "nom": f"{self.prefixe}archive_{a}",
+                "type": self.rng.choice(TYPES),
+                "annee": self.rng.randint(1950, 2015),
+                "region": self.rng.choice(REGIONS),
+                "prix": round(self.rng.lognormvariate(3.0, 0.8), 2),
+                "commentaires": [],
+                "notes": [],
+                "moyen": None,
+            }
+
+class Inserteur:
+    """
+    Insère des documents par lots, en parallèle, avec ``insert_many`` non ordonné.
+
+    Attributes
+    ----------
+    inseres : dict
+        Le nombre de documents insérés par collection.
+    """
+
+    def __init__(self, connex: Connexdb, taille_lot: int, threads: int):
+        self.connex = connex
+        self.taille_lot = taille_lot
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.lots: dict = {}
+        self.futures: list = []
+        self.inseres: dict = {}
+
+    def ajouter(self, collection: str, document: dict) -> None:
+        lot = self.lots.setdefault(collection, [])
+        lot.append(document)
+        if len(lot) >= self.taille_lot:
+            self._envoyer(collection)
+
+    def ajouter_tous(self, collection: str, documents) -> None:
+        for document in documents:
+            self.ajouter(collection, document)
+
+    def _envoyer(self, collection: str) -> None:
+        lot, self.lots[collection] = self.lots[collection], []
+        self.futures.append((collection, self.executor.submit(self.connex.insert_many_into_collection, collection, lot)))
+        # Limite le nombre de lots en attente pour borner la mémoire
+        if len(self.futures) > self.threads * 4:
+            self._collecter(len(self.futures) // 2)
+
+    def _collecter(self, nombre: int) -> None:
+        termines, self.futures = self.futures[:nombre], self.futures[nombre:]
+        for collection, future in termines:
+            resultat = future.result()
+            if resultat.get("status") != 200:
+                raise RuntimeError(resultat.get("message"))
+            self.inseres[collection] = self.inseres.get(collection, 0) + resultat["inserted"]
+
+    def terminer(self) -> dict:
+        for collection in list(self.lots):
+            if self.lots[collection]:
+                self._envoyer(collection)
+        self._collecter(len(self.futures))
+        self.executor.shutdown()
+        return self.inseres
+
+def nettoyer(connex: Connexdb, prefixe: str) -> None:
+    """Supprime les documents générés avec le préfixe donné."""
+    motif = {"$regex": f"^{prefixe}"}
+    for collection, champ in [("user", "login"), ("caves", "nom"), ("etagere", "login"), ("bouteille", "nom"),
+                              ("note", "nom_bouteille"), ("commentaire", "nom_bouteille"), ("archive", "nom")]:
+        connex.db[collection].delete_many({champ: motif})
+
+def main(argv: list = None) -> int:
+    """Point d'entrée en ligne de commande du générateur."""
+    parser = argparse.ArgumentParser(description="Génère un jeu de données synthétique dans la base caveavin.")
+    parser.add_argument("--utilisateurs", type=int, default=1000)
+    parser.add_argument("--caves-par-utilisateur", type=int, default=2)
+    parser.add_argument("--etageres-par-cave", type=int, default=5)
+    parser.add_argument("--places-par-etagere", type=int, default=24)
+    parser.add_argument("--bouteilles", type=int, default=10000)
+    parser.add_argument("--reservations-max", type=int, default=200, help="Bouteilles réservées au plus par utilisateur")
+    parser.add_argument("--notes", type=int, default=50000)
+    parser.add_argument("--commentaires", type=int, default=50000)
+    parser.add_argument("--archives", type=int, default=1000)
+    parser.add_argument("--taille-photo", type=int, default=0, help="Taille des photos binaires en octets (0 = sans photo)")
+    parser.add_argument("--exposant-zipf", type=float, default=1.1, help="Asymétrie de la popularité des bouteilles")
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--prefixe", default="gen_")
+    parser.add_argument("--lot", type=int, default=5000, help="Nombre de documents par insert_many")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--nettoyer", action="store_true", help="Supprime les données générées précédemment")
+    args = parser.parse_args(argv)
+
+    connex = Connexdb(**config_db)
+    if args.nettoyer:
+        nettoyer(connex, args.prefixe)
+
+    debut = time.perf_counter()
+    generateur = Generateur(args.graine, args.prefixe, args.bouteilles, args.exposant_zipf)
+    inserteur = Inserteur(connex, args.lot, args.threads)
+
+    inserteur.ajouter_tous("bouteille", generateur.bouteilles(args.taille_photo))
+    for collection, document in generateur.utilisateurs_caves_etageres(
+            args.utilisateurs, args.caves_par_utilisateur, args.etageres_par_cave,
+            args.places_par_etagere, args.reservations_max):
+        inserteur.ajouter(collection, document)
+    inserteur.ajouter_tous("note", generateur.notes(args.notes, args.utilisateurs))
+    inserteur.ajouter_tous("commentaire", generateur.commentaires(args.commentaires, args.utilisateurs))
+    inserteur.ajouter_tous("archive", generateur.archives(args.archives))
+    inseres = inserteur.terminer()
+
+    duree = time.perf_counter() - debut
+    total = sum(inseres.values())
+    for collection, nombre in sorted(inseres.items()):
+        print(f"{collection:<12} {nombre:>12}")
+    print(f"{total} documents insérés en {duree:.1f} s ({total / max(duree, 1e-9):.0f} docs/s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+Rejeu déterministe du trafic capturé par ``capture.CaptureMiddleware``.
+
+Les requêtes capturées sont réémises contre une instance de test en respectant
+leur ordre et leurs écarts d'origine, éventuellement accélérés. Chaque
+utilisateur capturé est rejoué dans sa propre session : il se connecte d'abord
+avec le mot de passe des données de test (les mots de passe ne sont jamais
+capturés). Les latences d'origine et de rejeu sont rapportées côte à côte, par
+route.
+
+Exemples ::
+
+    python -m outils.rejouer captures/capture.jsonl* --cible http://127.0.0.1:15000
+    python -m outils.rejouer captures/capture.jsonl --vitesse 4 --sortie rejeu.json
+    python -m outils.rejouer captures/capture.jsonl --vitesse 0 --asgi
+"""
+import argparse
+import asyncio
+import glob
+import json
+import sys
+import time
+from collections import defaultdict
+import httpx
+from bench.charge_http import resumer
+
+def charger_capture(motifs: list) -> list:
+    """
+    Charge les requêtes rejouables des fichiers de capture, triées par instant.
+
+    Parameters
+    ----------
+    motifs : list
+        Les fichiers (ou motifs glob) de capture, y compris les fichiers tournés.
+
+    Returns
+    -------
+    list
+        Les entrées de capture rejouables.
+    """
+    entrees = []
+    for motif in motifs:
+        for chemin in sorted(glob.glob(motif)) or [motif]:
+            with open(chemin, encoding="utf-8") as fichier:
+                for ligne in fichier:
+                    ligne = ligne.strip()
+                    if ligne:
+                        entree = json.loads(ligne)
+                        if entree.get("rejouable"):
+                            entrees.append(entree)
+    entrees.sort(key=lambda entree: entree["ts"])
+    return entrees
+
+def preparer_requete(entree: dict, mot_de_passe: str) -> dict:
+    """Reconstruit les arguments httpx d'une requête capturée ; les champs masqués reçoivent le mot de passe de test."""
+    corps = entree.get("corps")
+    if isinstance(corps, dict):
+        corps = {cle: mot_de_passe if valeur == "***" and cle == "password" else valeur for cle, valeur in corps.items()}
+    # Les paramètres masqués (jeton de profilage...) ne sont pas renvoyés
+    params: dict = {cle: valeur for cle, valeur in (entree.get("query") or {}).items() if valeur != "***"}
+    requete: dict = {"method": entree["methode"], "url": entree["chemin"], "params": params or None}
+    if corps is None:
+        return requete
+    if entree["content_type"].startswith("application/json"):
+        requete["json"] = corps
+    elif isinstance(corps, dict):
+        requete["data"] = corps
+    return requete
+
+class Session:
+    """Client HTTP d'un utilisateur capturé, connecté avant sa première requête."""
+
+    def __init__(self, client_factory, login: str, mot_de_passe: str):
+        self.client: httpx.AsyncClient = client_factory()
+        self.login = login
+        self.mot_de_passe = mot_de_passe
+        self._connexion = asyncio.Lock()
+        self.connecte = login is None
+
+    async def envoyer(self, requete: dict) -> httpx.Response:
+        if not self.connecte:
+            async with self._connexion:
+                if not self.connecte:
+                    await self.client.post("/user/auth", data={"login": self.login, "password": self.mot_de_passe})
+                    self.connecte = True
+        return await self.client.request(**requete)
+
+async def rejouer(entrees: list, client_factory, vitesse: float, concurrence: int, mot_de_passe: str) -> dict:
+    """
+    Rejoue les entrées en respectant leurs écarts d'origine divisés par ``vitesse``.
+
+    Parameters
+    ----------
+    entrees : list
+        Les entrées de capture, triées par instant.
+    client_factory : Callable
+        Crée un ``httpx.AsyncClient`` pointant vers l'instance de test.
+    vitesse : float
+        Le facteur d'accélération (1 = rythme d'origine, 0 = au plus vite).
+    concurrence : int
+        Le nombre maximal de requêtes en vol.
+    mot_de_passe : str
+        Le mot de passe des utilisateurs de l'instance de test.
+
+    Returns
+    -------
+    dict
+        Les mesures d'origine et de rejeu par route, les statuts divergents et la durée du rejeu.
+    """
+    origine, rejeu = defaultdict(list), defaultdict(list)
+    divergences: dict = defaultdict(int)
+    sessions: dict = {}
+    limite = asyncio.Semaphore(concurrence)
+    t0 = entrees[0]["ts"] if entrees else 0.0
+    debut = time.perf_counter()
+
+    async def jouer(entree: dict) -> None:
+        cle = entree.get("route") or entree["chemin"]
+        if vitesse > 0:
+            attente = (entree["ts"] - t0) / vitesse - (time.perf_counter() - debut)
+            if attente > 0:
+                await asyncio.sleep(attente)
+        session = sessions.get(entree.get("utilisateur"))
+        if session is None:
+            session = sessions[entree.get("utilisateur")] = Session(client_factory, entree.get("utilisateur"), mot_de_passe)
+        async with limite:
+            start = time.perf_counter()
+            try:
+                response = await session.envoyer(preparer_requete(entree, mot_de_passe))
+                statut = response.status_code
+            except httpx.HTTPError:
+                statut = 599
+        rejeu[cle].append((time.perf_counter() - start, statut >= 500))
+        origine[cle].append((entree["duree_ms"] / 1000, entree["statut"] >= 500))
+        if statut != entree["statut"]:
+            divergences[cle] += 1
+
+    try:
+        await asyncio.gather(*(jouer(entree) for entree in entrees))
+    finally:
+        for session in sessions.values():
+            await session.client.aclose()
+
+    duree = time.perf_counter() - debut
+    duree_origine = max((entrees[-1]["ts"] - t0) if entrees else 0.0, 1e-9)
+    return {
+        "duree_s": round(duree, 2),
+        "origine": resumer(origine, duree_origine),
+        "rejeu": resumer(rejeu, duree),
+        "statuts_divergents": dict(divergences),
+    }
+
+def afficher(resultats: dict) -> None:
+    """Affiche les distributions de latence d'origine et de rejeu côte à côte."""
+    print(f"{'route':<36} {'n':>6}  {'p50 orig':>9} {'p50 rejeu':>9}  {'p95 orig':>9} {'p95 rejeu':>9}  "
+          f"{'p99 orig':>9} {'p99 rejeu':>9}  statuts≠")
+    for cle, rej in resultats["rejeu"].items():
+        ori = resultats["origine"].get(cle, {})
+        print(f"{cle:<36} {rej['requetes']:>6}  "
+              f"{ori.get('p50_ms', 0):>9.2f} {rej['p50_ms']:>9.2f}  "
+              f"{ori.get('p95_ms', 0):>9.2f} {rej['p95_ms']:>9.2f}  "
+              f"{ori.get('p99_ms', 0):>9.2f} {rej['p99_ms']:>9.2f}  "
+              f"{resultats['statuts_divergents'].get(cle, 0)}")
+
+def main(argv: list = None) -> int:
+    """Point d'entrée en ligne de commande du rejeu."""
+    parser = argparse.ArgumentParser(description="Rejoue le trafic capturé contre une instance de test de caveavin.")
+    parser.add_argument("captures", nargs="+", help="Fichiers de capture (motifs glob acceptés)")
+    parser.add_argument("--cible", default="http://127.0.0.1:15000", help="URL de l'instance de test")
+    parser.add_argument("--asgi", action="store_true", help="Rejoue dans le processus contre main:app au lieu de --cible")
+    parser.add_argument("--vitesse", type=float, default=1.0, help="Facteur d'accélération (0 = au plus vite)")
+    parser.add_argument("--concurrence", type=int, default=64, help="Nombre maximal de requêtes en vol")
+    parser.add_argument("--mot-de-passe", default="caveavin", help="Mot de passe des utilisateurs de test")
+    parser.add_argument("--limite", type=int, default=0, help="Ne rejoue que les N premières requêtes")
+    parser.add_argument("--sortie", help="Écrit les distributions dans ce fichier JSON")
+    args = parser.parse_args(argv)
+
+    entrees = charger_capture(args.captures)
+    if args.limite:
+        entrees = entrees[:args.limite]
+    if not entrees:
+        print("Aucune requête rejouable.", file=sys.stderr)
+        return 1
+
+    async def executer() -> dict:
+        if not args.asgi:
+            return await rejouer(entrees, lambda: httpx.AsyncClient(base_url=args.cible, follow_redirects=False),
+                                 args.vitesse, args.concurrence, args.mot_de_passe)
+        from main import app
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            return await rejouer(entrees, lambda: httpx.AsyncClient(transport=transport, base_url="http://rejeu",
+                                                                    follow_redirects=False),
+                                 args.vitesse, args.concurrence, args.mot_de_passe)
+
+    resultats = asyncio.run(executer())
+    afficher(resultats)
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as fichier:
+            json.dump(resultats, fichier, indent=2, ensure_ascii=False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
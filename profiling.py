@@ -0,0 +1,153 @@
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qsl
+
+#########################
+##### Configuration #####
+#########################
+
+config_profil: dict = {
+    # Jeton à fournir dans l'en-tête ou le paramètre de requête ; vide = désactivé
+    "jeton": os.environ.get("CAVEAVIN_PROFIL_JETON", ""),
+    "en_tete": "x-profil",
+    "parametre": "__profil",
+    "taux_echantillonnage": float(os.environ.get("CAVEAVIN_PROFIL_TAUX", "0")),  # Part des requêtes profilées au hasard
+    "mode": "echantillonnage",  # "echantillonnage" (piles .folded) ou "cprofile" (.pstats)
+    "intervalle": 0.005,  # Période d'échantillonnage des piles, en secondes
+    "dossier": os.environ.get("CAVEAVIN_PROFIL_DOSSIER", "profils"),
+}
+
+logger = logging.getLogger(__name__)
+
+class EchantillonneurPiles:
+    """
+    Profileur par échantillonnage des piles d'appels.
+
+    Un thread relève périodiquement la pile de chaque thread de l'application
+    et compte les piles identiques. Le résultat est écrit au format « collapsed »
+    (une pile par ligne, ``f1;f2;f3 nombre``), lu par flamegraph.pl et speedscope.
+
+    Les piles de la boucle d'événements peuvent contenir celles d'autres
+    requêtes traitées en même temps que la requête profilée.
+    """
+
+    def __init__(self, intervalle: float):
+        self.intervalle = intervalle
+        self.piles: Counter = Counter()
+        self._arret = threading.Event()
+        self._thread = threading.Thread(target=self._boucle, name="echantillonneur-profil", daemon=True)
+
+    def demarrer(self) -> None:
+        self._thread.start()
+
+    def arreter(self) -> None:
+        self._arret.set()
+        self._thread.join()
+
+    def _boucle(self) -> None:
+        moi = threading.get_ident()
+        noms = {}
+        while not self._arret.wait(self.intervalle):
+            for ident, frame in sys._current_frames().items():
+                if ident == moi:
+                    continue
+                if ident not in noms:
+                    noms = {thread.ident: thread.name for thread in threading.enumerate()}
+                pile = []
+                while frame is not None:
+                    code = frame.f_code
+                    pile.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                pile.append(noms.get(ident, str(ident)))
+                self.piles[";".join(reversed(pile))] += 1
+
+    def ecrire(self, chemin: str) -> None:
+        """Écrit les piles relevées au format collapsed."""
+        with open(chemin, "w", encoding="utf-8") as fichier:
+            for pile, nombre in self.piles.most_common():
+                fichier.write(f"{pile} {nombre}\n")
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI qui profile à la demande des requêtes individuelles.
+
+    Une requête est profilée si elle porte le jeton configuré dans l'en-tête
+    ``X-Profil`` ou le paramètre ``__profil``, ou si elle est tirée au sort selon
+    ``taux_echantillonnage``. Un fichier est écrit par requête profilée, nommé
+    d'après la route et la durée. Sans jeton ni échantillonnage, le middleware
+    se contente de transmettre la requête.
+    """
+
+    _verrou = threading.Lock()  # Un seul profil à la fois (cProfile ne supporte pas l'imbrication)
+
+    def __init__(self, app, **options):
+        self.app = app
+        self.config: dict = {**config_profil, **options}
+        self.actif: bool = bool(self.config["jeton"]) or self.config["taux_echantillonnage"] > 0
+
+    def demande(self, scope: dict) -> bool:
+        """Indique si la requête doit être profilée."""
+        jeton: str = self.config["jeton"]
+        if jeton:
+            en_tete = self.config["en_tete"].encode("latin-1")
+            for cle, valeur in scope["headers"]:
+                if cle == en_tete and hmac.compare_digest(valeur.decode("latin-1"), jeton):
+                    return True
+            if self.config["parametre"].encode("latin-1") in scope.get("query_string", b""):
+                parametres = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+                if hmac.compare_digest(parametres.get(self.config["parametre"], ""), jeton):
+                    return True
+        return random.random() < self.config["taux_echantillonnage"]
+
+    async def __call__(self, scope, receive, send):
+        if not self.actif or scope["type"] != "http" or not self.demande(scope):
+            await self.app(scope, receive, send)
+            return
+
+        if not self._verrou.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            start_time = time.perf_counter()
+            if self.config["mode"] == "cprofile":
+                profileur = cProfile.Profile()
+                profileur.enable()
+                try:
+                    await self.app(scope, receive, send)
+                finally:
+                    profileur.disable()
+                    self.ecrire(scope, time.perf_counter() - start_time, "pstats", profileur.dump_stats)
+            else:
+                echantillonneur = EchantillonneurPiles(self.config["intervalle"])
+                echantillonneur.demarrer()
+                try:
+                    await self.app(scope, receive, send)
+                finally:
+                    echantillonneur.arreter()
+                    self.ecrire(scope, time.perf_counter() - start_time, "folded", echantillonneur.ecrire)
+        finally:
+            self._verrou.release()
+
+    def ecrire(self, scope: dict, duree: float, extension: str, ecrire_fichier) -> None:
+        """Écrit le profil d'une requête dans un fichier nommé d'après la route et la durée."""
+        route = getattr(scope.get("route"), "path", scope["path"])
+        nom_route = re.sub(r"[^A-Za-z0-9_-]+", "_", route).strip("_") or "racine"
+        os.makedirs(self.config["dossier"], exist_ok=True)
+        chemin = os.path.join(
+            self.config["dossier"],
+            f"{time.strftime('%Y%m%d-%H%M%S')}_{scope['method']}_{nom_route}_{duree * 1000:.0f}ms.{extension}"
+        )
+        try:
+            ecrire_fichier(chemin)
+            logger.info("Profil écrit : %s", chemin)
+        except OSError as e:
+            logger.error("Écriture du profil %s impossible : %s", chemin, e)
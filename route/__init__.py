@@ -3,3 +3,7 @@ from .cave_route import router as cave_router
 from .dependencies import get_user_cookies, config_db
 from .etagere_route import router as etagere_router
 from .bouteille_route import router as bouteille_router
+from .tache_route import router as tache_router
+from .sync_route import router as sync_router
+from .api_route import router as api_router
+from .batch_route import router as batch_router
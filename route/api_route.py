@@ -0,0 +1,249 @@
+import logging
+from datetime import datetime
+from typing import Annotated, Generic, Optional, TypeVar
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+from Classes.connexiondb import Connexdb
+from .dependencies import get_user_cookies, config_db
+from serialisation import ReponseJSON
+from budget import budget_db
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+##############################
+##### Modèles de réponse #####
+##############################
+
+# Les routes retournent directement une ReponseJSON (orjson) : les modèles
+# documentent le schéma OpenAPI sans que FastAPI revalide chaque document.
+# Avec ``fields=``, seuls les champs demandés (et ``_id``) sont présents.
+
+Donnees = TypeVar("Donnees")
+
+class BouteilleAPI(BaseModel):
+    id: Optional[str] = Field(default=None, alias="_id")
+    nom: Optional[str] = None
+    type: Optional[str] = None
+    annee: Optional[int] = None
+    region: Optional[str] = None
+    prix: Optional[float] = None
+    moyen: Optional[float] = None
+    notes_nombre: Optional[int] = None
+    numbers: Optional[int] = None
+    cave: Optional[str] = None
+    num_etagere: Optional[int] = None
+    photo: Optional[str] = Field(default=None, description="Photo encodée en base64, seulement si demandée dans fields")
+    maj_le: Optional[datetime] = None
+
+class CaveAPI(BaseModel):
+    id: Optional[str] = Field(default=None, alias="_id")
+    nom: Optional[str] = None
+    nb_emplacement: Optional[int] = None
+    etageres: Optional[list[int]] = None
+    maj_le: Optional[datetime] = None
+
+class EtagereAPI(BaseModel):
+    id: Optional[str] = Field(default=None, alias="_id")
+    num: Optional[int] = None
+    nb_place: Optional[int] = None
+    nb_bouteille: Optional[int] = None
+    caves: Optional[str] = None
+    login: Optional[str] = None
+    maj_le: Optional[datetime] = None
+
+class NoteAPI(BaseModel):
+    id: Optional[str] = Field(default=None, alias="_id")
+    auteur: Optional[str] = None
+    note: Optional[float] = None
+    nom_bouteille: Optional[str] = None
+
+class CommentaireAPI(BaseModel):
+    id: Optional[str] = Field(default=None, alias="_id")
+    auteur: Optional[str] = None
+    comment: Optional[str] = None
+    nom_bouteille: Optional[str] = None
+    date: Optional[str] = None
+
+class Reponse(BaseModel, Generic[Donnees]):
+    status: str = "success"
+    data: Donnees
+
+class ErreurAPI(Exception):
+    """Erreur d'une route de l'API, rendue en JSON (et non en page d'erreur) par main.py."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+def reponse_erreur(exc: ErreurAPI) -> ReponseJSON:
+    return ReponseJSON(status_code=exc.status_code, content={"status": "error", "message": exc.message})
+
+##########################
+##### Champs exposés #####
+##########################
+
+# Pour chaque ressource : sa collection, les champs qui peuvent être demandés
+# et ceux retournés sans ``fields=`` (les photos ne le sont que sur demande).
+RESSOURCES: dict = {
+    "bouteille": {
+        "collection": "bouteille",
+        "champs": tuple(champ for champ in BouteilleAPI.model_fields if champ != "id"),
+        "defaut": tuple(champ for champ in BouteilleAPI.model_fields if champ not in ("id", "photo")),
+    },
+    "cave": {
+        "collection": "caves",
+        "champs": tuple(champ for champ in CaveAPI.model_fields if champ != "id"),
+    },
+    "etagere": {
+        "collection": "etagere",
+        "champs": tuple(champ for champ in EtagereAPI.model_fields if champ != "id"),
+    },
+    "note": {
+        "collection": "note",
+        "champs": tuple(champ for champ in NoteAPI.model_fields if champ != "id"),
+    },
+    "commentaire": {
+        "collection": "commentaire",
+        "champs": tuple(champ for champ in CommentaireAPI.model_fields if champ != "id"),
+    },
+}
+
+def projection(ressource: str, fields: Optional[str]) -> dict:
+    """
+    Traduit le paramètre ``fields`` en projection MongoDB.
+
+    Parameters
+    ----------
+    ressource : str
+        La ressource lue (clé de RESSOURCES).
+    fields : str, optional
+        Les champs demandés, séparés par des virgules ; None pour les champs par défaut.
+
+    Returns
+    -------
+    dict
+        La projection : seuls les champs exposés sont lus, jamais les champs
+        internes (mot de passe, agrégats...).
+
+    Raises
+    ------
+    ErreurAPI
+        Si un champ demandé n'est pas exposé (400).
+    """
+    description: dict = RESSOURCES[ressource]
+    if not fields:
+        return {champ: 1 for champ in description.get("defaut", description["champs"])}
+
+    demandes: list = [champ.strip() for champ in fields.split(",") if champ.strip()]
+    inconnus: list = [champ for champ in demandes if champ not in description["champs"]]
+    if inconnus:
+        raise ErreurAPI(400, f"Champs inconnus pour {ressource} : {', '.join(inconnus)}")
+    return {champ: 1 for champ in demandes}
+
+def exiger_connexion(user_cookies: dict) -> None:
+    if not user_cookies["login"]:
+        raise ErreurAPI(401, "Utilisateur non connecté")
+
+async def lire(ressource: str, query: dict, fields: Optional[str]) -> list:
+    """Lit les documents d'une ressource, réduits aux champs demandés, hors de la boucle d'événements."""
+    rstatus: dict = await run_in_threadpool(
+        Connexdb(**config_db).get_data_from_collection,
+        RESSOURCES[ressource]["collection"], query, projection(ressource, fields)
+    )
+    if rstatus.get("status") != 200:
+        logger.error("Lecture de %s impossible : %s", ressource, rstatus.get("message"))
+        raise ErreurAPI(500, f"Lecture de {ressource} impossible")
+    return rstatus["data"]
+
+async def lire_un(ressource: str, query: dict, fields: Optional[str]) -> dict:
+    documents: list = await lire(ressource, query, fields)
+    if not documents:
+        raise ErreurAPI(404, f"{ressource.capitalize()} introuvable")
+    return documents[0]
+
+def succes(data) -> ReponseJSON:
+    return ReponseJSON(content={"status": "success", "data": data})
+
+Champs = Annotated[Optional[str], Query(description="Champs à retourner, séparés par des virgules (projection MongoDB)")]
+
+######################
+##### Bouteilles #####
+######################
+
+@router.get("/bouteilles", response_model=Reponse[list[BouteilleAPI]])
+@budget_db(1)
+async def lister_bouteilles(fields: Champs = None, user_cookies: dict = Depends(get_user_cookies)):
+    """Retourne toutes les bouteilles."""
+    exiger_connexion(user_cookies)
+    return succes(await lire("bouteille", {}, fields))
+
+@router.get("/bouteilles/{nom}", response_model=Reponse[BouteilleAPI])
+@budget_db(1)
+async def lire_bouteille(nom: str, fields: Champs = None, user_cookies: dict = Depends(get_user_cookies)):
+    """Retourne une bouteille par son nom."""
+    exiger_connexion(user_cookies)
+    return succes(await lire_un("bouteille", {"nom": nom}, fields))
+
+@router.get("/bouteilles/{nom}/notes", response_model=Reponse[list[NoteAPI]])
+@budget_db(1)
+async def lister_notes(nom: str, fields: Champs = None, user_cookies: dict = Depends(get_user_cookies)):
+    """Retourne les notes d'une bouteille."""
+    exiger_connexion(user_cookies)
+    return succes(await lire("note", {"nom_bouteille": nom}, fields))
+
+@router.get("/bouteilles/{nom}/commentaires", response_model=Reponse[list[CommentaireAPI]])
+@budget_db(1)
+async def lister_commentaires(nom: str, fields: Champs = None, user_cookies: dict = Depends(get_user_cookies)):
+    """Retourne les commentaires d'une bouteille."""
+    exiger_connexion(user_cookies)
+    return succes(await lire("commentaire", {"nom_bouteille": nom}, fields))
+
+#################
+##### Caves #####
+#################
+
+@router.get("/caves", response_model=Reponse[list[CaveAPI]])
+@budget_db(2)
+async def lister_caves(fields: Champs = None, user_cookies: dict = Depends(get_user_cookies)):
+    """Retourne les caves de l'utilisateur connecté."""
+    exiger_connexion(user_cookies)
+    rstatus: dict = await run_in_threadpool(
+        Connexdb(**config_db).get_data_from_collection, "user", {"login": user_cookies["login"]}, {"caves": 1}
+    )
+    caves: list = rstatus["data"][0].get("caves", []) if rstatus.get("status") == 200 and rstatus["data"] else []
+    return succes(await lire("cave", {"nom": {"$in": caves}}, fields) if caves else [])
+
+@router.get("/caves/{nom}", response_model=Reponse[CaveAPI])
+@budget_db(1)
+async def lire_cave(nom: str, fields: Champs = None, user_cookies: dict = Depends(get_user_cookies)):
+    """Retourne une cave par son nom."""
+    exiger_connexion(user_cookies)
+    return succes(await lire_un("cave", {"nom": nom}, fields))
+
+@router.get("/caves/{nom}/etageres", response_model=Reponse[list[EtagereAPI]])
+@budget_db(1)
+async def lister_etageres_cave(nom: str, fields: Champs = None, user_cookies: dict = Depends(get_user_cookies)):
+    """Retourne les étagères d'une cave."""
+    exiger_connexion(user_cookies)
+    return succes(await lire("etagere", {"caves": nom}, fields))
+
+####################
+##### Étagères #####
+####################
+
+@router.get("/etageres", response_model=Reponse[list[EtagereAPI]])
+@budget_db(1)
+async def lister_etageres(fields: Champs = None, user_cookies: dict = Depends(get_user_cookies)):
+    """Retourne toutes les étagères."""
+    exiger_connexion(user_cookies)
+    return succes(await lire("etagere", {}, fields))
+
+@router.get("/etageres/{num}", response_model=Reponse[EtagereAPI])
+@budget_db(1)
+async def lire_etagere(num: int, fields: Champs = None, user_cookies: dict = Depends(get_user_cookies)):
+    """Retourne une étagère par son numéro."""
+    exiger_connexion(user_cookies)
+    return succes(await lire_un("etagere", {"num": num}, fields))
@@ -0,0 +1,230 @@
+import logging
+from datetime import datetime
+from typing import Callable
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel, Field
+from pymongo.errors import PyMongoError
+from starlette.concurrency import run_in_threadpool
+from Classes import Bouteille, Cave, Etagere, Personne
+from Classes.connexiondb import Connexdb
+from .dependencies import get_user_cookies, config_db, ajouter_notes, ajouter_commentaire
+from .api_route import ErreurAPI, exiger_connexion
+from serialisation import ReponseJSON
+from budget import budget_db
+
+#########################
+##### Configuration #####
+#########################
+
+config_lot: dict = {
+    "operations_max": 20,  # Sous-opérations au plus par lot
+    "budget_operation": 10,  # Opérations MongoDB prévues par sous-opération (budget de la route)
+}
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Sous-opérations disponibles : nom -> fonction(params, user_cookies) -> dict de statut
+OPERATIONS: dict = {}
+
+class SousOperation(BaseModel):
+    operation: str
+    params: dict = Field(default_factory=dict)
+
+class Lot(BaseModel):
+    operations: list[SousOperation]
+    transaction: bool = False  # Tout ou rien : nécessite un replica set MongoDB
+
+class LotAnnule(Exception):
+    """Levée dans la transaction d'un lot quand une sous-opération échoue, pour l'annuler."""
+
+def operation(nom: str):
+    """Enregistre une fonction comme exécutant les sous-opérations ``nom`` d'un lot."""
+    def enregistrer(fonction: Callable) -> Callable:
+        OPERATIONS[nom] = fonction
+        return fonction
+    return enregistrer
+
+def _utilisateur(user_cookies: dict) -> Personne:
+    return Personne(
+        login=user_cookies["login"],
+        password="",
+        nom=user_cookies["nom"],
+        prenom=user_cookies["prenom"],
+        perm=user_cookies["perm"],
+        collections="user",
+        config_db=config_db
+    )
+
+###########################
+##### Sous-opérations #####
+###########################
+
+@operation("creer_bouteille")
+def creer_bouteille(params: dict, user_cookies: dict) -> dict:
+    """Crée une bouteille et l'ajoute à la collection de l'utilisateur."""
+    bouteille = Bouteille(
+        nom=params["nom"],
+        type=params.get("type", "inconnue"),
+        annee=int(params.get("annee", -1)),
+        region=params.get("region", "inconnue"),
+        prix=float(params.get("prix", -1.0)),
+        config_db=config_db
+    )
+    rstatus: dict = bouteille.create()
+    if rstatus.get("status") != 200:
+        return rstatus
+    return _utilisateur(user_cookies).add_bottle(params["nom"])
+
+@operation("ajouter_etagere")
+def ajouter_etagere(params: dict, user_cookies: dict) -> dict:
+    """Ajoute une étagère à une cave."""
+    num_etagere, nb_place = int(params["num_etagere"]), int(params["nb_place"])
+    if num_etagere <= 0 or nb_place <= 0:
+        return {"status": 400, "message": "num_etagere et nb_place doivent être des entiers positifs."}
+
+    cave = Cave(config_db=config_db, nom=params["nom_cave"])
+    if cave.get_cave().get("status") != 200:
+        return {"status": 404, "message": "Cave non trouvée."}
+    etagere = Etagere(num=num_etagere, nb_place=nb_place, cave=params["nom_cave"], login=user_cookies["login"],
+                      config_db=config_db)
+    return cave.add_etagere(etagere)
+
+@operation("deplacer_bouteille")
+def deplacer_bouteille(params: dict, user_cookies: dict) -> dict:
+    """Place une bouteille dans une cave, sur une étagère."""
+    return Bouteille(nom=params["nom"], config_db=config_db).move(params["nom_cave"], int(params["num_etagere"]))
+
+@operation("noter")
+def noter(params: dict, user_cookies: dict) -> dict:
+    """Ajoute une note à une bouteille (écrite directement : visible par les sous-opérations suivantes)."""
+    return ajouter_notes(config_db, params["nom_bouteille"], float(params["note"]), user_cookies["login"])
+
+@operation("commenter")
+def commenter(params: dict, user_cookies: dict) -> dict:
+    """Ajoute un commentaire à une bouteille."""
+    return ajouter_commentaire(config_db, params["nom_bouteille"], params["commentaire"], user_cookies["login"],
+                               date=datetime.now().strftime("%Y-%m-%d"))
+
+@operation("lire_bouteille")
+def lire_bouteille(params: dict, user_cookies: dict) -> dict:
+    """Retourne une bouteille avec ses notes et ses commentaires."""
+    return Bouteille.model_construct(nom=params["nom"], config_db=config_db).get_all_information()
+
+@operation("lister_etageres")
+def lister_etageres(params: dict, user_cookies: dict) -> dict:
+    """Retourne toutes les étagères."""
+    return Etagere.model_construct(login=user_cookies["login"], config_db=config_db).get_etageres()
+
+@operation("lire_collection")
+def lire_collection(params: dict, user_cookies: dict) -> dict:
+    """Retourne les bouteilles et les caves de l'utilisateur."""
+    rstatus: dict = _utilisateur(user_cookies).get_collection()
+    if rstatus.get("status") != 200:
+        return rstatus
+    return {"status": 200, "data": {"bouteilles": rstatus["bouteilles"], "caves": rstatus["caves"]}}
+
+#################
+##### Lots ######
+#################
+
+def executer_sous_operation(sous_operation: SousOperation, user_cookies: dict) -> dict:
+    """Exécute une sous-opération et retourne son résultat : opération, statut, message et données."""
+    fonction: Callable = OPERATIONS.get(sous_operation.operation)
+    if fonction is None:
+        return {"operation": sous_operation.operation, "status": 400, "message": "Opération inconnue"}
+    try:
+        rstatus: dict = fonction(sous_operation.params, user_cookies)
+    except (KeyError, TypeError, ValueError) as e:
+        return {"operation": sous_operation.operation, "status": 400, "message": f"Paramètres invalides : {e}"}
+
+    resultat: dict = {"operation": sous_operation.operation, "status": rstatus.get("status", 200)}
+    if rstatus.get("message"):
+        resultat["message"] = rstatus["message"]
+    if "data" in rstatus:
+        resultat["data"] = rstatus["data"]
+    return resultat
+
+def executer_lot(lot: Lot, user_cookies: dict) -> list:
+    """
+    Exécute les sous-opérations d'un lot dans l'ordre, jusqu'à la première qui échoue.
+
+    Les sous-opérations partagent la requête : un seul décodage de la
+    session, un seul passage dans les middlewares et le même pool de
+    connexions. Avec ``transaction``, elles s'exécutent dans une transaction
+    MongoDB : si l'une échoue, aucune écriture du lot n'est gardée, et les
+    caches ne sont purgés et les abonnés prévenus qu'après la validation.
+
+    Returns
+    -------
+    list
+        Le résultat de chaque sous-opération, dans l'ordre du lot.
+    """
+    resultats: list = []
+    annulation: str = "Annulée avec la transaction"
+    non_executee: tuple = (424, "Non exécutée : une opération précédente a échoué")
+    echec_transaction: bool = False
+
+    def executer() -> None:
+        for sous_operation in lot.operations:
+            resultats.append(executer_sous_operation(sous_operation, user_cookies))
+            if resultats[-1]["status"] != 200:
+                raise LotAnnule()
+
+    try:
+        if lot.transaction:
+            with Connexdb(**config_db).transaction():
+                executer()
+        else:
+            executer()
+    except LotAnnule:
+        pass
+    except PyMongoError as e:
+        # Transaction refusée (serveur sans replica set) ou validation en échec
+        logger.error("Transaction du lot en échec : %s", e)
+        annulation = f"Annulée, transaction en échec : {e}"
+        non_executee = (409, annulation)
+        echec_transaction = True
+
+    if lot.transaction and (echec_transaction or any(resultat["status"] != 200 for resultat in resultats)):
+        for resultat in resultats:
+            if resultat["status"] == 200:
+                resultat.update(status=409, message=annulation)
+                resultat.pop("data", None)
+    for sous_operation in lot.operations[len(resultats):]:
+        resultats.append({"operation": sous_operation.operation, "status": non_executee[0],
+                          "message": non_executee[1]})
+    return resultats
+
+@router.post("", response_class=ReponseJSON)
+@budget_db(config_lot["operations_max"] * config_lot["budget_operation"])
+async def lot(lot: Lot, user_cookies: dict = Depends(get_user_cookies)):
+    """
+    Exécute une liste ordonnée de sous-opérations en un seul aller-retour HTTP.
+
+    Parameters
+    ----------
+    lot : Lot
+        Les sous-opérations (``operation`` et ``params``) et, avec
+        ``transaction``, l'exécution en tout ou rien.
+    user_cookies : dict
+        Les cookies de l'utilisateur, pour qui toutes les sous-opérations s'exécutent.
+
+    Returns
+    -------
+    ReponseJSON
+        ``status`` ("success" si toutes les sous-opérations ont réussi) et
+        ``resultats`` : le statut, le message et les données de chacune.
+    """
+    exiger_connexion(user_cookies)
+    if not lot.operations:
+        raise ErreurAPI(400, "Le lot ne contient aucune opération")
+    if len(lot.operations) > config_lot["operations_max"]:
+        raise ErreurAPI(400, f"Un lot contient au plus {config_lot['operations_max']} opérations")
+
+    resultats: list = await run_in_threadpool(executer_lot, lot, user_cookies)
+    return ReponseJSON(content={
+        "status": "success" if all(resultat["status"] == 200 for resultat in resultats) else "error",
+        "transaction": lot.transaction,
+        "resultats": resultats,
+    })
@@ -1,20 +1,35 @@
+import logging
 from fastapi import APIRouter, Request, Depends, Form, HTTPException
 from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
 from Classes import Bouteille, Personne
 from .dependencies import config_db, get_user_cookies, effectuer_operation_db, ajouter_commentaire, ajouter_notes, recuperer_archives
+from templating import templates
+from budget import budget_db
+from taches import soumettre, config_taches
+from tampon import tampon_ecritures
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
+from validateurs import lire_versions, calculer_validateurs, non_modifie, appliquer_validateurs, validateurs_reponse
+from cache import reponses_cache, cle_reponse, reponse_en_cache, mettre_en_cache
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+logger = logging.getLogger(__name__)
 
 
 @router.post("/search", response_class=HTMLResponse)
+@budget_db(1)
 async def search(
         request: Request,
         filtre: str = Form(...),
         user_cookies: dict = Depends(get_user_cookies)
 ):
+    # Results are cached per filter and user scope until any bottle changes
+    cle = cle_reponse("bouteille.search", {"filtre": filtre}, user_cookies)
+    reponse = reponse_en_cache(cle)
+    if reponse is not None:
+        return reponse
+    generations = reponses_cache.instantane("bouteille")
+
     # Transform the filter string into a regex pattern
     regex_pattern = f".*{filtre}.*"  # Automatically wraps the input with '.*' for regex matching
     # Create a query to search for the bottle using the transformed filter
@@ -34,21 +49,20 @@ async def search(
         })
     # Extract data from the response if successful
     data = response.get("data", [])
-    # Print data for debugging
-    print(data)
+    logger.debug("Recherche '%s' : %d bouteille(s)", filtre, len(data))
     # Check if data is empty and prepare the message accordingly
     if not data:
         message = "Aucune bouteille n'a été trouvée pour ce filtre."
     else:
         message = ""
-    return templates.TemplateResponse("search_bouteille.html", {
+    return mettre_en_cache(cle, templates.TemplateResponse("search_bouteille.html", {
         "request": request,
         **user_cookies,
         "data": data,
         "message": message,  # Pass the message to the template
         "error_message": "",  # Clear error message if there are no errors
         "filtre": filtre
-    })
+    }), generations)
 
 @router.post("/add", response_class=JSONResponse)
 async def add_bouteille(
@@ -113,7 +127,7 @@ async def add_bouteille(
     # Crée la bouteille dans la base de données
     rstatus: dict = bouteille.create()
 
-    print(rstatus)  # Impression pour débogage
+    logger.debug("Création de la bouteille %s : %s", nom, rstatus.get("status"))
 
     # Vérifie si la création a réussi
     if rstatus.get("status") != 200:
@@ -125,7 +139,7 @@ async def add_bouteille(
     # Ajoute la bouteille à la collection de l'utilisateur
     result = user.add_bottle(nom)
 
-    print(result)  # Impression pour débogage
+    logger.debug("Ajout de la bouteille %s à %s : %s", nom, user_cookies["login"], result.get("status"))
 
     # Vérifie si l'ajout à la collection a réussi
     if result.get("status") == 200:
@@ -171,6 +185,7 @@ async def del_bouteille(request: Request, nom_bouteille: str, user_cookies: dict
     return RedirectResponse(url="/user/collection", status_code=302)
 
 @router.get("/update/{nom_bouteille}", response_class=HTMLResponse)
+@budget_db(4)
 async def get_update_bouteille(request: Request, nom_bouteille: str, user_cookies: dict = Depends(get_user_cookies)):
     """
     Affiche la page de mise à jour des détails d'une bouteille.
@@ -193,8 +208,8 @@ async def get_update_bouteille(request: Request, nom_bouteille: str, user_cookie
     if not user_cookies["login"]:
         return RedirectResponse(url="/user/login", status_code=302)
 
-    # Crée un objet Bouteille pour récupérer ses informations
-    bouteille = Bouteille(nom=nom_bouteille, config_db=config_db)
+    # Lecture seule : l'objet Bouteille est construit sans validation
+    bouteille = Bouteille.model_construct(nom=nom_bouteille, config_db=config_db)
     bottle_data = bouteille.get_all_information()
 
     # Vérifie si la récupération des données a réussi
@@ -290,6 +305,14 @@ async def comment_and_pair(
     # Get the current date in the desired format (e.g., YYYY-MM-DD)
     current_date = datetime.now().strftime("%Y-%m-%d")
 
+    # With the write-behind buffer, the submission is acknowledged once journaled locally
+    buffered = await run_in_threadpool(tampon_ecritures.ajouter, [
+        ("commentaire", {"auteur": login, "comment": comment, "nom_bouteille": nom_bouteille, "date": current_date}),
+        ("note", {"auteur": login, "note": rating, "nom_bouteille": nom_bouteille}),
+    ])
+    if buffered.get("status") == 200:
+        return RedirectResponse(url=f"/bottle/{nom_bouteille}", status_code=302)
+
     # Add the comment to the database
     comment_response = ajouter_commentaire(config_db, nom_bouteille, comment, login, date=current_date)
 
@@ -308,17 +331,63 @@ async def comment_and_pair(
     return RedirectResponse(url=f"/bottle/{nom_bouteille}", status_code=302)
 
 @router.get("/archive/{nom_bouteille}", response_class=HTMLResponse)
+@budget_db(1)
 async def get_archiver_bouteille(request: Request, nom_bouteille: str, user_cookies: dict = Depends(get_user_cookies)):
     # Vérifie si l'utilisateur est connecté
     if not user_cookies["login"]:
         return RedirectResponse(url="/user/login", status_code=302)
 
-    # Crée un objet Bouteille pour récupérer ses informations
-    bouteille: Bouteille = Bouteille(nom=nom_bouteille, config_db=config_db)
-    bouteille.archiver()
+    # L'archivage (lecture des notes et commentaires, copie, suppression) est fait en arrière-plan
+    rstatus: dict = soumettre(config_db, "archiver_bouteille", {"nom": nom_bouteille}, user_cookies["login"])
+
+    logger.debug("Archivage de la bouteille %s : tâche %s", nom_bouteille, rstatus.get("id"))
 
     return RedirectResponse(url=f"/user/collection", status_code=302)
 
+@router.post("/import", response_class=JSONResponse)
+@budget_db(1)
+async def importer_bouteilles(request: Request, bouteilles: list[dict], user_cookies: dict = Depends(get_user_cookies)):
+    """
+    Importe une liste de bouteilles dans la collection de l'utilisateur, en arrière-plan.
+
+    Parameters
+    ----------
+    request : Request
+        La requête HTTP.
+    bouteilles : list[dict]
+        Les bouteilles à importer (mêmes champs que le formulaire d'ajout).
+    user_cookies : dict
+        Les cookies de l'utilisateur pour vérifier la connexion.
+
+    Returns
+    -------
+    JSONResponse
+        L'identifiant de la tâche d'import, dont l'état est consultable sur /taches/{id}.
+    """
+    # Vérifie si l'utilisateur est connecté
+    if not user_cookies["login"]:
+        raise HTTPException(status_code=401, detail="Utilisateur non connecté")
+
+    if not bouteilles or len(bouteilles) > config_taches["import_max"]:
+        return JSONResponse(status_code=400, content={
+            "status": "error",
+            "message": f"Entre 1 et {config_taches['import_max']} bouteilles par import."
+        })
+
+    # Valide les bouteilles avant de les mettre en file
+    try:
+        documents: list = [{**Bouteille(**bouteille).consulter(), "numbers": 1} for bouteille in bouteilles]
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+
+    rstatus: dict = soumettre(config_db, "importer_bouteilles",
+                              {"bouteilles": documents, "login": user_cookies["login"]}, user_cookies["login"])
+
+    if rstatus.get("status") != 200:
+        return JSONResponse(status_code=500, content={"status": "error", "message": rstatus.get("message")})
+
+    return JSONResponse(status_code=202, content={"status": "success", "tache": rstatus["id"]})
+
 @router.get("/get-archive", response_class=HTMLResponse)
 async def get_archiver_bouteille(request: Request, user_cookies: dict = Depends(get_user_cookies)):
     # Vérifie si l'utilisateur est connecté
@@ -328,7 +397,7 @@ async def get_archiver_bouteille(request: Request, user_cookies: dict = Depends(
     # Crée un objet Bouteille pour récupérer ses informations
     archive_data: dict = recuperer_archives(config_db)
 
-    print(f"\n{archive_data}\n")
+    logger.debug("Archives : %d document(s)", len(archive_data.get("archives") or []))
 
     if archive_data.get("status") != 200:
         return templates.TemplateResponse("archive.html", {
@@ -344,6 +413,7 @@ async def get_archiver_bouteille(request: Request, user_cookies: dict = Depends(
     })
 
 @router.get("/{nom_bouteille}", response_class=HTMLResponse)
+@budget_db(4)
 async def get_bouteille(request: Request, nom_bouteille: str, user_cookies: dict = Depends(get_user_cookies)):
     """
     Récupère les détails d'une bouteille par son nom.
@@ -362,16 +432,29 @@ async def get_bouteille(request: Request, nom_bouteille: str, user_cookies: dict
     HTMLResponse
         La page HTML contenant les détails de la bouteille ou une page d'erreur.
     """
-    print(f"Bouteille reçue : {nom_bouteille}")  # Impression pour débogage
     # Vérifie si l'utilisateur est connecté
     if not user_cookies["login"]:
         return RedirectResponse(url="/user/login", status_code=302)
 
-    # Crée un objet Bouteille pour récupérer ses informations
-    bouteille = Bouteille(nom=nom_bouteille, config_db=config_db)
+    # Page déjà rendue pour cet utilisateur : ni lecture MongoDB, ni rendu
+    cle = cle_reponse("bouteille.get", {"nom": nom_bouteille}, user_cookies)
+    reponse = reponse_en_cache(cle)
+    if reponse is not None:
+        return non_modifie(request, validateurs_reponse(reponse)) or reponse
+    generations = reponses_cache.instantane(f"bouteille:{nom_bouteille}")
+
+    # Version de la bouteille : avancée par ses modifications, ses notes et ses commentaires
+    versions = lire_versions(config_db, "bouteille", {"nom": nom_bouteille})
+    validateurs = calculer_validateurs(user_cookies, versions, date=True) if versions else None
+    reponse = non_modifie(request, validateurs)
+    if reponse is not None:
+        return reponse
+
+    # Lecture seule : l'objet Bouteille est construit sans validation
+    bouteille = Bouteille.model_construct(nom=nom_bouteille, config_db=config_db)
     bottle_data = bouteille.get_all_information()
 
-    print(f"Données de la bouteille récupérées : {bottle_data}")  # Impression pour débogage
+    logger.debug("Bouteille %s : %s", nom_bouteille, bottle_data.get("status"))
 
     # Vérifie si la récupération des données a réussi
     if bottle_data.get("status") != 200:
@@ -381,8 +464,8 @@ async def get_bouteille(request: Request, nom_bouteille: str, user_cookies: dict
             "message": bottle_data.get("message", "Échec de la récupération des informations de la bouteille"),
         })
 
-    return templates.TemplateResponse("bottle_details.html", {
+    return mettre_en_cache(cle, appliquer_validateurs(templates.TemplateResponse("bottle_details.html", {
         "request": request,
         **user_cookies,
         "data": bottle_data["data"]
-    })
+    }), validateurs), generations)
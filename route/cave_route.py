@@ -1,14 +1,20 @@
+import logging
 from fastapi import APIRouter, Request, Depends, Form, HTTPException, Body
-from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, StreamingResponse
 from Classes import Cave, Personne, Etagere
 from .dependencies import (
     get_user_cookies, 
-    config_db
+    config_db,
+    lectures_concurrentes
 )
+from templating import templates
+from budget import budget_db
+from diffusion import diffuseur, canal_cave, ENTETES_FLUX
+from serialisation import ReponseJSON
+from validateurs import lire_versions, calculer_validateurs, non_modifie, appliquer_validateurs
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+logger = logging.getLogger(__name__)
 
 # Define the add cave route before the dynamic route
 @router.get("/add-cave", response_class=HTMLResponse)
@@ -47,7 +53,7 @@ async def add_etagere(
         return JSONResponse(content={"status": 404, "message": "Cave not found."}, status_code=404)
 
     # Create the etagere and add it to the cave
-    etagere = Etagere(num=num_etagere, nb_place=nb_place, cave=nom_cave, config_db=config_db)
+    etagere = Etagere(num=num_etagere, nb_place=nb_place, cave=nom_cave, login=user_cookies["login"], config_db=config_db)
     result = cave.add_etagere(etagere)
 
     # Return success or error based on the result
@@ -63,7 +69,7 @@ async def get_etageres(cave_id: str, user_cookies: dict = Depends(get_user_cooki
 
     cave: Cave = Cave(id=cave_id, config_db=config_db)
     etageres = cave.get_etageres()
-    return JSONResponse(content={"etageres": etageres})
+    return ReponseJSON(content={"etageres": etageres})
     
 @router.post("/add-cave", response_class=JSONResponse)
 async def add_cave(
@@ -96,12 +102,26 @@ async def delete_cave(cave_name: str, user_cookies: dict = Depends(get_user_cook
     return {"status": "success", "message": "Cave deleted successfully"}
 
 @router.get("/get/{nom_cave}", response_class=HTMLResponse)
+@budget_db(4)
 async def cave_details(request: Request, nom_cave: str, user_cookies: dict = Depends(get_user_cookies)):
     if user_cookies["login"] is None:
         return RedirectResponse(url="/user/login", status_code=302)
-    
-    # Create an instance of the Cave class
-    cave: Cave = Cave(
+
+    # Versions of the cave and its etageres, read before the page is built
+    versions_cave, versions_etageres = lectures_concurrentes(
+        lambda: lire_versions(config_db, "caves", {"nom": nom_cave}),
+        lambda: lire_versions(config_db, "etagere", {"caves": nom_cave})
+    )
+    validateurs = None
+    if versions_cave and versions_etageres is not None:
+        # No Last-Modified: removing an etagere does not move the most recent date
+        validateurs = calculer_validateurs(user_cookies, versions_cave, versions_etageres)
+    reponse = non_modifie(request, validateurs)
+    if reponse is not None:
+        return reponse
+
+    # Read only: the Cave is built without validation
+    cave: Cave = Cave.model_construct(
         nom=nom_cave,
         config_db=config_db
     )
@@ -114,8 +134,21 @@ async def cave_details(request: Request, nom_cave: str, user_cookies: dict = Dep
 
     # Prepare the data for rendering
     cave_data = cave_info['data']
-    
-    print(cave_data)
+    logger.debug("Cave %s : %d étagère(s)", nom_cave, len(cave_data["etagere_data"]))
 
     # Render the cave details template
-    return templates.TemplateResponse("cave_details.html", {"request": request, "data": cave_data, **user_cookies})
+    return appliquer_validateurs(
+        templates.TemplateResponse("cave_details.html", {"request": request, "data": cave_data, **user_cookies}),
+        validateurs
+    )
+
+@router.get("/live/{nom_cave}")
+async def cave_live(nom_cave: str, user_cookies: dict = Depends(get_user_cookies)):
+    """
+    Flux SSE de l'occupation de la cave : emplacements de la cave, places et
+    bouteilles de ses étagères et placements de bouteilles, au fil des modifications.
+    """
+    if user_cookies["login"] is None:
+        raise HTTPException(status_code=401, detail="User not logged in")
+
+    return StreamingResponse(diffuseur.flux(canal_cave(nom_cave)), media_type="text/event-stream", headers=ENTETES_FLUX)
@@ -1,5 +1,10 @@
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import Cookie
-from Classes.connexiondb import Connexdb
+from Classes.connexiondb import Connexdb, after_commit, request_session
+from session import sessions, ChargementImpossible
+from cache import reponses_cache
 
 ########################################
 #####     Configuration de la DB   #####
@@ -12,41 +17,72 @@ config_db: dict = {
     "password": "wm7ze*2b"
 }
 
-def get_user_cookies(
-    login: str = Cookie(None),
-    perm: str = Cookie(None),
-    nom: str = Cookie(None),
-    prenom: str = Cookie(None),
-    email: str = Cookie(None)
-) -> dict:
+logger = logging.getLogger(__name__)
+
+def charger_utilisateur(login: str) -> dict:
     """
-    Récupère les cookies de l'utilisateur.
+    Lit un utilisateur dans la base, pour reconstruire ou revérifier une session du cache.
 
     Parameters
     ----------
     login : str
         Le login de l'utilisateur.
-    perm : str
-        Les permissions de l'utilisateur.
-    nom : str
-        Le nom de l'utilisateur.
-    prenom : str
-        Le prénom de l'utilisateur.
-    email : str
-        L'email de l'utilisateur.
 
     Returns
     -------
     dict
-        Un dictionnaire contenant les informations de l'utilisateur.
+        Le document de l'utilisateur, ou None s'il n'existe pas.
+
+    Raises
+    ------
+    ChargementImpossible
+        Si la base ne répond pas.
     """
-    return {
-        "login": login,
-        "email": email,
-        "perm": perm,
-        "nom": nom,
-        "prenom": prenom
-    }
+    rstatus: dict = Connexdb(**config_db).get_data_from_collection("user", {"login": login})
+    if rstatus.get("status") != 200:
+        raise ChargementImpossible(rstatus.get("message"))
+    if not rstatus.get("data"):
+        return None
+    return rstatus["data"][0]
+
+def nouvelle_generation_session(login: str) -> None:
+    """
+    Avance la génération de session d'un utilisateur dans la base.
+
+    Les jetons émis jusque-là portent l'ancienne génération : ils sont refusés
+    par tous les workers à leur prochaine vérification.
+
+    Parameters
+    ----------
+    login : str
+        Le login de l'utilisateur.
+    """
+    rstatus: dict = Connexdb(**config_db).update_many_in_collection("user", {"login": login},
+                                                                    {"$inc": {"session_gen": 1}})
+    if rstatus.get("status") != 200:
+        logger.error("Sessions de %s non révoquées dans la base : %s", login, rstatus.get("message"))
+
+def get_user_cookies(session: str = Cookie(None)) -> dict:
+    """
+    Récupère les informations de l'utilisateur depuis son jeton de session.
+
+    Le jeton signé est vérifié par HMAC et les informations sont lues dans le
+    cache de sessions, sans requête MongoDB (sauf pour reconstruire une session
+    qui n'est plus en mémoire).
+
+    Parameters
+    ----------
+    session : str
+        Le jeton de session, émis par /user/auth.
+
+    Returns
+    -------
+    dict
+        Un dictionnaire contenant le login, l'email, les permissions, le nom et
+        le prénom de l'utilisateur (tous à None s'il n'est pas connecté).
+    """
+    donnees: dict = sessions.verifier(session, charger_utilisateur) if session else None
+    return {champ: (donnees or {}).get(champ) for champ in ("login", "email", "perm", "nom", "prenom")}
 
 #######################################
 ##### Fonction nécessaire au CRUD #####
@@ -105,6 +141,54 @@ def effectuer_operation_db(
 
     return rstatus
 
+#####################################
+#####   Lectures concurrentes   #####
+#####################################
+
+config_lectures: dict = {
+    "threads": 16,  # Nombre maximal de lectures MongoDB simultanées pour l'ensemble des requêtes
+}
+
+executeur_lectures: ThreadPoolExecutor = ThreadPoolExecutor(
+    max_workers=config_lectures["threads"],
+    thread_name_prefix="lecture-db"
+)
+
+# Vrai dans les threads de lecture : une lecture concurrente imbriquée s'y exécute en séquence
+_dans_lecture: contextvars.ContextVar = contextvars.ContextVar("dans_lecture", default=False)
+
+def _executer_lecture(appel):
+    _dans_lecture.set(True)
+    return appel()
+
+def lectures_concurrentes(*appels) -> list:
+    """
+    Exécute des lectures indépendantes en parallèle et retourne leurs résultats dans l'ordre.
+
+    Chaque appel s'exécute dans le pool borné ``executeur_lectures`` avec une
+    copie du contexte de la requête (mesures Server-Timing, budget d'opérations),
+    si bien que la latence d'une page composite est celle de sa lecture la plus
+    lente plutôt que leur somme.
+
+    Parameters
+    ----------
+    *appels : Callable
+        Des fonctions sans argument (par exemple des ``lambda``) effectuant chacune une lecture.
+
+    Returns
+    -------
+    list
+        Les résultats des appels, dans l'ordre des arguments.
+    """
+    if len(appels) < 2 or _dans_lecture.get() or request_session.get() is not None:
+        # Une session de transaction ne peut servir qu'à une opération à la fois
+        return [appel() for appel in appels]
+    futures = [
+        executeur_lectures.submit(contextvars.copy_context().run, _executer_lecture, appel)
+        for appel in appels
+    ]
+    return [future.result() for future in futures]
+
 ####################################
 ##### Gestion des commentaires #####
 ####################################
@@ -149,6 +233,8 @@ def ajouter_commentaire(
     if rstatus.get("status") != 200:
         return rstatus
 
+    avancer_versions_bouteilles(config_db, [nom_bouteille])  # La page de la bouteille affiche ses commentaires
+
     return {"message": "Le commentaire a été ajouté avec succès !", "status": 200}
 
 def supprimer_commentaire(config_db: dict, query: dict) -> dict:
@@ -167,12 +253,15 @@ def supprimer_commentaire(config_db: dict, query: dict) -> dict:
     dict
         Un dictionnaire avec le résultat de l'opération.
     """
+    bouteilles: set = bouteilles_concernees(config_db, "commentaire", query)
     rstatus: dict = effectuer_operation_db(config_db, "commentaire", "delete", query=query)
 
     # Vérifie si une erreur est survenue lors de l'opération
     if rstatus.get("status") != 200:
         return rstatus
 
+    avancer_versions_bouteilles(config_db, bouteilles)
+
     return {"message": "Le commentaire a été supprimé avec succès !", "status": 200}
 
 def mettre_a_jour_commentaire(config_db: dict, query: dict, data: dict) -> dict:
@@ -193,12 +282,15 @@ def mettre_a_jour_commentaire(config_db: dict, query: dict, data: dict) -> dict:
     dict
         Un dictionnaire avec le résultat de l'opération.
     """
+    bouteilles: set = bouteilles_concernees(config_db, "commentaire", query, data)
     rstatus: dict = effectuer_operation_db(config_db, "commentaire", "update", data=data, query=query)
 
     # Vérifie si une erreur est survenue lors de l'opération
     if rstatus.get("status") != 200:
         return rstatus
 
+    avancer_versions_bouteilles(config_db, bouteilles)
+
     return {"message": "Le commentaire a été mis à jour avec succès !", "status": 200}
 
 def recuperer_commentaire(config_db: dict, query: dict = None) -> dict:
@@ -265,8 +357,96 @@ def ajouter_notes(config_db: dict, nom_bouteille: str, note: float, login: str)
     if rstatus.get("status") != 200:
         return rstatus
 
+    # Met à jour la moyenne stockée dans la bouteille
+    Connexdb(**config_db).bulk_update_in_collection("bouteille", agregats_notes([data]))
+    after_commit(lambda: reponses_cache.purger(f"bouteille:{nom_bouteille}"))
+
     return {"message": "La note a été ajoutée avec succès !", "status": 200}
 
+def agregats_notes(notes: list) -> list:
+    """
+    Prépare la mise à jour des agrégats de notes des bouteilles.
+
+    Chaque bouteille notée garde la somme (``notes_somme``) et le nombre
+    (``notes_nombre``) de ses notes, incrémentés sans relire la collection
+    'note', et sa moyenne (``moyen``) qui en est déduite. La version de la
+    bouteille (``_rev``, ``maj_le``) avance dans la même écriture : sa page,
+    qui affiche notes et commentaires, a changé.
+
+    Parameters
+    ----------
+    notes : list
+        Les documents de notes ajoutés.
+
+    Returns
+    -------
+    list
+        Les couples (requête, pipeline de mise à jour) à passer à
+        ``Connexdb.bulk_update_in_collection`` sur la collection 'bouteille'.
+    """
+    par_bouteille: dict = {}
+    for note in notes:
+        somme, nombre = par_bouteille.get(note["nom_bouteille"], (0, 0))
+        par_bouteille[note["nom_bouteille"]] = (somme + note["note"], nombre + 1)
+
+    return [
+        ({"nom": nom_bouteille}, [
+            {"$set": {
+                "notes_somme": {"$add": [{"$ifNull": ["$notes_somme", 0]}, somme]},
+                "notes_nombre": {"$add": [{"$ifNull": ["$notes_nombre", 0]}, nombre]},
+                "_rev": {"$add": [{"$ifNull": ["$_rev", 0]}, 1]},
+                "maj_le": "$$NOW",
+            }},
+            {"$set": {"moyen": {"$divide": ["$notes_somme", "$notes_nombre"]}}},
+        ])
+        for nom_bouteille, (somme, nombre) in par_bouteille.items()
+    ]
+
+def versions_bouteilles(noms: list) -> list:
+    """
+    Prépare l'avancement de la version (``_rev``, ``maj_le``) de bouteilles
+    dont la page a changé sans que leur document change (commentaires).
+
+    Returns
+    -------
+    list
+        Les couples (requête, pipeline de mise à jour) à passer à
+        ``Connexdb.bulk_update_in_collection`` sur la collection 'bouteille'.
+    """
+    return [
+        ({"nom": nom_bouteille}, [
+            {"$set": {"_rev": {"$add": [{"$ifNull": ["$_rev", 0]}, 1]}, "maj_le": "$$NOW"}},
+        ])
+        for nom_bouteille in noms
+    ]
+
+def avancer_versions_bouteilles(config_db: dict, noms) -> None:
+    """
+    Avance la version des bouteilles dont les commentaires ou les notes ont
+    changé, puis purge leurs pages en cache (après la validation d'une transaction).
+
+    Les ETag de la page d'une bouteille sont calculés depuis sa version seule :
+    sans cela, un navigateur qui revalide sa copie recevrait un 304.
+    """
+    noms = list(noms)
+    if not noms:
+        return
+    rstatus: dict = Connexdb(**config_db).bulk_update_in_collection("bouteille", versions_bouteilles(noms))
+    if rstatus.get("status") != 200:
+        logger.error("Version de %d bouteille(s) non mise à jour : %s", len(noms), rstatus.get("message"))
+    after_commit(lambda: reponses_cache.purger(*(f"bouteille:{nom}" for nom in noms)))
+
+def bouteilles_concernees(config_db: dict, collection: str, query: dict, data: dict = None) -> set:
+    """
+    Retourne les noms des bouteilles des commentaires ou des notes sélectionnés
+    par ``query`` (lus avant leur modification), et celui que leur donne ``data``.
+    """
+    rstatus: dict = Connexdb(**config_db).get_data_from_collection(collection, query or {}, {"nom_bouteille": 1})
+    noms: set = {document["nom_bouteille"] for document in rstatus.get("data", []) if "nom_bouteille" in document}
+    if data and "nom_bouteille" in data:
+        noms.add(data["nom_bouteille"])
+    return noms
+
 def supprimer_notes(config_db: dict, query: dict) -> dict:
     """
     Supprime une note de la collection 'note'.
@@ -283,12 +463,16 @@ def supprimer_notes(config_db: dict, query: dict) -> dict:
     dict
         Un dictionnaire avec le résultat de l'opération.
     """
+    bouteilles: set = bouteilles_concernees(config_db, "note", query)
     rstatus: dict = effectuer_operation_db(config_db, "note", "delete", query=query)
 
     # Vérifie si une erreur est survenue lors de l'opération
     if rstatus.get("status") != 200:
         return rstatus
 
+    # La moyenne sera corrigée par la réconciliation des compteurs ; la page change dès maintenant
+    avancer_versions_bouteilles(config_db, bouteilles)
+
     return {"message": "La note a été supprimée avec succès !", "status": 200}
 
 def mettre_a_jour_notes(config_db: dict, query: dict, data: dict) -> dict:
@@ -309,12 +493,16 @@ def mettre_a_jour_notes(config_db: dict, query: dict, data: dict) -> dict:
     dict
         Un dictionnaire avec le résultat de l'opération.
     """
+    bouteilles: set = bouteilles_concernees(config_db, "note", query, data)
     rstatus: dict = effectuer_operation_db(config_db, "note", "update", data=data, query=query)
 
     # Vérifie si une erreur est survenue lors de l'opération
     if rstatus.get("status") != 200:
         return rstatus
 
+    # La moyenne sera corrigée par la réconciliation des compteurs ; la page change dès maintenant
+    avancer_versions_bouteilles(config_db, bouteilles)
+
     return {"message": "La note a été mise à jour avec succès !", "status": 200}
 
 def recuperer_notes(config_db: dict, query: dict = None) -> dict:
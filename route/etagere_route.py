@@ -1,14 +1,19 @@
 # route/etagere_route.py
 
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse, HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from Classes.etageres import Etagere
+from Classes.vues import EtagereVue, hydrater_tous
 from route.dependencies import get_user_cookies, config_db
+from templating import templates
+from budget import budget_db
+from changements import derniere_sequence
+from diffusion import diffuseur, CANAL_ETAGERES, ENTETES_FLUX
+from serialisation import ReponseJSON
+from validateurs import lire_versions, calculer_validateurs, non_modifie, appliquer_validateurs
 from typing import Optional
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 def check_login(user_cookies: dict):
     """Vérifie si l'utilisateur est connecté.
@@ -23,6 +28,7 @@ def check_login(user_cookies: dict):
         raise HTTPException(status_code=403, detail="User not logged in.")
 
 @router.get("/", response_class=HTMLResponse)
+@budget_db(2)
 async def manage_etageres(request: Request, user_cookies: dict = Depends(get_user_cookies)):
     """Affiche la page de gestion des étagères.
 
@@ -39,7 +45,9 @@ async def manage_etageres(request: Request, user_cookies: dict = Depends(get_use
     check_login(user_cookies)  # Vérifie si l'utilisateur est connecté
     
     login = user_cookies.get("login")  # Récupère le login de l'utilisateur à partir des cookies
-    etagere = Etagere(config_db=config_db, login=login)  # Crée une instance d'Etagere
+    etagere = Etagere.model_construct(config_db=config_db, login=login)  # Lecture seule : sans validation
+    # Lue avant les étagères : une modification intermédiaire sera renvoyée par /sync
+    seq = derniere_sequence(config_db)
     etageres_info = etagere.get_etageres()  # Appelle la méthode pour obtenir les étagères
 
     if etageres_info.get("status") != 200:
@@ -47,10 +55,26 @@ async def manage_etageres(request: Request, user_cookies: dict = Depends(get_use
 
     return templates.TemplateResponse("etagere.html", {
         "request": request,
-        "etageres": etageres_info['data'],  # Passe la liste des étagères au modèle
+        "etageres": hydrater_tous(EtagereVue, etageres_info['data']),  # Passe la liste des étagères au modèle
+        "seq": seq,  # Point de départ de la synchronisation incrémentale
         **user_cookies
     })
 
+@router.get("/live")
+async def etageres_live(user_cookies: dict = Depends(get_user_cookies)):
+    """Flux SSE de l'occupation des étagères.
+
+    Args:
+        user_cookies (dict): Dictionnaire contenant les cookies de l'utilisateur.
+
+    Returns:
+        StreamingResponse: Un événement ``etagere`` (clé, opération, cave, places,
+        bouteilles) à chaque modification d'une étagère.
+    """
+    check_login(user_cookies)  # Vérifie si l'utilisateur est connecté
+
+    return StreamingResponse(diffuseur.flux(CANAL_ETAGERES), media_type="text/event-stream", headers=ENTETES_FLUX)
+
 @router.delete("/delete/{num_etagere}", response_model=dict)
 async def delete_etagere(num_etagere: int, cave: str, user_cookies: dict = Depends(get_user_cookies)):
     """Supprime une étagère spécifique.
@@ -104,32 +128,41 @@ async def get_etagere(num_etagere: int, user_cookies: dict = Depends(get_user_co
     if etagere_info.get("status") != 200:
         raise HTTPException(status_code=404, detail="Étagère non trouvée.")
 
-    return JSONResponse(content=etagere_info)
+    return ReponseJSON(content=etagere_info)
 
 @router.get("/gets/", response_model=dict)
-async def get_all_etageres(user_cookies: dict = Depends(get_user_cookies)):
+@budget_db(2)
+async def get_all_etageres(request: Request, user_cookies: dict = Depends(get_user_cookies)):
     """Récupère toutes les étagères.
 
     Args:
+        request (Request): La requête HTTP (validateurs If-None-Match du client).
         user_cookies (dict): Dictionnaire contenant les cookies de l'utilisateur.
 
     Returns:
-        dict: Les informations sur toutes les étagères.
+        dict: Les informations sur toutes les étagères, ou 304 si le client les a déjà.
 
     Raises:
         HTTPException: Si aucune étagère n'est trouvée (404 Not Found).
     """
     check_login(user_cookies)  # Vérifie si l'utilisateur est connecté
 
+    # Versions des étagères : ETag seulement, une suppression ne change pas la date la plus récente
+    versions = lire_versions(config_db, "etagere", {})
+    validateurs = calculer_validateurs(user_cookies, versions) if versions is not None else None
+    reponse = non_modifie(request, validateurs)
+    if reponse is not None:
+        return reponse
+
     login = user_cookies.get("login")  # Récupère le login de l'utilisateur à partir des cookies
-    etagere = Etagere(login=login, config_db=config_db)  # Crée une instance d'Etagere
+    etagere = Etagere.model_construct(login=login, config_db=config_db)  # Lecture seule : sans validation
 
     etageres_info = etagere.get_etageres()  # Supposons que cette méthode récupère toutes les étagères
 
     if etageres_info.get("status") != 200:
         raise HTTPException(status_code=404, detail="Aucune étagère trouvée.")
 
-    return JSONResponse(content=etageres_info)
+    return appliquer_validateurs(ReponseJSON(content=etageres_info), validateurs)
 
 @router.put("/update/{num_etagere}", response_model=dict)
 async def update_etagere(num_etagere: int, etagere_data: Etagere, user_cookies: dict = Depends(get_user_cookies)):
@@ -0,0 +1,45 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from .dependencies import get_user_cookies, config_db
+from changements import changements_depuis
+from budget import budget_db
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("", response_class=JSONResponse)
+@budget_db(6)
+async def synchroniser(since: int = Query(0, ge=0), user_cookies: dict = Depends(get_user_cookies)):
+    """
+    Retourne les entités modifiées depuis la dernière synchronisation du client.
+
+    Parameters
+    ----------
+    since : int
+        Le numéro ``seq`` retourné par la synchronisation précédente (ou par la
+        page chargée) ; seules les modifications suivantes sont retournées.
+    user_cookies : dict
+        Les cookies de l'utilisateur : seules les entités qui le concernent sont retournées.
+
+    Returns
+    -------
+    JSONResponse
+        ``seq`` (le ``since`` de la synchronisation suivante), ``suite`` (vrai
+        s'il faut synchroniser à nouveau tout de suite) et ``changements`` :
+        l'entité, sa clé, l'opération et ses données actuelles.
+    """
+    if not user_cookies["login"]:
+        raise HTTPException(status_code=401, detail="Utilisateur non connecté")
+
+    rstatus: dict = await run_in_threadpool(changements_depuis, config_db, since, user_cookies["login"])
+    if rstatus.get("status") != 200:
+        return JSONResponse(status_code=500, content={"status": "error", "message": rstatus.get("message")})
+
+    return JSONResponse(content={
+        "status": "success",
+        "seq": rstatus["seq"],
+        "suite": rstatus["suite"],
+        "changements": rstatus["changements"],
+    })
@@ -0,0 +1,58 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from .dependencies import get_user_cookies, config_db
+from taches import soumettre, etat_tache
+from budget import budget_db
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.post("/reconcilier", response_class=JSONResponse)
+@budget_db(1)
+async def reconcilier(user_cookies: dict = Depends(get_user_cookies)):
+    """
+    Lance en arrière-plan le recalcul des compteurs dénormalisés (réservé aux admins).
+
+    Returns
+    -------
+    JSONResponse
+        L'identifiant de la tâche de réconciliation.
+    """
+    if user_cookies["perm"] != "admin":
+        raise HTTPException(status_code=403, detail="Accès interdit")
+
+    rstatus: dict = soumettre(config_db, "reconcilier_compteurs", login=user_cookies["login"])
+    if rstatus.get("status") != 200:
+        return JSONResponse(status_code=500, content={"status": "error", "message": rstatus.get("message")})
+
+    return JSONResponse(status_code=202, content={"status": "success", "tache": rstatus["id"]})
+
+@router.get("/{id_tache}", response_class=JSONResponse)
+@budget_db(1)
+async def etat(id_tache: str, user_cookies: dict = Depends(get_user_cookies)):
+    """
+    Retourne l'état et la progression d'une tâche.
+
+    Parameters
+    ----------
+    id_tache : str
+        L'identifiant de la tâche, retourné à sa soumission.
+    user_cookies : dict
+        Les cookies de l'utilisateur : seuls l'auteur de la tâche et les admins y ont accès.
+
+    Returns
+    -------
+    JSONResponse
+        L'état (en_attente, en_cours, terminee, echec), le nombre d'essais,
+        la progression, le résultat et la dernière erreur de la tâche.
+    """
+    if not user_cookies["login"]:
+        raise HTTPException(status_code=401, detail="Utilisateur non connecté")
+
+    rstatus: dict = etat_tache(config_db, id_tache)
+    tache: dict = rstatus.get("data")
+    if rstatus.get("status") != 200 or (tache["login"] != user_cookies["login"] and user_cookies["perm"] != "admin"):
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Tâche introuvable"})
+
+    return JSONResponse(content={"status": "success", "tache": tache})
@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Request, Depends, Form
+import logging
+from fastapi import APIRouter, Request, Depends, Form, Cookie
 from fastapi.responses import RedirectResponse, HTMLResponse
-from fastapi.templating import Jinja2Templates
 from Classes.personne import Personne
-from .dependencies import get_user_cookies, config_db
+from starlette.concurrency import run_in_threadpool
+from .dependencies import get_user_cookies, config_db, lectures_concurrentes, nouvelle_generation_session
+from session import sessions, config_session
+from identifiants import executer, hacher, IdentifiantsSatures
+from templating import templates
+from budget import budget_db
+from taches import soumettre
+from validateurs import lire_versions, calculer_validateurs, non_modifie, appliquer_validateurs
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+logger = logging.getLogger(__name__)
 
 @router.get("/login", response_class=HTMLResponse)
 async def login(request: Request, user_cookies: dict = Depends(get_user_cookies)):
@@ -16,6 +23,7 @@ async def login(request: Request, user_cookies: dict = Depends(get_user_cookies)
     return templates.TemplateResponse("login.html", {"request": request})
 
 @router.post("/auth", response_class=HTMLResponse)
+@budget_db(2)
 async def login_post(request: Request, login: str = Form(...), password: str = Form(...)):
     """Authentifie l'utilisateur avec les identifiants fournis. Redirige vers l'accueil en cas de succès."""
     user = Personne(
@@ -24,7 +32,12 @@ async def login_post(request: Request, login: str = Form(...), password: str = F
         collections="user",
         config_db=config_db
     )
-    auth_result: dict = user.auth()  # Appelle la méthode d'authentification
+    try:
+        # La vérification du mot de passe (scrypt) s'exécute dans le pool dédié, hors de la boucle
+        auth_result: dict = await executer(user.auth)
+    except IdentifiantsSatures:
+        return templates.TemplateResponse("login.html", {"request": request, "error": "Trop de connexions simultanées, réessayez."},
+                                          status_code=503, headers={"Retry-After": "2"})
 
     if auth_result.get("status") == 200:
         user_data = auth_result.get("user_data", {})
@@ -32,12 +45,11 @@ async def login_post(request: Request, login: str = Form(...), password: str = F
         cookie_options = {
             "httponly": True,
             "samesite": 'Lax',
-            "expires": 3600,
+            "expires": config_session["duree"],
             "secure": request.url.scheme == "https"
         }
-        # Définit les cookies de session pour l'utilisateur
-        for key in ["login", "perm", "email", "nom", "prenom"]:
-            response.set_cookie(key=key, value=user_data.get(key, ""), **cookie_options)
+        # Définit le cookie portant le jeton de session signé
+        response.set_cookie(key=config_session["cookie"], value=sessions.ouvrir(user_data), **cookie_options)
         return response
 
     error_message = "Authentication failed"  # Message d'erreur par défaut
@@ -48,11 +60,12 @@ async def login_post(request: Request, login: str = Form(...), password: str = F
     return templates.TemplateResponse("login.html", {"request": request, "error": error_message})
 
 @router.get("/logout")
-async def logout():
-    """Déconnecte l'utilisateur en supprimant les cookies de session."""
+async def logout(session: str = Cookie(None)):
+    """Déconnecte l'utilisateur en révoquant ses sessions (sur tous les workers) et en supprimant le cookie."""
+    if session:
+        await run_in_threadpool(sessions.revoquer, session, nouvelle_generation_session)
     response = RedirectResponse(url="/user/login")
-    for key in ["login", "nom", "prenom", "perm"]:
-        response.delete_cookie(key=key)  # Supprime les cookies de session
+    response.delete_cookie(key=config_session["cookie"])  # Supprime le cookie de session
     return response
 
 @router.get("/profil", response_class=HTMLResponse)
@@ -67,12 +80,34 @@ async def profil(request: Request, user_cookies: dict = Depends(get_user_cookies
     })
 
 @router.get("/collection", response_class=HTMLResponse)
+@budget_db(6)
 async def collection(request: Request, user_cookies: dict = Depends(get_user_cookies)):
-    """Affiche la collection de bouteilles et de caves de l'utilisateur."""
+    """
+    Affiche la collection de bouteilles et de caves de l'utilisateur.
+
+    Les versions du compte, de ses caves et de ses bouteilles sont lues
+    d'abord : si le client a déjà cette page, elle n'est pas reconstruite.
+    """
     if user_cookies["login"] is None:
         return RedirectResponse(url="/user/login", status_code=302)
 
-    user = Personne(
+    validateurs = None
+    versions_compte = lire_versions(config_db, "user", {"login": user_cookies["login"]}, ("caves", "bouteille_reserver"))
+    if versions_compte:
+        compte: dict = versions_compte[0]
+        versions_caves, versions_bouteilles = lectures_concurrentes(
+            lambda: lire_versions(config_db, "caves", {"nom": {"$in": compte.get("caves", [])}}),
+            lambda: lire_versions(config_db, "bouteille", {"nom": {"$in": compte.get("bouteille_reserver", [])}})
+        )
+        if versions_caves is not None and versions_bouteilles is not None:
+            compte = {"_id": compte["_id"], "_rev": compte.get("_rev", 0)}
+            validateurs = calculer_validateurs(user_cookies, [compte], versions_caves, versions_bouteilles)
+    reponse = non_modifie(request, validateurs)
+    if reponse is not None:
+        return reponse
+
+    # Lecture seule : les champs viennent de la session, ils ne sont pas revalidés
+    user = Personne.model_construct(
         perm=user_cookies["perm"],
         login=user_cookies["login"],
         password="",  # Le mot de passe n'est pas nécessaire pour récupérer les caves
@@ -82,15 +117,14 @@ async def collection(request: Request, user_cookies: dict = Depends(get_user_coo
         config_db=config_db
     )
 
-    bottles_response = user.get_bottles()  # Récupère les bouteilles réservées
-    caves_response = user.get_caves()  # Récupère les caves associées
+    collection_response = user.get_collection()  # Récupère en parallèle les bouteilles réservées et les caves
 
-    return templates.TemplateResponse("collection.html", {
+    return appliquer_validateurs(templates.TemplateResponse("collection.html", {
         "request": request,
         **user_cookies,
-        "bouteilles": bottles_response["data"],
-        "caves": caves_response["data"]  # Passe les données des caves au template
-    })
+        "bouteilles": collection_response["bouteilles"],
+        "caves": collection_response["caves"]  # Passe les données des caves au template
+    }), validateurs)
 
 @router.get("/delete/{user_login}", response_class=HTMLResponse)
 async def delete(request: Request, user_login: str, user_cookies: dict = Depends(get_user_cookies)):
@@ -113,8 +147,10 @@ async def delete(request: Request, user_login: str, user_cookies: dict = Depends
             "status_code": 403
         }
 
-    # Supprime de la base de données
-    user.delete()
+    # Supprime l'utilisateur et ses données en arrière-plan (suppression en cascade)
+    rstatus: dict = soumettre(config_db, "supprimer_utilisateur", {"login": user_login}, user_cookies["login"])
+    logger.debug("Suppression de l'utilisateur %s : tâche %s", user_login, rstatus.get("id"))
+    sessions.invalider_utilisateur(user_login)
 
     # Réinitialise toutes les variables de cookie
     response = RedirectResponse(url="/user/logout", status_code=302)
@@ -146,9 +182,14 @@ async def create_post(request: Request,
         collections="user"
     )
 
-    rstatus: dict = user.create()  # Appelle la méthode de création d'utilisateur
+    try:
+        # L'empreinte du mot de passe est calculée dans le pool dédié, hors de la boucle
+        rstatus: dict = await executer(user.create)
+    except IdentifiantsSatures:
+        return templates.TemplateResponse("create_user.html", {"request": request, "error": "Serveur occupé, réessayez."},
+                                          status_code=503, headers={"Retry-After": "2"})
 
-    print(rstatus)
+    logger.debug("Création de l'utilisateur %s : %s", login, rstatus.get("status"))
 
     if rstatus.get("status") != 200:
         error_message = rstatus.get("message", rstatus.get("message"))
@@ -198,23 +239,18 @@ async def update_post(request: Request,
     }
 
     if password:
-        user.password = password
+        try:
+            data["password"] = await executer(hacher, password)
+        except IdentifiantsSatures:
+            return templates.TemplateResponse("update_user.html", {"request": request, "error": "Serveur occupé, réessayez.", **user_cookies},
+                                              status_code=503, headers={"Retry-After": "2"})
 
     rstatus: dict = user.update(data)  # Appelle la méthode de mise à jour des informations utilisateur
 
-    print(rstatus)
+    logger.debug("Mise à jour de l'utilisateur %s : %s", login, rstatus.get("status"))
 
-    cookie_options = {
-        "httponly": True,
-        "samesite": 'Lax',
-        "expires": 3600,
-        "secure": request.url.scheme == "https"
-    }
+    # Les sessions ouvertes seront relues depuis la base avec les nouvelles informations
+    sessions.invalider_utilisateur(user_cookies["login"])
+    sessions.invalider_utilisateur(str(login))
 
-    # Met à jour les cookies
-    response = RedirectResponse(url="/user/profil", status_code=302)
-    response.set_cookie(key="nom", value=nom, **cookie_options)
-    response.set_cookie(key="prenom", value=prenom, **cookie_options)
-    response.set_cookie(key="perm", value=perm, **cookie_options)
-    response.set_cookie(key="email", value=email, **cookie_options)
-    return response
+    return RedirectResponse(url="/user/profil", status_code=302)
@@ -0,0 +1,52 @@
+import base64
+import orjson
+from bson import ObjectId, Decimal128
+from fastapi.responses import JSONResponse
+
+#########################
+##### Configuration #####
+#########################
+
+config_serialisation: dict = {
+    # Dates naïves de pymongo écrites en UTC (+00:00) ; clés non textuelles (numéros d'étagère) acceptées
+    "options": orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS,
+}
+
+def _defaut(valeur):
+    """Encode les types de MongoDB qu'orjson ne connaît pas (appelée par orjson pour ces seules valeurs)."""
+    if isinstance(valeur, ObjectId):
+        return str(valeur)
+    if isinstance(valeur, (bytes, bytearray, memoryview)):
+        # Photos des bouteilles et des utilisateurs
+        return base64.b64encode(valeur).decode("ascii")
+    if isinstance(valeur, Decimal128):
+        return str(valeur)
+    if isinstance(valeur, (set, frozenset)):
+        return list(valeur)
+    raise TypeError(f"Type non sérialisable en JSON : {type(valeur).__name__}")
+
+def encoder_json(contenu) -> bytes:
+    """
+    Encode une valeur en JSON, documents MongoDB compris.
+
+    ``datetime`` est encodé nativement par orjson (ISO 8601) ; ``ObjectId``
+    en chaîne, ``bytes`` en base64. Contrairement à ``jsonable_encoder``,
+    la valeur n'est pas parcourue en Python avant l'encodage.
+
+    Parameters
+    ----------
+    contenu : Any
+        La valeur à encoder (dictionnaire, liste, document...).
+
+    Returns
+    -------
+    bytes
+        Le JSON encodé en UTF-8.
+    """
+    return orjson.dumps(contenu, default=_defaut, option=config_serialisation["options"])
+
+class ReponseJSON(JSONResponse):
+    """Réponse JSON encodée par orjson, qui accepte directement les documents MongoDB."""
+
+    def render(self, content) -> bytes:
+        return encoder_json(content)
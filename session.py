@@ -0,0 +1,242 @@
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+#########################
+##### Configuration #####
+#########################
+
+config_session: dict = {
+    "secret": os.environ.get("CAVEAVIN_SECRET"),  # Clé de signature des jetons de session
+    "cookie": "session",  # Nom du cookie portant le jeton
+    "duree": 3600,  # Durée de validité d'une session, en secondes
+    "sessions_max": 10000,  # Nombre maximal de sessions gardées en mémoire
+    # Âge (s) au-delà duquel une session en mémoire est relue dans la base : borne le délai
+    # avec lequel les autres workers voient une déconnexion ou un changement de permissions
+    "revalidation": 30,
+}
+
+# Champs de l'utilisateur conservés dans la session (ceux des anciens cookies)
+CHAMPS_SESSION: tuple = ("login", "perm", "nom", "prenom", "email")
+
+logger = logging.getLogger(__name__)
+
+if not config_session["secret"]:
+    # Jamais de clé par défaut : connue, elle permettrait de forger un jeton pour n'importe quel login
+    config_session["secret"] = secrets.token_urlsafe(32)
+    logger.warning("CAVEAVIN_SECRET non défini : clé de session aléatoire, propre à ce processus ; "
+                   "les sessions ne survivront pas à un redémarrage et ne seront pas reconnues par les autres workers")
+
+def _b64(donnees: bytes) -> str:
+    return base64.urlsafe_b64encode(donnees).rstrip(b"=").decode("ascii")
+
+def _b64_decoder(texte: str) -> bytes:
+    return base64.urlsafe_b64decode(texte + "=" * (-len(texte) % 4))
+
+class ChargementImpossible(Exception):
+    """Levée par un chargeur de sessions quand la base ne répond pas (à distinguer d'un utilisateur absent)."""
+
+def signer(charge: str, secret: str) -> str:
+    """Retourne la signature HMAC-SHA256 (tronquée, base64url) d'une chaîne."""
+    return _b64(hmac.new(secret.encode("utf-8"), charge.encode("utf-8"), hashlib.sha256).digest()[:18])
+
+class SessionCache:
+    """
+    Sessions ouvertes, en mémoire, avec expiration et taille bornée (LRU).
+
+    Le jeton remis au client est ``login.identifiant.expiration.generation.signature`` :
+    la signature HMAC suffit à vérifier qu'il a été émis par le serveur, et les
+    informations de l'utilisateur sont lues dans ce cache sans aller-retour
+    MongoDB. Si la session n'est pas en mémoire (redémarrage, autre worker,
+    éviction) ou y a été vérifiée il y a plus de ``revalidation`` secondes, elle
+    est relue avec ``chargeur``.
+
+    La génération est celle du compte (champ ``session_gen`` de l'utilisateur)
+    à l'ouverture de la session. La déconnexion l'avance dans la base : les
+    jetons émis jusque-là sont refusés par tous les workers, au plus tard
+    après ``revalidation`` secondes pour ceux qui gardaient la session en mémoire.
+
+    Attributes
+    ----------
+    hits : int
+        Le nombre de sessions servies depuis la mémoire.
+    misses : int
+        Le nombre de sessions reconstruites avec le chargeur.
+    """
+
+    def __init__(self, secret: str, duree: int, taille_max: int, revalidation: float):
+        self.secret = secret
+        self.duree = duree
+        self.taille_max = taille_max
+        self.revalidation = revalidation
+        self._sessions: OrderedDict = OrderedDict()  # identifiant -> (expiration, données, vérifiée le)
+        self._revoquees: dict = {}  # identifiant -> expiration, pour refuser un jeton déconnecté
+        self._lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def ouvrir(self, utilisateur: dict) -> str:
+        """
+        Ouvre une session pour un utilisateur authentifié.
+
+        Parameters
+        ----------
+        utilisateur : dict
+            Le document de l'utilisateur (seuls les champs de ``CHAMPS_SESSION``
+            et la génération ``session_gen`` sont gardés).
+
+        Returns
+        -------
+        str
+            Le jeton signé à placer dans le cookie de session.
+        """
+        identifiant = secrets.token_urlsafe(12)
+        expiration = int(time.time()) + self.duree
+        donnees = {champ: utilisateur.get(champ) for champ in CHAMPS_SESSION}
+        generation = int(utilisateur.get("session_gen", 0))
+        charge = f"{_b64(str(donnees['login']).encode('utf-8'))}.{identifiant}.{expiration}.{generation}"
+        with self._lock:
+            self._ajouter(identifiant, expiration, donnees, time.time())
+        return f"{charge}.{signer(charge, self.secret)}"
+
+    def verifier(self, jeton: str, chargeur: Callable[[str], dict] = None) -> dict:
+        """
+        Vérifie un jeton et retourne les données de sa session.
+
+        Parameters
+        ----------
+        jeton : str
+            Le jeton lu dans le cookie.
+        chargeur : Callable[[str], dict], optional
+            Fonction ``login -> document utilisateur`` (None s'il n'existe pas)
+            appelée si la session n'est pas en mémoire ou doit être revérifiée.
+            Elle lève ChargementImpossible si la base ne répond pas.
+
+        Returns
+        -------
+        dict
+            Les données de la session, ou None si le jeton est invalide, expiré ou révoqué.
+        """
+        identite = self._decoder(jeton)
+        if identite is None:
+            return None
+        login, identifiant, expiration, generation = identite
+        maintenant = time.time()
+
+        with self._lock:
+            if identifiant in self._revoquees:
+                return None
+            entree = self._sessions.get(identifiant)
+            if entree is not None and (chargeur is None or maintenant - entree[2] < self.revalidation):
+                self._sessions.move_to_end(identifiant)
+                self.hits += 1
+                return dict(entree[1])
+
+        if chargeur is None:
+            return None
+        try:
+            utilisateur = chargeur(login)
+        except ChargementImpossible:
+            # Base indisponible : une session déjà connue reste servie, sans être revérifiée
+            return dict(entree[1]) if entree is not None else None
+
+        with self._lock:
+            self.misses += 1
+            if (not utilisateur or int(utilisateur.get("session_gen", 0)) != generation
+                    or identifiant in self._revoquees):
+                # Utilisateur supprimé ou déconnecté (depuis ce worker ou un autre)
+                self._sessions.pop(identifiant, None)
+                return None
+            donnees = {champ: utilisateur.get(champ) for champ in CHAMPS_SESSION}
+            self._ajouter(identifiant, expiration, donnees, maintenant)
+        return dict(donnees)
+
+    def identifier(self, jeton: str) -> str:
+        """Retourne le login d'un jeton valide, sans consulter les sessions, ou None."""
+        identite = self._decoder(jeton)
+        return identite[0] if identite is not None else None
+
+    def revoquer(self, jeton: str, revocateur: Callable[[str], None] = None) -> None:
+        """
+        Ferme la session d'un jeton (déconnexion) : il ne sera plus accepté.
+
+        Parameters
+        ----------
+        jeton : str
+            Le jeton lu dans le cookie.
+        revocateur : Callable[[str], None], optional
+            Fonction ``login -> None`` qui avance la génération de session de
+            l'utilisateur dans la base, pour que les autres workers refusent
+            aussi le jeton. Toutes les sessions de l'utilisateur sont alors fermées.
+        """
+        identite = self._decoder(jeton)
+        if identite is None:
+            return
+        login, identifiant, expiration, _ = identite
+        with self._lock:
+            self._sessions.pop(identifiant, None)
+            self._revoquees[identifiant] = expiration
+            self._purger_revoquees()
+        if revocateur is not None:
+            revocateur(login)
+
+    def invalider_utilisateur(self, login: str) -> None:
+        """
+        Oublie les sessions en mémoire d'un utilisateur modifié ou supprimé.
+
+        Les jetons restent valides : la session sera reconstruite depuis la base
+        à la requête suivante, avec les nouvelles informations (ou refusée si
+        l'utilisateur n'existe plus). Les autres workers relisent la leur au
+        plus tard après ``revalidation`` secondes.
+        """
+        with self._lock:
+            for identifiant in [i for i, (_, donnees, _) in self._sessions.items() if donnees.get("login") == login]:
+                del self._sessions[identifiant]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "revoquees": len(self._revoquees),
+                    "hits": self.hits, "misses": self.misses}
+
+    def _decoder(self, jeton: str):
+        """Retourne ``(login, identifiant, expiration, generation)`` d'un jeton correctement signé et non expiré."""
+        if not jeton or jeton.count(".") != 4:
+            return None
+        charge, signature = jeton.rsplit(".", 1)
+        if not hmac.compare_digest(signature, signer(charge, self.secret)):
+            return None
+        login_b64, identifiant, expiration, generation = charge.split(".")
+        try:
+            expiration, generation = int(expiration), int(generation)
+            login = _b64_decoder(login_b64).decode("utf-8")
+        except (ValueError, UnicodeDecodeError):
+            return None
+        if expiration < time.time():
+            return None
+        return login, identifiant, expiration, generation
+
+    def _ajouter(self, identifiant: str, expiration: int, donnees: dict, verifiee_le: float) -> None:
+        self._sessions[identifiant] = (expiration, donnees, verifiee_le)
+        self._sessions.move_to_end(identifiant)
+        maintenant = time.time()
+        # Libère d'abord les sessions expirées les plus anciennes, puis les moins récemment utilisées
+        while self._sessions:
+            plus_ancien, (fin, *_) = next(iter(self._sessions.items()))
+            if fin >= maintenant and len(self._sessions) <= self.taille_max:
+                break
+            del self._sessions[plus_ancien]
+
+    def _purger_revoquees(self) -> None:
+        maintenant = time.time()
+        for identifiant in [i for i, fin in self._revoquees.items() if fin < maintenant]:
+            del self._revoquees[identifiant]
+
+sessions: SessionCache = SessionCache(config_session["secret"], config_session["duree"], config_session["sessions_max"],
+                                      config_session["revalidation"])
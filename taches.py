@@ -0,0 +1,462 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from bson import ObjectId
+from bson.errors import InvalidId
+from Classes.connexiondb import Connexdb
+from route.dependencies import config_db, lectures_concurrentes
+from Classes.bouteille import Bouteille
+from Classes.personne import Personne
+import changements
+from metrics import registre
+from session import sessions
+
+#########################
+##### Configuration #####
+#########################
+
+config_taches: dict = {
+    "actif": True,
+    "collection": "taches",  # Collection MongoDB des tâches (état, essais, progression, résultat)
+    "workers": 4,  # Tâches exécutées simultanément
+    "lot": 8,  # Tâches réservées au plus par passage
+    "intervalle": 1.0,  # Attente (s) entre deux passages quand la file est vide
+    "essais_max": 3,  # Nombre d'essais avant l'échec définitif d'une tâche
+    "reprise": 5.0,  # Délai (s) avant le premier nouvel essai, doublé à chaque échec
+    "bail": 600,  # Durée (s) au-delà de laquelle une tâche en cours est reprise (worker arrêté)
+    "limites": {  # Tâches d'un même type exécutées simultanément au plus
+        "importer_bouteilles": 1,
+        "reconcilier_compteurs": 1,
+    },
+    "import_max": 5000,  # Nombre maximal de bouteilles par import
+    "taille_lot_import": 500,  # Bouteilles insérées par écriture groupée
+    "taille_lot_compteurs": 500,  # Bouteilles corrigées par écriture groupée (réconciliation)
+}
+
+logger = logging.getLogger(__name__)
+
+EN_ATTENTE, EN_COURS, TERMINEE, ECHEC = "en_attente", "en_cours", "terminee", "echec"
+
+# Fonctions d'exécution des tâches, par type : fonction(config_db, params, avancement) -> dict
+HANDLERS: dict = {}
+
+taches_soumises = registre.compteur(
+    "caveavin_jobs_submitted_total",
+    "Nombre de tâches soumises, par type.",
+    ("type",)
+)
+taches_executees = registre.compteur(
+    "caveavin_jobs_finished_total",
+    "Nombre d'exécutions de tâches, par type et résultat (terminee, reprise, echec).",
+    ("type", "resultat")
+)
+taches_duree = registre.histogramme(
+    "caveavin_job_duration_seconds",
+    "Durée d'exécution des tâches, par type.",
+    ("type",)
+)
+taches_en_cours = registre.jauge(
+    "caveavin_jobs_running",
+    "Nombre de tâches en cours d'exécution dans ce processus, par type.",
+    ("type",)
+)
+
+def tache(nom: str):
+    """Enregistre une fonction comme exécutant des tâches de type ``nom``."""
+    def enregistrer(fonction: Callable) -> Callable:
+        HANDLERS[nom] = fonction
+        return fonction
+    return enregistrer
+
+def soumettre(config_db: dict, type_tache: str, params: dict = None, login: str = None) -> dict:
+    """
+    Enregistre une tâche dans la file ; elle sera exécutée en arrière-plan.
+
+    Parameters
+    ----------
+    config_db : dict
+        La configuration de connexion à MongoDB.
+    type_tache : str
+        Le type de la tâche (une clé de ``HANDLERS``).
+    params : dict, optional
+        Les paramètres transmis à la fonction d'exécution.
+    login : str, optional
+        L'utilisateur à l'origine de la tâche (seul autorisé, avec les admins, à consulter son état).
+
+    Returns
+    -------
+    dict
+        Le statut de l'opération et l'identifiant de la tâche (``id``).
+    """
+    if type_tache not in HANDLERS:
+        return {"status": 400, "message": f"Type de tâche inconnu : {type_tache}"}
+
+    maintenant = time.time()
+    document: dict = {
+        "type": type_tache,
+        "params": params or {},
+        "login": login,
+        "etat": EN_ATTENTE,
+        "essais": 0,
+        "progression": {"fait": 0, "total": None},
+        "resultat": None,
+        "erreur": None,
+        "cree_le": maintenant,
+        "disponible_le": maintenant,
+    }
+    rstatus: dict = Connexdb(**config_db).insert_data_into_collection(config_taches["collection"], document)
+    if rstatus.get("status") != 200:
+        return {"status": rstatus.get("status"), "message": "La tâche n'a pas pu être enregistrée."}
+
+    taches_soumises.inc(type_tache)
+    file_taches.reveiller()
+    return {"status": 200, "message": "Tâche enregistrée", "id": str(document["_id"])}
+
+def etat_tache(config_db: dict, identifiant: str) -> dict:
+    """
+    Retourne l'état d'une tâche.
+
+    Returns
+    -------
+    dict
+        Le statut de l'opération et le document de la tâche (``data``), sans ses paramètres.
+    """
+    try:
+        query: dict = {"_id": ObjectId(identifiant)}
+    except (InvalidId, TypeError):
+        return {"status": 404, "message": "Tâche introuvable", "data": None}
+
+    rstatus: dict = Connexdb(**config_db).get_data_from_collection(config_taches["collection"], query)
+    if rstatus.get("status") != 200:
+        return {"status": rstatus.get("status"), "message": rstatus.get("message"), "data": None}
+    if not rstatus.get("data"):
+        return {"status": 404, "message": "Tâche introuvable", "data": None}
+
+    document: dict = rstatus["data"][0]
+    document.pop("params", None)
+    document["_id"] = str(document["_id"])
+    return {"status": 200, "message": "Tâche trouvée", "data": document}
+
+class FileTaches:
+    """
+    File de tâches asynchrone, persistée dans MongoDB.
+
+    Une boucle asyncio réserve les tâches disponibles par lots (réservation
+    atomique avec ``find_one_and_update``, donc sûre entre plusieurs workers
+    uvicorn) et les exécute dans un pool de threads borné, en respectant une
+    limite de concurrence par type. Une tâche en échec est reprise avec un
+    délai croissant jusqu'à ``essais_max`` ; une tâche restée en cours au-delà
+    de son bail (processus arrêté) est reprise par un autre worker.
+    """
+
+    def __init__(self, config_db: dict, **options):
+        self.config_db = config_db
+        self.config: dict = {**config_taches, **options}
+        self.executeur: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=self.config["workers"],
+            thread_name_prefix="taches"
+        )
+        self.en_cours: Counter = Counter()  # Tâches en cours dans ce processus, par type
+        self._execution: set = set()
+        self._boucle: asyncio.Task = None
+        self._loop: asyncio.AbstractEventLoop = None
+        self._reveil: asyncio.Event = None
+        self._arret: bool = False
+
+    async def demarrer(self) -> None:
+        """Démarre la boucle de traitement (au démarrage de l'application)."""
+        if not self.config["actif"] or self._boucle is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._reveil = asyncio.Event()
+        self._arret = False
+        self._boucle = asyncio.create_task(self.boucle())
+
+    async def arreter(self, attente: float = 10.0) -> None:
+        """
+        Arrête la boucle et attend les tâches en cours.
+
+        Les tâches encore en cours après ``attente`` secondes seront reprises,
+        à l'expiration de leur bail, par un autre processus ou au redémarrage.
+        """
+        if self._boucle is None:
+            return
+        self._arret = True
+        self._reveil.set()
+        await self._boucle
+        self._boucle = None
+        if self._execution:
+            await asyncio.wait(self._execution, timeout=attente)
+
+    def reveiller(self) -> None:
+        """Signale qu'une tâche vient d'être soumise (appelable depuis n'importe quel thread)."""
+        if self._loop is not None and self._reveil is not None:
+            self._loop.call_soon_threadsafe(self._reveil.set)
+
+    async def boucle(self) -> None:
+        while not self._arret:
+            places: int = min(self.config["lot"], self.config["workers"] - sum(self.en_cours.values()))
+            reservees: list = []
+            if places > 0:
+                try:
+                    reservees = await self._loop.run_in_executor(self.executeur, self.reserver, places)
+                except Exception:
+                    logger.exception("Réservation des tâches impossible")
+
+            for document in reservees:
+                execution = asyncio.create_task(self.executer(document))
+                self._execution.add(execution)
+                execution.add_done_callback(self._execution.discard)
+
+            if len(reservees) < places or places <= 0:
+                # File vide ou toutes les places occupées : attend une soumission, une fin de tâche ou l'intervalle
+                self._reveil.clear()
+                try:
+                    await asyncio.wait_for(self._reveil.wait(), timeout=self.config["intervalle"])
+                except asyncio.TimeoutError:
+                    pass
+
+    def reserver(self, nombre: int) -> list:
+        """Réserve jusqu'à ``nombre`` tâches disponibles, en respectant les limites par type."""
+        connex: Connexdb = Connexdb(**self.config_db)
+        en_cours: Counter = Counter(self.en_cours)
+        reservees: list = []
+        for _ in range(nombre):
+            maintenant = time.time()
+            satures: list = [
+                type_tache for type_tache, limite in self.config["limites"].items() if en_cours[type_tache] >= limite
+            ]
+            query: dict = {
+                "$or": [
+                    {"etat": EN_ATTENTE, "disponible_le": {"$lte": maintenant}},
+                    {"etat": EN_COURS, "bail_expire": {"$lt": maintenant}},
+                ],
+                "type": {"$in": [type_tache for type_tache in HANDLERS if type_tache not in satures]},
+            }
+            update: dict = {
+                "$set": {"etat": EN_COURS, "debut": maintenant, "bail_expire": maintenant + self.config["bail"]},
+                "$inc": {"essais": 1},
+            }
+            rstatus: dict = connex.find_one_and_update_in_collection(
+                self.config["collection"], query, update, sort=[("disponible_le", 1)]
+            )
+            document = rstatus.get("data")
+            if document is None:
+                break
+            en_cours[document["type"]] += 1
+            reservees.append(document)
+        return reservees
+
+    async def executer(self, document: dict) -> None:
+        """Exécute une tâche réservée et enregistre son résultat."""
+        type_tache: str = document["type"]
+        self.en_cours[type_tache] += 1
+        taches_en_cours.inc(type_tache)
+        start = time.perf_counter()
+        try:
+            resultat = await self._loop.run_in_executor(
+                self.executeur, HANDLERS[type_tache], self.config_db, document.get("params", {}),
+                self._avancement(document["_id"])
+            )
+            erreur = None if resultat.get("status") == 200 else resultat.get("message")
+        except Exception as e:
+            logger.exception("Échec de la tâche %s (%s)", document["_id"], type_tache)
+            resultat, erreur = None, f"{type(e).__name__}: {e}"
+        finally:
+            self.en_cours[type_tache] -= 1
+            taches_en_cours.dec(type_tache)
+            taches_duree.observer(type_tache, valeur=time.perf_counter() - start)
+            self._reveil.set()
+
+        await self._loop.run_in_executor(self.executeur, self.terminer, document, resultat, erreur)
+
+    def terminer(self, document: dict, resultat: dict, erreur: str) -> None:
+        """Enregistre la fin d'une tâche : terminée, reprise plus tard, ou en échec définitif."""
+        maintenant = time.time()
+        # Une erreur de la demande elle-même (4xx) ne sera pas corrigée par un nouvel essai
+        definitif: bool = resultat is not None and 400 <= resultat.get("status", 500) < 500
+        if erreur is None:
+            etat, champs = TERMINEE, {"resultat": resultat}
+        elif document["essais"] >= self.config["essais_max"] or definitif:
+            etat, champs = ECHEC, {"resultat": resultat}
+        else:
+            etat, champs = EN_ATTENTE, {"disponible_le": maintenant + self.config["reprise"] * 2 ** (document["essais"] - 1)}
+        taches_executees.inc(document["type"], "reprise" if etat == EN_ATTENTE else etat)
+
+        rstatus: dict = Connexdb(**self.config_db).update_data_from_collection(
+            self.config["collection"], {"_id": document["_id"]},
+            {"etat": etat, "erreur": erreur, "fin": maintenant, "bail_expire": None, **champs}
+        )
+        if rstatus.get("status") != 200:
+            logger.error("État de la tâche %s non enregistré : %s", document["_id"], rstatus.get("message"))
+
+    def _avancement(self, identifiant: ObjectId) -> Callable[[int, int], None]:
+        """Retourne la fonction ``avancement(fait, total)`` d'une tâche, qui enregistre sa progression (au plus 2 fois/s)."""
+        connex: Connexdb = Connexdb(**self.config_db)
+        derniere: list = [0.0]
+
+        def avancement(fait: int, total: int = None) -> None:
+            maintenant = time.monotonic()
+            if maintenant - derniere[0] < 0.5 and fait != total:
+                return
+            derniere[0] = maintenant
+            connex.update_data_from_collection(
+                self.config["collection"], {"_id": identifiant},
+                {"progression": {"fait": fait, "total": total}, "bail_expire": time.time() + self.config["bail"]}
+            )
+
+        return avancement
+
+####################
+##### Handlers #####
+####################
+
+@tache("archiver_bouteille")
+def archiver_bouteille(config_db: dict, params: dict, avancement: Callable) -> dict:
+    """Archive une bouteille (notes et commentaires compris) puis la supprime."""
+    return Bouteille(nom=params["nom"], config_db=config_db).archiver()
+
+@tache("supprimer_utilisateur")
+def supprimer_utilisateur(config_db: dict, params: dict, avancement: Callable) -> dict:
+    """Supprime un utilisateur et, en cascade, ses caves, étagères, notes, commentaires et bouteilles."""
+    rstatus: dict = Personne(login=params["login"], config_db=config_db, collections="user").delete()
+    sessions.invalider_utilisateur(params["login"])
+    return rstatus
+
+@tache("reconcilier_compteurs")
+def reconcilier_compteurs(config_db: dict, params: dict, avancement: Callable) -> dict:
+    """
+    Recalcule les compteurs dénormalisés : le nombre de bouteilles des
+    étagères et les agrégats de notes des bouteilles (somme, nombre, moyenne).
+
+    Les agrégats recalculés sont comparés à ceux des bouteilles : seules les
+    bouteilles à corriger sont écrites, par lots, avec une écriture groupée
+    par lot. Une bouteille dont toutes les notes ont été supprimées retrouve
+    les agrégats d'une bouteille jamais notée.
+    """
+    connex: Connexdb = Connexdb(**config_db)
+
+    # Une seule écriture pour toutes les étagères (mise à jour par pipeline) ;
+    # seules les étagères corrigées changent de version
+    nb_bouteille: dict = {"$size": {"$ifNull": ["$bouteilles", []]}}
+    corrigee: dict = {"$ne": ["$nb_bouteille", nb_bouteille]}
+    etageres: dict = connex.update_many_in_collection("etagere", {}, [
+        {"$set": {
+            "_rev": {"$cond": [corrigee, {"$add": [{"$ifNull": ["$_rev", 0]}, 1]}, "$_rev"]},
+            "maj_le": {"$cond": [corrigee, "$$NOW", "$maj_le"]},
+        }},
+        {"$set": {"nb_bouteille": nb_bouteille}},
+    ])
+    if etageres.get("status") != 200:
+        return etageres
+
+    champs: tuple = ("moyen", "notes_somme", "notes_nombre")
+    moyennes, bouteilles = lectures_concurrentes(
+        lambda: connex.aggregate_collection("note", [
+            {"$match": {"note": {"$type": "number"}}},
+            {"$group": {"_id": "$nom_bouteille", "moyen": {"$avg": "$note"},
+                        "notes_somme": {"$sum": "$note"}, "notes_nombre": {"$sum": 1}}},
+        ]),
+        lambda: connex.get_all_data_from_collection("bouteille", {"nom": 1, **dict.fromkeys(champs, 1)})
+    )
+    for rstatus in (moyennes, bouteilles):
+        if rstatus.get("status") != 200:
+            return rstatus
+
+    agregats: dict = {groupe["_id"]: {champ: groupe[champ] for champ in champs} for groupe in moyennes["data"]}
+    sans_note: dict = {"moyen": -1.0, "notes_somme": 0, "notes_nombre": 0}  # Comme une bouteille jamais notée
+    corrections: list = []
+    for bouteille in bouteilles["data"]:
+        attendus: dict = agregats.get(bouteille.get("nom"))
+        if attendus is None:
+            if not bouteille.get("notes_nombre"):
+                continue  # Jamais notée : rien à corriger
+            attendus = sans_note
+        if any(bouteille.get(champ) != valeur for champ, valeur in attendus.items()):
+            corrections.append(({"nom": bouteille["nom"]}, {"$set": attendus}))
+
+    taille_lot: int = config_taches["taille_lot_compteurs"]
+    corrigees: list = []
+    for debut in range(0, len(corrections), taille_lot):
+        lot: list = corrections[debut:debut + taille_lot]
+        rstatus: dict = connex.bulk_update_in_collection("bouteille", lot)
+        if rstatus.get("status") != 200:
+            logger.error("Correction de %d bouteille(s) impossible : %s", len(lot), rstatus.get("message"))
+        else:
+            corrigees.extend(requete["nom"] for requete, _ in lot)
+        avancement(min(debut + taille_lot, len(corrections)), len(corrections))
+    changements.enregistrer_changements(config_db, "bouteille", corrigees, changements.MODIFICATION)
+
+    return {
+        "status": 200,
+        "message": "Compteurs réconciliés",
+        "etageres": etageres.get("modified", 0),
+        "bouteilles": len(corrigees),
+    }
+
+@tache("importer_bouteilles")
+def importer_bouteilles(config_db: dict, params: dict, avancement: Callable) -> dict:
+    """
+    Importe des bouteilles et les ajoute à la collection de l'utilisateur.
+
+    Comme ``Bouteille.create``, une bouteille déjà présente voit son nombre
+    d'exemplaires augmenter ; les nouvelles sont insérées par écritures groupées.
+    """
+    connex: Connexdb = Connexdb(**config_db)
+    bouteilles: list = params.get("bouteilles", [])
+    exemplaires: Counter = Counter(bouteille["nom"] for bouteille in bouteilles)
+    noms: list = list(exemplaires)
+
+    existantes: dict = connex.get_data_from_collection("bouteille", {"nom": {"$in": noms}})
+    if existantes.get("status") != 200:
+        return existantes
+    noms_existants: set = {bouteille["nom"] for bouteille in existantes["data"]}
+
+    # Bouteilles existantes : une écriture par nombre d'exemplaires ajoutés
+    par_nombre: dict = {}
+    for nom in noms_existants:
+        par_nombre.setdefault(exemplaires[nom], []).append(nom)
+    for nombre, groupe in par_nombre.items():
+        rstatus: dict = connex.update_many_in_collection("bouteille", {"nom": {"$in": groupe}}, {"$inc": {"numbers": nombre}})
+        if rstatus.get("status") != 200:
+            return rstatus
+    changements.enregistrer_changements(config_db, "bouteille", list(noms_existants), changements.MODIFICATION)
+
+    # Nouvelles bouteilles : la première occurrence de chaque nom, avec son nombre d'exemplaires
+    nouvelles: dict = {}
+    for bouteille in bouteilles:
+        if bouteille["nom"] not in noms_existants and bouteille["nom"] not in nouvelles:
+            nouvelles[bouteille["nom"]] = {**bouteille, "numbers": exemplaires[bouteille["nom"]]}
+    documents: list = list(nouvelles.values())
+    taille_lot: int = config_taches["taille_lot_import"]
+    inserees: int = 0
+    for debut in range(0, len(documents), taille_lot):
+        rstatus: dict = connex.insert_many_into_collection("bouteille", documents[debut:debut + taille_lot])
+        if rstatus.get("status") != 200:
+            return rstatus
+        inserees += rstatus.get("inserted", 0)
+        changements.enregistrer_changements(
+            config_db, "bouteille", [document["nom"] for document in documents[debut:debut + taille_lot]],
+            changements.CREATION
+        )
+        avancement(min(debut + taille_lot, len(documents)), len(documents))
+
+    if params.get("login"):
+        rstatus: dict = connex.update_many_in_collection(
+            "user", {"login": params["login"]}, {"$addToSet": {"bouteille_reserver": {"$each": noms}}}
+        )
+        if rstatus.get("status") != 200:
+            return rstatus
+        changements.enregistrer_changement(config_db, "user", params["login"], changements.MODIFICATION, [params["login"]])
+
+    return {
+        "status": 200,
+        "message": "Bouteilles importées",
+        "inserees": inserees,
+        "incrementees": len(noms_existants),
+    }
+
+file_taches: FileTaches = FileTaches(config_db)
@@ -0,0 +1,301 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bson import ObjectId
+from Classes.connexiondb import Connexdb
+from route.dependencies import config_db, agregats_notes, versions_bouteilles
+from metrics import registre
+from cache import reponses_cache
+
+#########################
+##### Configuration #####
+#########################
+
+config_tampon: dict = {
+    "actif": os.environ.get("CAVEAVIN_TAMPON", "0") == "1",
+    "dossier": os.environ.get("CAVEAVIN_TAMPON_DOSSIER", "tampon"),  # Journaux locaux des soumissions
+    "intervalle": 0.25,  # Délai (s) entre deux vidages vers MongoDB
+    "profondeur_max": 20000,  # Documents en attente au-delà desquels les soumissions sont écrites directement
+    "fsync": True,  # Force l'écriture sur disque de chaque soumission avant de l'acquitter
+}
+
+# Collections dont les insertions peuvent être différées
+COLLECTIONS: tuple = ("commentaire", "note")
+
+logger = logging.getLogger(__name__)
+
+tampon_profondeur = registre.jauge(
+    "caveavin_write_buffer_depth",
+    "Nombre de documents acquittés en attente d'écriture dans MongoDB, par collection.",
+    ("collection",)
+)
+tampon_vidage = registre.histogramme(
+    "caveavin_write_buffer_flush_seconds",
+    "Durée des vidages du tampon d'écriture (insert_many et agrégats)."
+)
+tampon_ecrits = registre.compteur(
+    "caveavin_write_buffer_flushed_total",
+    "Nombre de documents écrits dans MongoDB par le tampon, par collection.",
+    ("collection",)
+)
+tampon_echecs = registre.compteur(
+    "caveavin_write_buffer_flush_errors_total",
+    "Nombre de vidages en échec (les documents sont gardés et réessayés)."
+)
+
+class TamponEcritures:
+    """
+    Tampon d'écriture différée (write-behind) des commentaires et des notes.
+
+    Une soumission est acquittée dès qu'elle est écrite (et synchronisée) dans
+    le journal local du processus. Périodiquement, le journal courant devient
+    un segment et ses documents sont écrits dans MongoDB avec un
+    ``insert_many`` par collection ; les agrégats de notes des bouteilles sont
+    mis à jour dans le même vidage, avec une seule écriture groupée. Le
+    segment n'est supprimé qu'après ces écritures : après un arrêt brutal, les
+    journaux orphelins sont rejoués au démarrage. Les documents portent leur
+    ``_id`` dès l'acquittement, si bien qu'un rejeu ne les duplique pas.
+
+    Attributes
+    ----------
+    segments : list
+        Les segments à écrire, du plus ancien au plus récent : (chemin, documents par collection).
+    """
+
+    def __init__(self, config_db: dict, **options):
+        self.config_db = config_db
+        self.config: dict = {**config_tampon, **options}
+        self.segments: list = []
+        self._courant: dict = {collection: [] for collection in COLLECTIONS}
+        self._lock = threading.Lock()  # Protège le journal courant et les documents qu'il contient
+        self._vidage = threading.Lock()  # Un seul vidage à la fois
+        self._journal = None
+        self._verrou = None
+        self._numero: int = 0
+        self._boucle: asyncio.Task = None
+        self._arret: asyncio.Event = None
+
+    @property
+    def actif(self) -> bool:
+        return self.config["actif"] and self._journal is not None
+
+    def profondeur(self) -> int:
+        """Retourne le nombre de documents acquittés et pas encore écrits dans MongoDB."""
+        with self._lock:
+            return sum(len(docs) for docs in self._courant.values()) + sum(
+                len(docs) for _, segment in self.segments for docs in segment.values()
+            )
+
+    def ouvrir(self) -> None:
+        """Rejoue les journaux laissés par un processus arrêté, puis ouvre le journal de ce processus."""
+        os.makedirs(self.config["dossier"], exist_ok=True)
+        # Verrou gardé pendant toute la vie du processus : ses journaux ne sont pas orphelins
+        self._verrou = open(os.path.join(self.config["dossier"], f"verrou-{os.getpid()}.lock"), "a")
+        fcntl.flock(self._verrou, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._reprendre_orphelins()
+        self._journal = open(self._chemin_journal(), "a", encoding="utf-8")
+
+    def ajouter(self, documents: list) -> dict:
+        """
+        Enregistre des documents à insérer et les acquitte après écriture dans le journal.
+
+        Parameters
+        ----------
+        documents : list
+            Les couples (collection, document) d'une même soumission.
+
+        Returns
+        -------
+        dict
+            Le statut : 200 si la soumission est enregistrée, 503 si le tampon
+            est plein ou inactif (l'appelant écrit alors directement).
+        """
+        if not self.actif or self.profondeur() + len(documents) > self.config["profondeur_max"]:
+            return {"status": 503, "message": "Tampon d'écriture indisponible"}
+
+        for _, document in documents:
+            document.setdefault("_id", ObjectId())
+        lignes = "".join(
+            json.dumps({"collection": collection, "document": _vers_json(document)}, ensure_ascii=False) + "\n"
+            for collection, document in documents
+        )
+        with self._lock:
+            self._journal.write(lignes)
+            self._journal.flush()
+            if self.config["fsync"]:
+                os.fsync(self._journal.fileno())
+            for collection, document in documents:
+                self._courant[collection].append(document)
+                tampon_profondeur.inc(collection)
+        return {"status": 200, "message": "Soumission enregistrée"}
+
+    def vider(self) -> bool:
+        """
+        Écrit dans MongoDB les documents en attente.
+
+        Returns
+        -------
+        bool
+            True si tous les segments ont été écrits ; les segments en échec sont gardés.
+        """
+        with self._vidage:
+            self._tourner()
+            while self.segments:
+                chemin, documents = self.segments[0]
+                start = time.perf_counter()
+                if not self._ecrire(documents):
+                    tampon_echecs.inc()
+                    return False
+                tampon_vidage.observer(valeur=time.perf_counter() - start)
+                with self._lock:
+                    self.segments.pop(0)
+                for collection, docs in documents.items():
+                    tampon_profondeur.dec(collection, montant=len(docs))
+                    tampon_ecrits.inc(collection, montant=len(docs))
+                if chemin is not None:
+                    os.remove(chemin)
+            return True
+
+    async def demarrer(self) -> None:
+        """Ouvre le journal et démarre les vidages périodiques (au démarrage de l'application)."""
+        if not self.config["actif"] or self._boucle is not None:
+            return
+        await asyncio.to_thread(self.ouvrir)
+        self._arret = asyncio.Event()
+        self._boucle = asyncio.create_task(self.boucle())
+
+    async def arreter(self) -> None:
+        """Arrête les vidages périodiques après un dernier vidage."""
+        if self._boucle is None:
+            return
+        self._arret.set()
+        await self._boucle
+        self._boucle = None
+        await asyncio.to_thread(self.vider)
+        with self._lock:
+            self._journal.close()
+            self._journal = None
+            if not any(self._courant.values()) and not self.segments:
+                os.remove(self._chemin_journal())
+                self._verrou.close()
+                os.remove(self._verrou.name)
+                self._verrou = None
+
+    async def boucle(self) -> None:
+        while not self._arret.is_set():
+            try:
+                await asyncio.wait_for(self._arret.wait(), timeout=self.config["intervalle"])
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await asyncio.to_thread(self.vider)
+            except Exception:
+                logger.exception("Vidage du tampon d'écriture impossible")
+
+    def _ecrire(self, documents: dict) -> bool:
+        """
+        Insère les documents d'un segment, puis met à jour les agrégats des
+        notes réellement insérées et la version des bouteilles seulement
+        commentées, et purge les pages des bouteilles concernées.
+        """
+        connex: Connexdb = Connexdb(**self.config_db)
+        notes_inserees: list = []
+        for collection, docs in documents.items():
+            rstatus: dict = connex.insert_many_into_collection(collection, docs, ignore_duplicates=True)
+            if rstatus.get("status") != 200:
+                logger.error("Vidage de %d document(s) dans '%s' impossible : %s", len(docs), collection, rstatus.get("message"))
+                return False
+            if collection == "note":
+                # Les notes déjà présentes (rejeu) ont déjà été comptées dans les agrégats
+                doublons: set = set(rstatus.get("duplicates", []))
+                notes_inserees = [doc for index, doc in enumerate(docs) if index not in doublons]
+
+        # Les agrégats des notes avancent aussi la version de leurs bouteilles
+        notees: set = {note["nom_bouteille"] for note in notes_inserees}
+        commentees: dict = dict.fromkeys(
+            doc["nom_bouteille"] for doc in documents.get("commentaire", []) if doc["nom_bouteille"] not in notees
+        )
+        rstatus: dict = connex.bulk_update_in_collection(
+            "bouteille", agregats_notes(notes_inserees) + versions_bouteilles(list(commentees))
+        )
+        if rstatus.get("status") != 200:
+            # Les notes sont écrites : la réconciliation des compteurs corrigera les moyennes
+            logger.error("Mise à jour des moyennes impossible : %s", rstatus.get("message"))
+
+        # Les pages des bouteilles commentées ou notées ont changé
+        reponses_cache.purger(*{
+            f"bouteille:{doc['nom_bouteille']}" for docs in documents.values() for doc in docs
+        })
+        return True
+
+    def _tourner(self) -> None:
+        """Fait du journal courant un segment à écrire et ouvre un nouveau journal."""
+        with self._lock:
+            if not any(self._courant.values()):
+                return
+            self._numero += 1
+            segment = os.path.join(self.config["dossier"], f"segment-{os.getpid()}-{self._numero}.jsonl")
+            self._journal.close()
+            os.replace(self._chemin_journal(), segment)
+            self._journal = open(self._chemin_journal(), "a", encoding="utf-8")
+            self.segments.append((segment, self._courant))
+            self._courant = {collection: [] for collection in COLLECTIONS}
+
+    def _reprendre_orphelins(self) -> None:
+        """Récupère les journaux et segments des processus arrêtés pour les écrire au prochain vidage."""
+        dossier: str = self.config["dossier"]
+        par_processus: dict = {}
+        for chemin in glob.glob(os.path.join(dossier, "*.jsonl")):
+            # journal-<pid>.jsonl, segment-<pid>-<n>.jsonl, repris-<pid>-<fichier repris>
+            par_processus.setdefault(os.path.basename(chemin).split("-")[1], []).append(chemin)
+
+        for pid, chemins in par_processus.items():
+            if pid == str(os.getpid()):
+                # Fichiers d'un processus précédent de même pid (pid 1 dans un conteneur) : ce verrou est le nôtre
+                for chemin in sorted(chemins):
+                    self._reprendre(chemin)
+                continue
+            # Un processus vivant garde le verrou de ses journaux
+            chemin_verrou = os.path.join(dossier, f"verrou-{pid}.lock")
+            with open(chemin_verrou, "a") as verrou:
+                try:
+                    fcntl.flock(verrou, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue
+                for chemin in sorted(chemins):
+                    self._reprendre(chemin)
+            os.remove(chemin_verrou)
+
+    def _reprendre(self, chemin: str) -> None:
+        """Reprend un fichier orphelin : ses documents seront écrits au prochain vidage."""
+        repris = os.path.join(self.config["dossier"], f"repris-{os.getpid()}-{os.path.basename(chemin)}")
+        os.replace(chemin, repris)
+        documents: dict = {collection: [] for collection in COLLECTIONS}
+        with open(repris, encoding="utf-8") as fichier:
+            for ligne in fichier:
+                try:
+                    entree = json.loads(ligne)
+                except json.JSONDecodeError:
+                    break  # Dernière ligne tronquée par l'arrêt : elle n'avait pas été acquittée
+                documents[entree["collection"]].append(_depuis_json(entree["document"]))
+        with self._lock:
+            self.segments.append((repris, documents))
+        for collection, docs in documents.items():
+            tampon_profondeur.inc(collection, montant=len(docs))
+        logger.info("Journal %s repris : %d document(s)", chemin, sum(len(docs) for docs in documents.values()))
+
+    def _chemin_journal(self) -> str:
+        return os.path.join(self.config["dossier"], f"journal-{os.getpid()}.jsonl")
+
+def _vers_json(document: dict) -> dict:
+    return {**document, "_id": str(document["_id"])}
+
+def _depuis_json(document: dict) -> dict:
+    return {**document, "_id": ObjectId(document["_id"])}
+
+tampon_ecritures: TamponEcritures = TamponEcritures(config_db)
@@ -0,0 +1,84 @@
+import os
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from markupsafe import Markup
+from cache import fragment_cache, version_document, cle_etagere, CHAMPS_FRAGMENTS
+from timing import mesurer
+
+#########################
+##### Configuration #####
+#########################
+
+config_templates: dict = {
+    "directory": "templates",
+    # Répertoire partagé par tous les workers uvicorn pour le bytecode compilé
+    "bytecode_cache": os.environ.get("CAVEAVIN_JINJA_CACHE", ".jinja_cache"),
+}
+
+def creer_environnement(directory: str, bytecode_dir: str) -> Environment:
+    """
+    Crée l'environnement Jinja2 avec un cache de bytecode persistant sur disque.
+
+    Parameters
+    ----------
+    directory : str
+        Le répertoire contenant les templates.
+    bytecode_dir : str
+        Le répertoire où le bytecode compilé des templates est stocké.
+
+    Returns
+    -------
+    Environment
+        L'environnement Jinja2 configuré.
+    """
+    os.makedirs(bytecode_dir, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(directory),
+        autoescape=True,
+        bytecode_cache=FileSystemBytecodeCache(bytecode_dir),
+        auto_reload=True,
+    )
+
+def fragment(template_name: str, type_: str, cle, document, **contexte) -> Markup:
+    """
+    Rend un fragment de template en passant par le cache de fragments.
+
+    Utilisable directement dans les templates, par exemple :
+    ``{{ fragment("fragments/bouteille_card.html", "bouteille", nom, bouteille, bouteille=bouteille) }}``
+
+    Parameters
+    ----------
+    template_name : str
+        Le nom du template du fragment.
+    type_ : str
+        Le type d'entité rendue ("bouteille", "etagere", "cave").
+    cle : Any
+        L'identifiant de l'entité.
+    document : Any
+        Le document dont la version sert de clé de cache (voir ``CHAMPS_FRAGMENTS``).
+    **contexte
+        Les variables passées au template du fragment.
+
+    Returns
+    -------
+    Markup
+        Le fragment HTML rendu.
+    """
+    version = version_document(document, CHAMPS_FRAGMENTS.get(type_))
+    rendu = lambda: templates.env.get_template(template_name).render(**contexte)
+    return Markup(fragment_cache.obtenir(type_, cle, version, rendu))
+
+class Templates(Jinja2Templates):
+    """Moteur de templates qui mesure le temps de rendu pour l'en-tête Server-Timing."""
+
+    def TemplateResponse(self, *args, **kwargs):
+        with mesurer("tpl"):
+            return super().TemplateResponse(*args, **kwargs)
+
+# Moteur de templates partagé par l'application et tous les routeurs
+templates = Templates(env=creer_environnement(
+    config_templates["directory"],
+    config_templates["bytecode_cache"]
+))
+templates.env.globals["fragment"] = fragment
+templates.env.globals["cle_etagere"] = cle_etagere
@@ -0,0 +1,140 @@
+import time
+import pytest
+from session import SessionCache, ChargementImpossible, signer
+
+SECRET = "secret-de-test"
+
+@pytest.fixture
+def base() -> dict:
+    """Collection 'user' simulée : login -> document."""
+    return {"alice": {"login": "alice", "perm": "user", "nom": "A", "prenom": "Alice", "email": "a@x.fr",
+                      "password": "haché", "session_gen": 0}}
+
+@pytest.fixture
+def cache() -> SessionCache:
+    return SessionCache(SECRET, duree=3600, taille_max=100, revalidation=30)
+
+def chargeur(base: dict):
+    return lambda login: base.get(login)
+
+def vieillir(cache: SessionCache, secondes: float) -> None:
+    """Recule la date de dernière vérification de toutes les sessions en mémoire."""
+    for identifiant, (expiration, donnees, verifiee_le) in list(cache._sessions.items()):
+        cache._sessions[identifiant] = (expiration, donnees, verifiee_le - secondes)
+
+def resigner(charge: str) -> str:
+    return f"{charge}.{signer(charge, SECRET)}"
+
+def test_ouvrir_et_verifier(cache, base):
+    jeton = cache.ouvrir(base["alice"])
+    session = cache.verifier(jeton, chargeur(base))
+    assert session == {"login": "alice", "perm": "user", "nom": "A", "prenom": "Alice", "email": "a@x.fr"}
+    assert cache.hits == 1
+
+def test_jeton_falsifie(cache, base):
+    jeton = cache.ouvrir(base["alice"])
+    charge, signature = jeton.rsplit(".", 1)
+    login, identifiant, expiration, generation = charge.split(".")
+    # Signature modifiée, charge modifiée sans nouvelle signature, autre clé, format invalide
+    assert cache.verifier(f"{charge}.{signature[:-1]}{'A' if signature[-1] != 'A' else 'B'}", chargeur(base)) is None
+    assert cache.verifier(f"{login}.{identifiant}.{int(expiration) + 3600}.{generation}.{signature}",
+                          chargeur(base)) is None
+    autre = SessionCache("autre-secret", duree=3600, taille_max=100, revalidation=30)
+    assert autre.verifier(jeton, chargeur(base)) is None
+    for invalide in ("", "a.b.c", "a.b.c.d.e.f", jeton.replace(".", "", 1)):
+        assert cache.verifier(invalide, chargeur(base)) is None
+
+def test_jeton_expire(cache, base):
+    jeton = cache.ouvrir(base["alice"])
+    _, identifiant, _, generation = jeton.rsplit(".", 1)[0].split(".")
+    login_b64 = jeton.split(".")[0]
+    expire = resigner(f"{login_b64}.{identifiant}.{int(time.time()) - 1}.{generation}")
+    assert cache.verifier(expire, chargeur(base)) is None
+
+    courte = SessionCache(SECRET, duree=-1, taille_max=100, revalidation=30)
+    assert courte.verifier(courte.ouvrir(base["alice"]), chargeur(base)) is None
+
+def test_reconstruction_depuis_la_base(cache, base):
+    jeton = cache.ouvrir(base["alice"])
+    autre_worker = SessionCache(SECRET, duree=3600, taille_max=100, revalidation=30)
+    assert autre_worker.verifier(jeton, chargeur(base))["login"] == "alice"
+    assert autre_worker.misses == 1
+    # Sans chargeur, une session absente de la mémoire n'est pas reconstruite
+    assert SessionCache(SECRET, duree=3600, taille_max=100, revalidation=30).verifier(jeton) is None
+
+def test_generation_differente(cache, base):
+    jeton = cache.ouvrir(base["alice"])
+    base["alice"]["session_gen"] = 1
+    # Refusé dès la relecture : sur un autre worker, puis ici après la revalidation
+    autre_worker = SessionCache(SECRET, duree=3600, taille_max=100, revalidation=30)
+    assert autre_worker.verifier(jeton, chargeur(base)) is None
+    assert cache.verifier(jeton, chargeur(base)) is not None
+    vieillir(cache, 31)
+    assert cache.verifier(jeton, chargeur(base)) is None
+    assert cache.stats()["sessions"] == 0
+
+def test_utilisateur_supprime(cache, base):
+    jeton = cache.ouvrir(base["alice"])
+    del base["alice"]
+    vieillir(cache, 31)
+    assert cache.verifier(jeton, chargeur(base)) is None
+
+def test_revocation(cache, base):
+    jeton, autre_jeton = cache.ouvrir(base["alice"]), cache.ouvrir(base["alice"])
+    revoques: list = []
+
+    def revocateur(login: str) -> None:
+        revoques.append(login)
+        base[login]["session_gen"] += 1
+
+    cache.revoquer(jeton, revocateur)
+    assert revoques == ["alice"]
+    assert cache.verifier(jeton, chargeur(base)) is None
+    # Toutes les sessions du compte sont fermées, sur tous les workers
+    autre_worker = SessionCache(SECRET, duree=3600, taille_max=100, revalidation=30)
+    assert autre_worker.verifier(jeton, chargeur(base)) is None
+    assert autre_worker.verifier(autre_jeton, chargeur(base)) is None
+    vieillir(cache, 31)
+    assert cache.verifier(autre_jeton, chargeur(base)) is None
+
+def test_revocation_locale(cache, base):
+    jeton = cache.ouvrir(base["alice"])
+    cache.revoquer(jeton)
+    # Même si la base accepte encore la génération, ce worker refuse le jeton
+    assert cache.verifier(jeton, chargeur(base)) is None
+    assert cache.stats()["revoquees"] == 1
+
+def test_changement_de_permissions(cache, base):
+    jeton = cache.ouvrir(base["alice"])
+    base["alice"]["perm"] = "admin"
+    assert cache.verifier(jeton, chargeur(base))["perm"] == "user"
+    vieillir(cache, 31)
+    assert cache.verifier(jeton, chargeur(base))["perm"] == "admin"
+    base["alice"]["perm"] = "user"
+    cache.invalider_utilisateur("alice")
+    assert cache.verifier(jeton, chargeur(base))["perm"] == "user"
+
+def test_base_indisponible(cache, base):
+    def panne(login: str):
+        raise ChargementImpossible("base indisponible")
+
+    jeton = cache.ouvrir(base["alice"])
+    vieillir(cache, 31)
+    # Une session connue reste servie ; une session inconnue est refusée
+    assert cache.verifier(jeton, panne)["login"] == "alice"
+    assert SessionCache(SECRET, duree=3600, taille_max=100, revalidation=30).verifier(jeton, panne) is None
+
+def test_eviction_lru(base):
+    cache = SessionCache(SECRET, duree=3600, taille_max=2, revalidation=30)
+    premier, second = cache.ouvrir(base["alice"]), cache.ouvrir(base["alice"])
+    cache.verifier(premier)  # Le premier devient le plus récemment utilisé
+    troisieme = cache.ouvrir(base["alice"])
+    assert cache.stats()["sessions"] == 2
+    assert cache.verifier(second) is None
+    assert cache.verifier(premier) is not None and cache.verifier(troisieme) is not None
+    # Une session évincée reste valide : elle est reconstruite depuis la base
+    assert cache.verifier(second, chargeur(base))["login"] == "alice"
+
+def test_champs_prives_exclus(cache, base):
+    session = cache.verifier(cache.ouvrir(base["alice"]), chargeur(base))
+    assert "password" not in session and "session_gen" not in session
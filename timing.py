@@ -0,0 +1,187 @@
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from Classes.connexiondb import operation_listeners
+
+#########################
+##### Configuration #####
+#########################
+
+config_timing: dict = {
+    "actif": True,  # Ajoute l'en-tête Server-Timing aux réponses
+    "trailer_debug": False,  # Ajoute le détail JSON en fin de page HTML
+}
+
+class Mesures:
+    """
+    Accumulateurs de temps d'une requête.
+
+    Attributes
+    ----------
+    debut : float
+        L'instant de début de la requête (``time.perf_counter``).
+    durees : dict
+        Le temps cumulé (en secondes) par catégorie : "db", "model", "tpl".
+    appels : dict
+        Le nombre d'appels mesurés par catégorie.
+    """
+
+    def __init__(self):
+        self.debut: float = time.perf_counter()
+        self.durees: dict = {"db": 0.0, "model": 0.0, "tpl": 0.0}
+        self.appels: dict = {"db": 0, "model": 0, "tpl": 0}
+        self._lock = threading.Lock()
+
+    def ajouter(self, categorie: str, duree: float) -> None:
+        """Ajoute une durée à une catégorie."""
+        with self._lock:
+            self.durees[categorie] += duree
+            self.appels[categorie] += 1
+
+    def server_timing(self) -> str:
+        """Retourne la valeur de l'en-tête HTTP Server-Timing."""
+        total = (time.perf_counter() - self.debut) * 1000
+        descriptions = {"db": "MongoDB", "model": "Modèles", "tpl": "Templates"}
+        entrees = [
+            f'{categorie};dur={duree * 1000:.2f};desc="{descriptions[categorie]} ({self.appels[categorie]})"'
+            for categorie, duree in self.durees.items()
+        ]
+        entrees.append(f"total;dur={total:.2f}")
+        return ", ".join(entrees)
+
+    def detail(self) -> dict:
+        """Retourne le détail des mesures, en millisecondes."""
+        return {
+            "total_ms": round((time.perf_counter() - self.debut) * 1000, 2),
+            **{f"{cat}_ms": round(duree * 1000, 2) for cat, duree in self.durees.items()},
+            "appels": dict(self.appels),
+        }
+
+# Mesures de la requête en cours (None en dehors d'une requête)
+mesures_courantes: ContextVar = ContextVar("mesures_courantes", default=None)
+# Profondeur d'appel des méthodes de modèle, pour ne compter que l'appel le plus externe
+_profondeur_modele: ContextVar = ContextVar("profondeur_modele", default=0)
+
+@contextmanager
+def mesurer(categorie: str):
+    """
+    Mesure la durée d'un bloc et l'ajoute aux mesures de la requête en cours.
+
+    Parameters
+    ----------
+    categorie : str
+        La catégorie de la mesure ("db", "model" ou "tpl").
+    """
+    mesures: Mesures = mesures_courantes.get()
+    if mesures is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        mesures.ajouter(categorie, time.perf_counter() - start)
+
+def chronometrer(cls):
+    """
+    Décorateur de classe qui mesure le temps passé dans les méthodes publiques d'un modèle.
+
+    Seul l'appel le plus externe est compté (``get_cave`` qui appelle
+    ``get_etageres`` n'est compté qu'une fois) et le temps passé dans MongoDB
+    pendant l'appel en est déduit, pour que "model" ne mesure que le code Python.
+
+    Parameters
+    ----------
+    cls : type
+        La classe de modèle à instrumenter.
+
+    Returns
+    -------
+    type
+        La même classe, avec ses méthodes publiques instrumentées.
+    """
+    for nom, methode in list(vars(cls).items()):
+        if nom.startswith("_") or not callable(methode) or isinstance(methode, (staticmethod, classmethod, type)):
+            continue
+        setattr(cls, nom, _chronometrer_methode(methode))
+    return cls
+
+def _chronometrer_methode(methode):
+    @functools.wraps(methode)
+    def wrapper(*args, **kwargs):
+        mesures: Mesures = mesures_courantes.get()
+        if mesures is None or _profondeur_modele.get() > 0:
+            return methode(*args, **kwargs)
+
+        jeton = _profondeur_modele.set(1)
+        db_avant = mesures.durees["db"]
+        start = time.perf_counter()
+        try:
+            return methode(*args, **kwargs)
+        finally:
+            duree = time.perf_counter() - start
+            _profondeur_modele.reset(jeton)
+            mesures.ajouter("model", max(duree - (mesures.durees["db"] - db_avant), 0.0))
+    return wrapper
+
+def _observer_operation(collection: str, operation: str, query, duree: float, erreur, details: dict = None) -> None:
+    """Ajoute la durée de chaque opération Connexdb aux mesures de la requête en cours."""
+    mesures: Mesures = mesures_courantes.get()
+    if mesures is not None:
+        mesures.ajouter("db", duree)
+
+operation_listeners.append(_observer_operation)
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI qui ajoute l'en-tête ``Server-Timing`` aux réponses.
+
+    Les outils de développement des navigateurs affichent ainsi, pour chaque
+    requête, la part de MongoDB, du code des modèles et du rendu des templates.
+    Si ``trailer_debug`` est activé, le détail JSON est aussi ajouté en
+    commentaire à la fin des pages HTML.
+    """
+
+    def __init__(self, app, **options):
+        self.app = app
+        self.config: dict = {**config_timing, **options}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.config["actif"]:
+            await self.app(scope, receive, send)
+            return
+
+        mesures = Mesures()
+        jeton = mesures_courantes.set(mesures)
+        trailer: dict = {"contenu": b""}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", mesures.server_timing().encode("latin-1")))
+                if self.config["trailer_debug"] and _est_html(headers):
+                    trailer["contenu"] = f"\n<!-- server-timing {json.dumps(mesures.detail())} -->\n".encode()
+                    headers = _ajuster_content_length(headers, len(trailer["contenu"]))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body" and trailer["contenu"] and not message.get("more_body", False):
+                message = {**message, "body": message.get("body", b"") + trailer["contenu"]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            mesures_courantes.reset(jeton)
+
+def _est_html(headers: list) -> bool:
+    """Indique si les en-têtes décrivent une réponse HTML."""
+    return any(cle.lower() == b"content-type" and valeur.startswith(b"text/html") for cle, valeur in headers)
+
+def _ajuster_content_length(headers: list, supplement: int) -> list:
+    """Augmente l'en-tête Content-Length de la taille du trailer."""
+    return [
+        (cle, str(int(valeur) + supplement).encode("latin-1")) if cle.lower() == b"content-length" else (cle, valeur)
+        for cle, valeur in headers
+    ]
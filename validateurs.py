@@ -0,0 +1,125 @@
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+from Classes.connexiondb import Connexdb
+from cache import version_document, CHAMPS_UTILISATEUR
+
+#########################
+##### Configuration #####
+#########################
+
+config_validateurs: dict = {
+    "actif": True,
+    "cache_control": "private, no-cache",  # Gardée par le navigateur, mais revalidée à chaque visite
+}
+
+# Change à chaque démarrage : une page rendue par une version précédente des templates n'est pas resservie
+DEMARRAGE: str = format(time.time_ns(), "x")
+
+def lire_versions(config_db: dict, collection: str, query: dict, champs: tuple = ()) -> list:
+    """
+    Lit les versions (``_rev``, ``maj_le``) des documents d'une collection.
+
+    Parameters
+    ----------
+    config_db : dict
+        La configuration de connexion à la base de données.
+    collection : str
+        La collection à lire.
+    query : dict
+        Le filtre des documents.
+    champs : tuple, optional
+        D'autres petits champs à lire avec les versions.
+
+    Returns
+    -------
+    list
+        Les documents réduits à leurs versions, ou None si la lecture a échoué.
+    """
+    rstatus: dict = Connexdb(**config_db).get_versions_from_collection(collection, query, champs)
+    if rstatus.get("status") != 200:
+        return None
+    return rstatus["data"]
+
+def calculer_validateurs(user_cookies: dict, *versions: list, date: bool = False) -> dict:
+    """
+    Calcule les validateurs HTTP d'une page construite à partir de documents versionnés.
+
+    Parameters
+    ----------
+    user_cookies : dict
+        L'utilisateur à qui la page est rendue.
+    *versions : list
+        Les documents (réduits à leurs versions) dont la page est construite.
+    date : bool, optional
+        Calculer aussi ``Last-Modified``. Uniquement si toute modification de
+        la page avance la version d'un de ces documents : une suppression, qui
+        retire un document de la liste, ne change pas la date la plus récente.
+
+    Returns
+    -------
+    dict
+        ``etag`` (faible) et ``derniere_modification`` (datetime UTC, ou None).
+    """
+    parties: list = [DEMARRAGE, [user_cookies.get(champ) for champ in CHAMPS_UTILISATEUR]]
+    parties += [sorted((str(doc["_id"]), doc.get("_rev", 0)) for doc in documents) for documents in versions]
+    derniere: datetime = None
+    if date:
+        dates: list = [doc.get("maj_le") for documents in versions for doc in documents]
+        if dates and all(dates):
+            derniere = max(_utc(valeur) for valeur in dates).replace(microsecond=0)
+    return {"etag": f'W/"{version_document(parties)}"', "derniere_modification": derniere}
+
+def non_modifie(request: Request, validateurs: dict) -> Response:
+    """
+    Répond 304 si la version de la page détenue par le client est à jour.
+
+    ``If-None-Match`` est prioritaire ; ``If-Modified-Since`` n'est consulté
+    qu'en son absence, comme le prévoit la RFC 9110.
+
+    Returns
+    -------
+    Response
+        La réponse 304, ou None si la page doit être construite.
+    """
+    if not config_validateurs["actif"] or validateurs is None:
+        return None
+
+    if_none_match: str = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etiquettes: set = {etiquette.strip().removeprefix("W/") for etiquette in if_none_match.split(",")}
+        a_jour: bool = "*" in etiquettes or validateurs["etag"].removeprefix("W/") in etiquettes
+    elif request.headers.get("if-modified-since") and validateurs["derniere_modification"] is not None:
+        try:
+            a_jour = validateurs["derniere_modification"] <= _utc(parsedate_to_datetime(request.headers["if-modified-since"]))
+        except (TypeError, ValueError):
+            a_jour = False
+    else:
+        a_jour = False
+
+    return appliquer_validateurs(Response(status_code=304), validateurs) if a_jour else None
+
+def validateurs_reponse(response: Response) -> dict:
+    """Retrouve les validateurs d'une réponse déjà construite (réponse en cache), ou None si elle n'en a pas."""
+    if "etag" not in response.headers:
+        return None
+    derniere: datetime = None
+    if "last-modified" in response.headers:
+        derniere = _utc(parsedate_to_datetime(response.headers["last-modified"]))
+    return {"etag": response.headers["etag"], "derniere_modification": derniere}
+
+def appliquer_validateurs(response: Response, validateurs: dict) -> Response:
+    """Ajoute à une réponse ses validateurs et les en-têtes de cache qui obligent à la revalider."""
+    if not config_validateurs["actif"] or validateurs is None:
+        return response
+    response.headers["ETag"] = validateurs["etag"]
+    if validateurs["derniere_modification"] is not None:
+        response.headers["Last-Modified"] = format_datetime(validateurs["derniere_modification"], usegmt=True)
+    response.headers["Cache-Control"] = config_validateurs["cache_control"]
+    response.headers["Vary"] = "Cookie"
+    return response
+
+def _utc(valeur: datetime) -> datetime:
+    # pymongo retourne des dates naïves, en UTC
+    return valeur.replace(tzinfo=timezone.utc) if valeur.tzinfo is None else valeur.astimezone(timezone.utc)